@@ -0,0 +1,115 @@
+"""
+    Throughput and latency benchmarks for the SolusVM client against mockserver.
+
+        python benchmark.py --requests 2000 --workers 32 --latency 0.005
+
+    Each scenario issues virtualServerStatus calls for distinct virtual servers
+    (so coalescing does not hide requests) and reports requests per second with
+    p50/p99 latency. Results are only comparable between runs on the same host.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import time
+
+import requests
+
+import solusvm
+from mockserver import MockSolusVM
+
+def _sPercentile(samples, fraction):
+    """Nearest-rank percentile of a list of samples."""
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))] if samples else 0.0
+
+def _sReport(name, count, elapsed, samples):
+    """Prints one scenario's results."""
+    print('%-12s %8d req %9.1f req/s   p50 %7.2f ms   p99 %7.2f ms' % (
+        name, count, count / elapsed if elapsed else 0.0, _sPercentile(samples, 0.5) * 1000, _sPercentile(samples, 0.99) * 1000
+    ))
+
+def _sTimed(call, *args):
+    """Runs call, returning its latency."""
+    started = time.perf_counter()
+    call(*args)
+    return time.perf_counter() - started
+
+def benchUnpooled(client, vserverids):
+    """Sequential calls opening a new connection each time, as before pooling."""
+    def call(vserverid):
+        url, query = client._sRequest({'action': 'vserver-status', 'vserverid': vserverid})
+        return requests.get(url+'?'+query, timeout=(client.connect_timeout, client.read_timeout)).json()
+
+    started = time.perf_counter()
+    samples = [_sTimed(call, vserverid) for vserverid in vserverids]
+    return time.perf_counter() - started, samples
+
+def benchPooled(client, vserverids):
+    """Sequential calls over the client's keep-alive pool."""
+    started = time.perf_counter()
+    samples = [_sTimed(client.virtualServerStatus, vserverid) for vserverid in vserverids]
+    return time.perf_counter() - started, samples
+
+def benchConcurrent(client, vserverids, workers):
+    """Concurrent calls from a thread pool sharing the client's pool."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        started = time.perf_counter()
+        samples = list(executor.map(lambda vserverid: _sTimed(client.virtualServerStatus, vserverid), vserverids))
+        return time.perf_counter() - started, samples
+
+def benchAsync(mock, vserverids, workers):
+    """Concurrent calls through AsyncSolusVM."""
+    async def run():
+        samples = []
+        async with solusvm.AsyncSolusVM(mock.host, mock.api_id, mock.api_key, max_concurrency=workers, pool_maxsize=workers, scheme='http', port=mock.port) as client:
+            async def call(vserverid):
+                started = time.perf_counter()
+                await client.virtualServerStatus(vserverid)
+                samples.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*[call(vserverid) for vserverid in vserverids])
+            return time.perf_counter() - started, samples
+
+    return asyncio.run(run())
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SolusVM client against a local mock master.')
+    parser.add_argument('--requests', type=int, default=1000, help='calls per scenario')
+    parser.add_argument('--workers', type=int, default=32, help='concurrency of the concurrent scenarios')
+    parser.add_argument('--nodes', type=int, default=20)
+    parser.add_argument('--vservers', type=int, default=100, help='virtual servers per node')
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds the mock adds to each response')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--scenarios', default='unpooled,pooled,concurrent,async,fleet')
+    args = parser.parse_args()
+
+    with MockSolusVM(args.nodes, args.vservers, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate) as mock:
+        vserverids = sorted(mock.vservers, key=int)
+        vserverids = [vserverids[i % len(vserverids)] for i in range(args.requests)]
+        scenarios = args.scenarios.split(',')
+
+        with solusvm.SolusVM(mock.host, mock.api_id, mock.api_key, pool_maxsize=args.workers, coalesce=False, scheme='http', port=mock.port,
+                             breaker=solusvm.CircuitBreaker(min_calls=args.requests + 1)) as client:
+            if 'unpooled' in scenarios:
+                _sReport('unpooled', len(vserverids), *benchUnpooled(client, vserverids))
+            if 'pooled' in scenarios:
+                _sReport('pooled', len(vserverids), *benchPooled(client, vserverids))
+            if 'concurrent' in scenarios:
+                _sReport('concurrent', len(vserverids), *benchConcurrent(client, vserverids, args.workers))
+            if 'async' in scenarios:
+                if solusvm.aiohttp is None:
+                    print('%-12s skipped, aiohttp not installed' % 'async')
+                else:
+                    _sReport('async', len(vserverids), *benchAsync(mock, vserverids, args.workers))
+            if 'fleet' in scenarios:
+                started = time.perf_counter()
+                fleet = client.listAllVirtualServers(max_workers=args.workers)
+                elapsed = time.perf_counter() - started
+                print('%-12s %8d nodes %7d vservers in %7.2f ms, %d node errors' % (
+                    'fleet', args.nodes, len(fleet['virtualservers']), elapsed * 1000, len(fleet['errors'])
+                ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+"""
+    Local stand-in for a SolusVM master's admin API, for tests and benchmarks.
+
+        python mockserver.py --port 5656 --nodes 10 --vservers 50 --latency 0.01
+
+    Serves /api/admin/command.php over plain HTTP; point a client at it with
+    SolusVM('127.0.0.1', 'ID', 'KEY', scheme='http', port=5656).
+"""
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        mock = self.server.mock
+
+        if url.path != '/api/admin/command.php':
+            return self._sReply(404, b'not found')
+
+        mock.delay()
+        if mock.injectError():
+            return self._sReply(500, b'internal server error')
+
+        body = json.dumps(mock.handle(dict(parse_qsl(url.query, keep_blank_values=True)))).encode('utf-8')
+        self._sReply(200, body)
+
+    def _sReply(self, code, body):
+        """Sends a complete response, keeping the connection alive."""
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        if self.server.mock.compress and len(body) > 1024 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, 1)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+class MockSolusVM:
+    def __init__(self, nodes=10, vservers=50, clients=100, latency=0.0, jitter=0.0, error_rate=0.0,
+                 api_id='ID', api_key='KEY', host='127.0.0.1', port=0, seed=0, compress=False):
+        """Mock SolusVM master holding a generated fleet in memory.
+
+        Parameters
+            nodes: number of nodes
+            vservers: number of virtual servers per node
+            clients: number of clients
+            latency: seconds added to every response
+            jitter: maximum random seconds added on top of latency
+            error_rate: fraction of requests answered with HTTP 500
+            api_id: API id accepted
+            api_key: API key accepted
+            host: interface to listen on
+            port: port to listen on, or 0 for any free port
+            seed: random seed for the generated fleet
+            compress: whether to gzip responses over 1KB for clients accepting it
+        Returns
+            None
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.api_id = api_id
+        self.api_key = api_key
+        self.host = host
+        self.port = port
+        self.compress = compress
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.server = None
+
+        self.plans = ['small', 'medium', 'large']
+        self.templates = ['centos-7-x86_64', 'debian-8-x86_64', 'ubuntu-16.04-x86_64']
+        self.nodegroups = {'1': 'Default', '2': 'Premium'}
+        self.clients = dict((str(i), {
+            'id': str(i),
+            'username': 'client%d' % i,
+            'email': 'client%d@example.com' % i,
+            'firstname': 'Client',
+            'lastname': str(i),
+            'company': '',
+            'level': 'Client',
+            'status': 'Active',
+            'created': '2016-01-01 00:00:00'
+        }) for i in range(1, clients + 1))
+        self.nodes = dict((str(i), {
+            'id': str(i),
+            'name': 'node%d' % i,
+            'ip': '198.51.100.%d' % i,
+            'hostname': 'node%d.example.com' % i,
+            'nodegroup': str(i % 2 + 1),
+            'totalmemory': str(262144),
+            'totaldisk': str(8192),
+            'freeips': str(self.random.randint(0, 64))
+        }) for i in range(1, nodes + 1))
+
+        self.vservers = {}
+        self.nextid = 100
+        for nodeid in self.nodes:
+            for i in range(vservers):
+                self._sCreate(nodeid, self.random.choice(list(self.clients) or ['0']), self.random.choice(self.plans), self.random.choice(self.templates))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Starts serving in a background thread.
+
+        Parameters
+            None
+        Returns
+            None
+        """
+        self.server = _Server((self.host, self.port), _Handler)
+        self.server.mock = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        """Stops serving.
+
+        Parameters
+            None
+        Returns
+            None
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def delay(self):
+        """Sleeps for the configured latency and jitter."""
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+    def injectError(self):
+        """Decides whether the current request fails, counting it."""
+        with self.lock:
+            self.requests += 1
+            return self.error_rate and self.random.random() < self.error_rate
+
+    def _sCreate(self, nodeid, clientid, plan, template, hostname=None):
+        """Adds a virtual server to the fleet."""
+        vserverid = str(self.nextid)
+        self.nextid += 1
+        memory = {'small': 1024, 'medium': 2048, 'large': 4096}.get(plan, 1024)
+        self.vservers[vserverid] = {
+            'vserverid': vserverid,
+            'ctid-xid': 'kvm%s' % vserverid,
+            'clientid': clientid,
+            'ipaddress': '10.%d.%d.%d' % (int(nodeid) % 256, int(vserverid) // 256 % 256, int(vserverid) % 256),
+            'hostname': hostname or 'vps%s.example.com' % vserverid,
+            'template': template,
+            'hdd': str(memory // 32),
+            'memory': str(memory),
+            'swap-burst': '0',
+            'bandwidth': str(self.random.randint(0, 1000)),
+            'type': 'kvm',
+            'mac': '52:54:00:%02x:%02x:%02x' % (int(vserverid) >> 16 & 255, int(vserverid) >> 8 & 255, int(vserverid) & 255),
+            'node': nodeid,
+            'plan': plan,
+            'state': 'online',
+            'suspended': '0'
+        }
+        return vserverid
+
+    def _sNodeStatistics(self, nodeid):
+        """Computes node-statistics from the virtual servers on a node."""
+        node = self.nodes[nodeid]
+        guests = [vserver for vserver in self.vservers.values() if vserver['node'] == nodeid]
+        usedmemory = sum(int(vserver['memory']) for vserver in guests)
+        useddisk = sum(int(vserver['hdd']) for vserver in guests)
+        return dict(node, **{
+            'status': 'success',
+            'freememory': str(max(0, int(node['totalmemory']) - usedmemory)),
+            'freedisk': str(max(0, int(node['totaldisk']) - useddisk)),
+            'virtualservers': str(len(guests))
+        })
+
+    def handle(self, params):
+        """Answers one API query.
+
+        Parameters
+            params: dictionary GET vars
+        Returns
+            json
+        """
+        if params.get('id') != self.api_id or params.get('key') != self.api_key:
+            return {'status': 'error', 'statusmsg': 'Invalid id or key'}
+
+        handler = getattr(self, 'action_'+params.get('action', '').replace('-', '_'), None)
+        if handler is None:
+            return {'status': 'error', 'statusmsg': 'Invalid action'}
+
+        with self.lock:
+            return handler(params)
+
+    def _sVServer(self, params):
+        """Looks up the virtual server named by vserverid, or None."""
+        return self.vservers.get(params.get('vserverid', ''))
+
+    def _sSetVServer(self, params, **fields):
+        """Updates fields of the virtual server named by vserverid."""
+        vserver = self._sVServer(params)
+        if vserver is None:
+            return {'status': 'error', 'statusmsg': 'Virtual server not found'}
+        vserver.update(fields)
+        return {'status': 'success', 'statusmsg': ''}
+
+    def action_node_idlist(self, params):
+        return {'status': 'success', 'nodes': ','.join(self.nodes)}
+
+    def action_listnodes(self, params):
+        return {'status': 'success', 'nodes': ','.join(node['name'] for node in self.nodes.values())}
+
+    def action_listnodegroups(self, params):
+        return {'status': 'success', 'nodegroups': ','.join(groupid+'|'+name for groupid, name in self.nodegroups.items())}
+
+    def action_listplans(self, params):
+        return {'status': 'success', 'plans': ','.join(self.plans)}
+
+    def action_listtemplates(self, params):
+        return {'status': 'success', 'templateskvm': ','.join(self.templates)}
+
+    def action_listiso(self, params):
+        return {'status': 'success', 'iso': 'rescue.iso'}
+
+    def action_node_virtualservers(self, params):
+        if params.get('nodeid') not in self.nodes:
+            return {'status': 'error', 'statusmsg': 'Node not found'}
+        return {'status': 'success', 'virtualservers': [vserver for vserver in self.vservers.values() if vserver['node'] == params['nodeid']]}
+
+    def action_node_iplist(self, params):
+        if params.get('nodeid') not in self.nodes:
+            return {'status': 'error', 'statusmsg': 'Node not found'}
+        return {'status': 'success', 'ips': [
+            {'ipaddress': vserver['ipaddress'], 'vserverid': vserver['vserverid']}
+            for vserver in self.vservers.values() if vserver['node'] == params['nodeid']
+        ]}
+
+    def action_node_statistics(self, params):
+        if params.get('nodeid') not in self.nodes:
+            return {'status': 'error', 'statusmsg': 'Node not found'}
+        return self._sNodeStatistics(params['nodeid'])
+
+    def action_node_xenresources(self, params):
+        if params.get('nodeid') not in self.nodes:
+            return {'status': 'error', 'statusmsg': 'Node not found'}
+        statistics = self._sNodeStatistics(params['nodeid'])
+        return {'status': 'success', 'freememory': statistics['freememory'], 'freehdd': statistics['freedisk']}
+
+    def action_vserver_info(self, params):
+        vserver = self._sVServer(params)
+        if vserver is None:
+            return {'status': 'error', 'statusmsg': 'Virtual server not found'}
+        return dict(vserver, status='success', statusmsg='')
+
+    def action_vserver_infoall(self, params):
+        vserver = self._sVServer(params)
+        if vserver is None:
+            return {'status': 'error', 'statusmsg': 'Virtual server not found'}
+        memory = int(vserver['memory']) * 1048576
+        state = {
+            'status': 'success',
+            'statusmsg': '',
+            'mainipaddress': vserver['ipaddress'],
+            'ipaddresses': vserver['ipaddress'],
+            'plan': vserver['plan'],
+            'suspended': vserver['suspended'],
+            'hdd': '%d,%d,%d,%d' % (int(vserver['hdd']) * 1073741824, 0, int(vserver['hdd']) * 1073741824, 0),
+            'memory': '%d,%d,%d,%d' % (memory, memory // 4, memory - memory // 4, 25),
+            'bandwidth': '%d,%d,%d,%d' % (1099511627776, int(vserver['bandwidth']) * 1073741824, 1099511627776 - int(vserver['bandwidth']) * 1073741824, int(vserver['bandwidth']) // 10)
+        }
+        if params.get('nostatus') != 'True':
+            state['state'] = vserver['state']
+        if params.get('nographs') != 'True':
+            for graph in ('trafficgraph', 'loadgraph', 'memorygraph'):
+                state[graph] = '/graphs/%s/%s.png' % (vserver['vserverid'], graph)
+        return state
+
+    def action_vserver_status(self, params):
+        vserver = self._sVServer(params)
+        if vserver is None:
+            return {'status': 'error', 'statusmsg': 'Virtual server not found'}
+        return {'status': 'success', 'statusmsg': 'disabled' if vserver['suspended'] == '1' else vserver['state']}
+
+    def action_vserver_checkexists(self, params):
+        if self._sVServer(params) is None:
+            return {'status': 'error', 'statusmsg': 'Virtual server not found'}
+        return {'status': 'success', 'statusmsg': 'Virtual server exists'}
+
+    def action_vserver_vnc(self, params):
+        if self._sVServer(params) is None:
+            return {'status': 'error', 'statusmsg': 'Virtual server not found'}
+        return {'status': 'success', 'type': 'vnc', 'vncip': '198.51.100.1', 'vncport': '5901', 'vncpassword': 'secret'}
+
+    def action_vserver_boot(self, params):
+        return self._sSetVServer(params, state='online')
+
+    def action_vserver_reboot(self, params):
+        return self._sSetVServer(params, state='online')
+
+    def action_vserver_shutdown(self, params):
+        return self._sSetVServer(params, state='offline')
+
+    def action_vserver_suspend(self, params):
+        return self._sSetVServer(params, suspended='1')
+
+    def action_vserver_unsuspend(self, params):
+        return self._sSetVServer(params, suspended='0')
+
+    def action_vserver_rebuild(self, params):
+        return self._sSetVServer(params, template=params.get('template', ''), state='online')
+
+    def action_vserver_change(self, params):
+        return self._sSetVServer(params, plan=params.get('plan', ''))
+
+    def action_vserver_hostname(self, params):
+        return self._sSetVServer(params, hostname=params.get('hostname', ''))
+
+    def action_vserver_bandwidth(self, params):
+        return self._sSetVServer(params)
+
+    def action_vserver_create(self, params):
+        nodeid = params.get('nodeid') or next(iter(self.nodes), None)
+        if nodeid not in self.nodes:
+            return {'status': 'error', 'statusmsg': 'Node not found'}
+        vserverid = self._sCreate(nodeid, params.get('clientid', '0'), params.get('plan', self.plans[0]), params.get('template', self.templates[0]), params.get('hostname'))
+        vserver = self.vservers[vserverid]
+        return {'status': 'success', 'statusmsg': 'Virtual server created', 'vserverid': vserverid, 'mainipaddress': vserver['ipaddress'], 'virtid': vserver['ctid-xid']}
+
+    def action_vserver_terminate(self, params):
+        if self.vservers.pop(params.get('vserverid', ''), None) is None:
+            return {'status': 'error', 'statusmsg': 'Virtual server not found'}
+        return {'status': 'success', 'statusmsg': 'Virtual server terminated'}
+
+    def action_client_list(self, params):
+        return {'status': 'success', 'clients': list(self.clients.values())}
+
+    def action_client_checkexists(self, params):
+        exists = any(client['username'] == params.get('username') for client in self.clients.values())
+        return {'status': 'success' if exists else 'error', 'statusmsg': 'Client exists' if exists else 'Client not found'}
+
+    def action_client_authenticate(self, params):
+        exists = any(client['username'] == params.get('username') for client in self.clients.values())
+        return {'status': 'success' if exists else 'error', 'statusmsg': 'validated' if exists else 'invalid'}
+
+    def action_client_create(self, params):
+        clientid = str(max([int(clientid) for clientid in self.clients] or [0]) + 1)
+        self.clients[clientid] = dict((field, params.get(field, '')) for field in ('username', 'email', 'firstname', 'lastname', 'company'))
+        self.clients[clientid].update({'id': clientid, 'level': 'Client', 'status': 'Active', 'created': time.strftime('%Y-%m-%d %H:%M:%S')})
+        return {'status': 'success', 'statusmsg': 'Client created', 'clientid': clientid}
+
+    def action_reseller_list(self, params):
+        return {'status': 'success', 'usernames': 'reseller1'}
+
+    def action_reseller_info(self, params):
+        return {'status': 'success', 'username': params.get('username', ''), 'maxvps': '100', 'maxmem': '102400', 'maxdisk': '2048'}
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a mock SolusVM admin API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5656)
+    parser.add_argument('--nodes', type=int, default=10)
+    parser.add_argument('--vservers', type=int, default=50, help='virtual servers per node')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--compress', action='store_true', help='gzip responses over 1KB')
+    args = parser.parse_args()
+
+    mock = MockSolusVM(args.nodes, args.vservers, args.clients, args.latency, args.jitter, args.error_rate, host=args.host, port=args.port, compress=args.compress)
+    mock.start()
+    print('serving on http://%s:%d/api/admin/command.php' % (mock.host, mock.port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+if __name__ == '__main__':
+    main()
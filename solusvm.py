@@ -9,932 +9,5669 @@
     @created    7/24/13
     @updated    5/21/16
 """
+import array
+import asyncio
+import bisect
+import codecs
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import hashlib
+import heapq
+import http.client
+import inspect
+import itertools
+import json
+import mmap
+import os
+import random
+import re
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
 import requests
 
-class SolusVM:
-    def __init__(self, base_url, api_id, api_key):
-        """SolusVM JSON API Library constructor.
+try:
+    import aiohttp
+    import yarl
+except ImportError:
+    aiohttp = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# Content codings offered to the master; br only when a brotli decoder is installed.
+ACCEPT_ENCODING = 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+
+# Size of chunks read from streamed responses.
+STREAM_CHUNK_SIZE = 65536
+
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        """Token bucket rate limiter, safe to share between threads.
 
         Parameters
-            base_url: SolusVM base_url
-            api_id: SolusVM API authentiction ID hash
-            api_key: SolusVM API authentication key hash
+            rate: tokens added per second
+            burst: maximum number of tokens held at once
         Returns
             None
         """
-        self.base_url = base_url
-        self.id = api_id
-        self.key = api_key
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
 
-    def _sQuery(self, kwargs):
-        """Queries specified SolusVM API with specified query string.
+    def _sRefill(self):
+        """Adds tokens accrued since the last update. Caller must hold lock.
 
         Parameters
-            kwargs: dictionary GET vars
+            None
         Returns
-            json
+            None
         """
-        kwargs.update({
-                'rdtype':'json',
-                'id':self.id,
-                'key':self.key
-        })
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
 
-        response = requests.get('https://'+self.base_url+':5656/api/admin/command.php', params=kwargs, timeout=2)
-        return response.json()
+    def delay(self, tokens=1):
+        """Seconds until the requested tokens are available, without taking them.
 
-    def listVirtualServers(self, nodeid):
-        """Lists virtual servers allocated on specified node.
+        Parameters
+            tokens: number of tokens wanted
+        Returns
+            seconds
+        """
+        with self.lock:
+            self._sRefill()
+            return max(0.0, (tokens - self.tokens) / self.rate)
 
-            https://documentation.solusvm.com/display/DOCS/List+Virtual+Servers
+    def reserve(self, tokens=1):
+        """Takes tokens from the bucket, going into debt if it is empty.
 
         Parameters
-            nodeid: id of node
+            tokens: number of tokens to take
         Returns
-            json
+            seconds to wait before the tokens may be used
         """
-        return self._sQuery({
-            'action': 'node-virtualservers',
-            'nodeid': nodeid
-        })
+        with self.lock:
+            self._sRefill()
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
 
-    def diablePXE(self, vserverid):
-        """Disables PXE on specified virtual server.
+    def acquire(self, tokens=1):
+        """Blocks until the requested tokens are available.
 
-            https://documentation.solusvm.com/display/DOCS/Disable+PXE
+        Parameters
+            tokens: number of tokens to take
+        Returns
+            None
+        """
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+# Default scheduling priority of actions; anything else is PRIORITY_NORMAL.
+ACTION_PRIORITIES = {
+    'client-authenticate': PRIORITY_INTERACTIVE,
+    'vserver-boot': PRIORITY_INTERACTIVE,
+    'vserver-console': PRIORITY_INTERACTIVE,
+    'vserver-reboot': PRIORITY_INTERACTIVE,
+    'vserver-shutdown': PRIORITY_INTERACTIVE,
+    'vserver-status': PRIORITY_INTERACTIVE,
+    'vserver-vnc': PRIORITY_INTERACTIVE,
+    'client-list': PRIORITY_BACKGROUND,
+    'node-iplist': PRIORITY_BACKGROUND,
+    'node-statistics': PRIORITY_BACKGROUND,
+    'node-virtualservers': PRIORITY_BACKGROUND,
+    'node-xenresources': PRIORITY_BACKGROUND,
+    'reseller-list': PRIORITY_BACKGROUND
+}
+
+class RequestScheduler:
+    def __init__(self, rate, burst=1, action_limits=None, priorities=None):
+        """Paces requests with token buckets, dispatching higher priority actions first.
+
+            Per-action limits are waited on first, then requests queue for the global
+            bucket in (priority, arrival) order. Safe to share between clients and threads.
 
         Parameters
-            vserverid: id of virtual server
+            rate: global requests per second
+            burst: global burst size
+            action_limits: dictionary of action to (rate, burst) tuples
+            priorities: dictionary of action to PRIORITY_* value, overriding ACTION_PRIORITIES
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-network-disable',
-            'vserverid': vserverid
-        })
+        self.bucket = TokenBucket(rate, burst)
+        self.action_buckets = dict((action, TokenBucket(*limit)) for action, limit in (action_limits or {}).items())
+        self.priorities = dict(ACTION_PRIORITIES, **(priorities or {}))
 
-    def enablePXE(self, vserverid):
-        """Enables PXE on specified virtual server.
+        self.queue = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
 
-            https://documentation.solusvm.com/display/DOCS/Enable+PXE
+        self.queued = collections.Counter()
+        self.dispatched = collections.Counter()
+        self.waited = collections.Counter()
+
+    def acquire(self, action):
+        """Blocks until the specified action may be sent.
 
         Parameters
-            vserverid: id of virtual server
+            action: SolusVM API action
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-network-enable',
-            'vserverid': vserverid
-        })
-
-    def enableTUN(self, vserverid):
-        """Enables TUN/TAP on specified virtual server.
-
-            https://documentation.solusvm.com/pages/viewpage.action?pageId=558498
+        started = time.monotonic()
+        priority = self.priorities.get(action, PRIORITY_NORMAL)
+
+        if action in self.action_buckets:
+            self.action_buckets[action].acquire()
+
+        ticket = (priority, next(self.sequence))
+        with self.condition:
+            heapq.heappush(self.queue, ticket)
+            self.queued[priority] += 1
+            self.condition.notify_all()
+
+            while True:
+                if self.queue[0] != ticket:
+                    self.condition.wait()
+                    continue
+                wait = self.bucket.delay()
+                if wait <= 0:
+                    break
+                self.condition.wait(wait)
+
+            self.bucket.reserve()
+            heapq.heappop(self.queue)
+            self.queued[priority] -= 1
+            self.dispatched[priority] += 1
+            self.waited[priority] += time.monotonic() - started
+            self.condition.notify_all()
+
+    def stats(self):
+        """Reports queue depth and dispatch counts per priority.
 
         Parameters
-            vserverid: id of virtual server
+            None
         Returns
-            json
+            dictionary of queued, dispatched and waited seconds, each keyed by priority
         """
-        return self._sQuery({
-            'action': 'vserver-tun-enable',
-            'vserverid': vserverid
-        })
+        with self.condition:
+            return {
+                'queued': dict(self.queued),
+                'dispatched': dict(self.dispatched),
+                'waited': dict(self.waited)
+            }
 
-    def disableTUN(self, vserverid):
-        """Disables TUN/TAP on specified virtual server.
+class SolusVMError(Exception):
+    pass
 
-            https://documentation.solusvm.com/pages/viewpage.action?pageId=558494
+class CircuitOpenError(SolusVMError):
+    pass
+
+class ProvisioningError(SolusVMError):
+    pass
+
+class CircuitBreaker:
+    def __init__(self, threshold=0.5, window=20, min_calls=10, reset_timeout=30):
+        """Error-rate circuit breaker, safe to share between threads.
+
+            Opens once at least min_calls of the last window calls were made and the
+            failure ratio reaches threshold. After reset_timeout one trial call is let
+            through; its outcome closes or re-opens the circuit. A trial whose outcome is
+            never recorded is abandoned after another reset_timeout.
 
         Parameters
-            vserverid: id of virtual server
+            threshold: failure ratio at which the circuit opens
+            window: number of recent calls considered
+            min_calls: minimum number of recent calls before the circuit may open
+            reset_timeout: seconds to fail fast before allowing a trial call
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-tun-disable',
-            'vserverid': vserverid
-        })
-
-    def togglePAE(self, vserverid, pae):
-        """Toggles PAE for specified virtual server.
+        self.threshold = threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.outcomes = collections.deque(maxlen=window)
+        self.opened = None
+        self.trial = None
+        self.lock = threading.Lock()
 
-            https://documentation.solusvm.com/pages/viewpage.action?pageId=558505
+    def allow(self):
+        """Checks whether a call may be made.
 
         Parameters
-            vserverid: id of virtual server
-            pae: on|off
+            None
         Returns
-            json
+            bool
         """
-        return self._sQuery({
-            'action': 'vserver-pae',
-            'vserverid': vserverid,
-            'pae':pae
-        })
-
-    def shutdownVirtualServer(self, vserverid):
-        """Shuts down specified virtual server.
+        with self.lock:
+            if self.opened is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened < self.reset_timeout:
+                return False
+            if self.trial is not None and now - self.trial < self.reset_timeout:
+                return False
+            self.trial = now
+            return True
+
+    def record(self, success):
+        """Records the outcome of a call.
 
-            https://documentation.solusvm.com/display/DOCS/Shutdown+Virtual+Server
+        Parameters
+            success: whether the call succeeded
+        Returns
+            None
+        """
+        with self.lock:
+            if self.opened is not None and self.trial is not None:
+                self.trial = None
+                if success:
+                    self.opened = None
+                    self.outcomes.clear()
+                else:
+                    self.opened = time.monotonic()
+                return
+
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_calls and failures >= self.threshold * len(self.outcomes):
+                self.opened = time.monotonic()
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def getCircuitBreaker(host):
+    """Retrieves the circuit breaker shared by every client of the specified master.
+
+    Parameters
+        host: SolusVM base_url
+    Returns
+        CircuitBreaker
+    """
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker()
+        return _breakers[host]
+
+class JSONArrayStream:
+    _skip = re.compile(r'[\s,]*')
+    _space = re.compile(r'\s*')
+
+    def __init__(self, key):
+        """Incremental decoder yielding the elements of one top-level array of a JSON response.
+
+            Only the unparsed tail of the array is buffered, so memory stays bounded by
+            the largest element rather than the whole response.
 
         Parameters
-            vserverid: id of virtual server
+            key: name of the array within the response object
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-shutdown',
-            'vserverid': vserverid
-        })
+        self.key = key
+        self.start = re.compile(r'"'+re.escape(key)+r'"\s*:\s*\[')
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.buffer = ''
+        self.found = False
+        self.done = False
 
-    def terminateVirtualServer(self, vserverid, deleteclient=False):
-        """Deletes specified virtual server.
+    def feed(self, data):
+        """Feeds a chunk of the response body.
 
-            https://documentation.solusvm.com/display/DOCS/Terminate+Virtual+Server
+        Parameters
+            data: bytes
+        Returns
+            list of decoded elements completed by this chunk
+        """
+        if self.done:
+            return []
+
+        self.buffer += self.text.decode(data)
+        if not self.found:
+            match = self.start.search(self.buffer)
+            if match is None:
+                return []
+            self.buffer = self.buffer[match.end():]
+            self.found = True
+
+        records = []
+        pos = 0
+        while True:
+            pos = self._skip.match(self.buffer, pos).end()
+            if pos >= len(self.buffer):
+                break
+            if self.buffer[pos] == ']':
+                self.done = True
+                break
+            try:
+                record, end = self.decoder.raw_decode(self.buffer, pos)
+            except ValueError:
+                break
+            # a number cut off by the chunk boundary decodes as a shorter one, so only
+            # accept an element once the delimiter following it has arrived
+            after = self._space.match(self.buffer, end).end()
+            if after >= len(self.buffer) or self.buffer[after] not in ',]':
+                break
+            records.append(record)
+            pos = after
+
+        self.buffer = '' if self.done else self.buffer[pos:]
+        return records
+
+    def close(self):
+        """Checks the response ended cleanly.
+
+            A response without the array is decoded whole; an error status is raised as
+            SolusVMError and anything else is treated as an empty array.
 
         Parameters
-            vserverid: id of virtual server
-            deleteclient: whether or not to delete client too
+            None
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-terminate',
-            'vserverid': vserverid,
-            'deleteclient': deleteclient
-        })
+        if self.done:
+            return
+        if self.found:
+            raise SolusVMError('truncated response reading '+self.key)
+
+        response = json.loads(self.buffer + self.text.decode(b'', final=True))
+        if isinstance(response, dict) and response.get('status') not in (None, 'success'):
+            raise SolusVMError(response.get('statusmsg', 'unknown error'))
+
+def _number(value):
+    """Converts a numeric string as returned by the API, leaving anything else untouched.
+
+    Parameters
+        value: raw value
+    Returns
+        int, float or value
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+class _Field:
+    def __init__(self, slot, convert):
+        """Model attribute converting its raw value on first access and keeping the result.
 
-    def changeVNCPassword(self, vserverid, vncpassword):
-        """Updates VNC password for specified virtual server.
+        Parameters
+            slot: name of the slot holding the value
+            convert: converter, or None to return the raw value
+        Returns
+            None
+        """
+        self.slot = slot
+        self.convert = convert
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = getattr(instance, self.slot)
+        if self.convert is not None and isinstance(value, str):
+            value = self.convert(value)
+            setattr(instance, self.slot, value)
+        return value
+
+class Model:
+    # (attribute, response key, converter or None) triples, set by subclasses.
+    fields = ()
+    __slots__ = ('extra',)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.keys = dict((key, attribute) for attribute, key, convert in cls.fields)
+        for attribute, key, convert in cls.fields:
+            setattr(cls, attribute, _Field('_'+attribute, convert))
+
+    def __init__(self, record):
+        """Slotted record decoded from an API response.
+
+            Known fields are exposed as attributes, numeric ones converted lazily on first
+            access, and are None when missing from the record. Unknown keys are kept in
+            extra. Item access by response key is supported for code written against
+            plain dictionaries.
 
-            https://documentation.solusvm.com/display/DOCS/Change+VNC+Password
+        Parameters
+            record: dictionary from the API response
+        Returns
+            None
+        """
+        extra = dict(record)
+        for attribute, key, convert in self.fields:
+            setattr(self, '_'+attribute, extra.pop(key, None))
+        self.extra = extra or None
+
+    def __getitem__(self, key):
+        if key in self.keys:
+            return getattr(self, self.keys[key])
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys or (self.extra is not None and key in self.extra)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def asDict(self):
+        """Converts the model back into a dictionary keyed as in the API response.
 
         Parameters
-            vserverid: id of virtual server
-            vncpassword: new password
+            None
         Returns
-            json
+            dictionary
         """
-        return self._sQuery({
-            'action': 'vserver-vncpass',
-            'vserverid': vserverid,
-            'vncpassword': vncpassword
-        })
+        record = dict(self.extra or {})
+        record.update((key, getattr(self, attribute)) for attribute, key, convert in self.fields)
+        return record
+
+    def __repr__(self):
+        return self.__class__.__name__+'('+repr(self.asDict())+')'
+
+class VirtualServer(Model):
+    fields = (
+        ('vserverid', 'vserverid', _number),
+        ('ctid_xid', 'ctid-xid', None),
+        ('clientid', 'clientid', _number),
+        ('ipaddress', 'ipaddress', None),
+        ('hostname', 'hostname', None),
+        ('template', 'template', None),
+        ('hdd', 'hdd', _number),
+        ('memory', 'memory', _number),
+        ('swap_burst', 'swap-burst', _number),
+        ('bandwidth', 'bandwidth', _number),
+        ('type', 'type', None),
+        ('mac', 'mac', None),
+        ('node', 'node', None),
+        ('state', 'state', None)
+    )
+    __slots__ = tuple('_'+field[0] for field in fields)
+
+class Node(Model):
+    fields = (
+        ('id', 'id', _number),
+        ('name', 'name', None)
+    )
+    __slots__ = tuple('_'+field[0] for field in fields)
+
+class Client(Model):
+    fields = (
+        ('id', 'id', _number),
+        ('username', 'username', None),
+        ('email', 'email', None),
+        ('firstname', 'firstname', None),
+        ('lastname', 'lastname', None),
+        ('company', 'company', None),
+        ('level', 'level', None),
+        ('status', 'status', None),
+        ('created', 'created', None)
+    )
+    __slots__ = tuple('_'+field[0] for field in fields)
+
+class Reseller(Model):
+    fields = (
+        ('username', 'username', None),
+        ('firstname', 'firstname', None),
+        ('lastname', 'lastname', None),
+        ('company', 'company', None),
+        ('email', 'email', None),
+        ('maxvps', 'maxvps', _number),
+        ('maxusers', 'maxusers', _number),
+        ('maxmem', 'maxmem', _number),
+        ('maxburst', 'maxburst', _number),
+        ('maxdisk', 'maxdisk', _number),
+        ('maxbw', 'maxbw', _number),
+        ('maxipv4', 'maxipv4', _number),
+        ('maxipv6', 'maxipv6', _number),
+        ('nodegroups', 'nodegroups', None),
+        ('status', 'status', None)
+    )
+    __slots__ = tuple('_'+field[0] for field in fields)
+
+class Plan(Model):
+    fields = (
+        ('name', 'name', None),
+    )
+    __slots__ = tuple('_'+field[0] for field in fields)
+
+class NodeStatistics(Model):
+    fields = (
+        ('id', 'id', _number),
+        ('name', 'name', None),
+        ('ip', 'ip', None),
+        ('hostname', 'hostname', None),
+        ('country', 'country', None),
+        ('city', 'city', None),
+        ('sshport', 'sshport', _number),
+        ('arch', 'arch', None),
+        ('freedisk', 'freedisk', _number),
+        ('totaldisk', 'totaldisk', _number),
+        ('freememory', 'freememory', _number),
+        ('totalmemory', 'totalmemory', _number),
+        ('freeips', 'freeips', _number),
+        ('freeipv6', 'freeipv6', _number),
+        ('virtualservers', 'virtualservers', _number),
+        ('maxvps', 'maxvps', _number),
+        ('status', 'status', None)
+    )
+    __slots__ = tuple('_'+field[0] for field in fields)
+
+# Models returned per action when enabled: (response key or None for the whole
+# response, model, field name for comma separated strings or None).
+MODELS = {
+    'client-list': ('clients', Client, None),
+    'listnodes': ('nodes', Node, 'name'),
+    'listplans': ('plans', Plan, 'name'),
+    'node-idlist': ('nodes', Node, 'id'),
+    'node-statistics': (None, NodeStatistics, None),
+    'node-virtualservers': ('virtualservers', VirtualServer, None),
+    'reseller-info': (None, Reseller, None)
+}
+
+# Actions which only read state from the master.
+READ_ACTIONS = frozenset([
+    'client-authenticate',
+    'client-checkexists',
+    'client-list',
+    'listiso',
+    'listnodegroups',
+    'listnodes',
+    'listplans',
+    'listtemplates',
+    'node-idlist',
+    'node-iplist',
+    'node-statistics',
+    'node-virtualservers',
+    'node-xenresources',
+    'reseller-info',
+    'reseller-list',
+    'vserver-checkexists',
+    'vserver-info',
+    'vserver-infoall',
+    'vserver-status',
+    'vserver-vnc'
+])
+
+# Virtualization types a master may host.
+VTYPES = ('openvz', 'xen', 'xen hvm', 'kvm')
+
+# Fields returned by each virtual server information action, cheapest action first.
+PROJECTIONS = (
+    ('vserver-status', frozenset(['statusmsg'])),
+    ('vserver-info', frozenset([
+        'vserverid', 'ctid-xid', 'clientid', 'ipaddress', 'hostname', 'template', 'hdd', 'memory', 'swap-burst', 'type', 'mac'
+    ])),
+    ('vserver-infoall', frozenset([
+        'state', 'mainipaddress', 'ipaddresses', 'rescuemode', 'type', 'node', 'plan', 'suspended', 'hdd', 'memory', 'bandwidth',
+        'trafficgraph', 'loadgraph', 'memorygraph', 'hddgraph'
+    ]))
+)
+
+# vserver-infoall fields only rendered when graphs are requested.
+GRAPH_FIELDS = frozenset(['trafficgraph', 'loadgraph', 'memorygraph', 'hddgraph'])
+
+# Default cache lifetimes in seconds for catalogue actions.
+CACHE_TTLS = {
+    'listiso': 3600,
+    'listnodegroups': 3600,
+    'listnodes': 3600,
+    'listplans': 3600,
+    'listtemplates': 3600,
+    'node-idlist': 3600
+}
+
+# Read actions whose responses each mutating action makes stale. No wrapped action changes
+# the catalogue, so these only matter when cache_ttls caches other read actions.
+_CLIENT_READS = ('client-authenticate', 'client-checkexists', 'client-list')
+_RESELLER_READS = ('reseller-info', 'reseller-list')
+_VSERVER_READS = ('vserver-checkexists', 'vserver-info', 'vserver-infoall', 'vserver-status')
+_NODE_READS = ('node-iplist', 'node-statistics', 'node-virtualservers')
+CACHE_INVALIDATIONS = dict(
+    [(action, _CLIENT_READS) for action in ('client-change-username', 'client-create', 'client-delete', 'client-edit', 'client-updatepassword')] +
+    [(action, _RESELLER_READS) for action in ('reseller-create', 'reseller-delete', 'reseller-modifyresources')] +
+    [('vserver-create', _VSERVER_READS + _NODE_READS)] +
+    # terminating may delete the owning client too (deleteclient)
+    [('vserver-terminate', _VSERVER_READS + _NODE_READS + _CLIENT_READS)] +
+    [(action, _VSERVER_READS + ('node-iplist',)) for action in ('vserver-addip', 'vserver-delip')] +
+    [(action, _VSERVER_READS) for action in (
+        'vserver-bandwidth', 'vserver-boot', 'vserver-bootorder', 'vserver-change', 'vserver-change-cpu', 'vserver-change-hdd',
+        'vserver-change-memory', 'vserver-changeowner', 'vserver-hostname', 'vserver-mountiso', 'vserver-network-disable',
+        'vserver-network-enable', 'vserver-pae', 'vserver-reboot', 'vserver-rebuild', 'vserver-rootpassword', 'vserver-shutdown',
+        'vserver-suspend', 'vserver-tun-disable', 'vserver-tun-enable', 'vserver-unmountiso', 'vserver-unsuspend', 'vserver-vncpass'
+    )]
+)
+
+class MemoryCache:
+    def __init__(self, maxsize=1024):
+        """In-process LRU cache with per-entry expiry.
 
-    def vncInfo(self, vserverid):
-        """Retrieves VNC information for specified virtual server.
+        Parameters
+            maxsize: maximum number of entries held
+        Returns
+            None
+        """
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
 
-            https://documentation.solusvm.com/display/DOCS/VNC+Info
+    def get(self, key):
+        """Retrieves an unexpired entry.
 
         Parameters
-            vserverid: id of virtual server
+            key: cache key
         Returns
-            json
+            cached value, or None if missing or expired
         """
-        return self._sQuery({
-            'action': 'vserver-vnc',
-            'vserverid': vserverid
-        })
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        """Stores an entry, evicting the least recently used entry when full.
 
-    def suspendVirtualServer(self, vserverid):
-        """Suspends specified virtual server.
+        Parameters
+            key: cache key
+            value: value to store
+            ttl: lifetime in seconds
+        Returns
+            None
+        """
+        with self.lock:
+            self.entries[key] = (time.time() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
 
-            https://documentation.solusvm.com/display/DOCS/Suspend+Virtual+Server
+    def clear(self, prefix=''):
+        """Removes entries whose key starts with prefix.
 
         Parameters
-            vserverid: id of virtual server
+            prefix: key prefix, or '' for every entry
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-suspend',
-            'vserverid':vserverid
-        })
-
-    def unsuspendVirtualServer(self, vserverid):
-        """Unsuspends specified virtual server.
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
 
-            https://documentation.solusvm.com/display/DOCS/Unsuspend+Virtual+Server
+class DiskCache:
+    def __init__(self, path, maxsize=65536):
+        """SQLite backed LRU cache with per-entry expiry, shareable between processes.
 
         Parameters
-            vserverid: id of virtual server
+            path: database file path
+            maxsize: maximum number of entries held
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-unsuspend',
-            'vserverid': vserverid
-        })
+        self.path = path
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL, used REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS cache_used ON cache (used)')
 
-    def virtualServerStatus(self, vserverid):
-        """Retrieves status of specified virtual server.
-
-            https://documentation.solusvm.com/display/DOCS/Virtual+Server+Status
+    def get(self, key):
+        """Retrieves an unexpired entry.
 
         Parameters
-            vserverid: id of virtual server
+            key: cache key
         Returns
-            json
+            cached value, or None if missing or expired
         """
-        return self._sQuery({
-            'action': 'vserver-status',
-            'vserverid': vserverid
-        })
-
-    def changeRootPassword(self, vserverid, rootpassword):
-        """Retrieves status of specified virtual server.
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT value FROM cache WHERE key = ? AND expires >= ?', (key, now)).fetchone()
+            if row is None:
+                return None
+            self.db.execute('UPDATE cache SET used = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
 
-            https://documentation.solusvm.com/display/DOCS/Change+Root+Password
+    def set(self, key, value, ttl):
+        """Stores an entry, evicting the least recently used entries when full.
 
         Parameters
-            vserverid: id of virtual server
-            rootpassword: new root password
+            key: cache key
+            value: json serialisable value to store
+            ttl: lifetime in seconds
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-rootpassword',
-            'vserverid': vserverid,
-            'rootpassword': rootpassword
-        })
-
-    def rebuildVirtualServer(self, vserverid, template):
-        """Rebuilds specified virtual server with specified template.
+        now = time.time()
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)', (key, json.dumps(value), now + ttl, now))
+            self.db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.maxsize,))
 
-            https://documentation.solusvm.com/display/DOCS/Rebuild+Virtual+Server
+    def clear(self, prefix=''):
+        """Removes entries whose key starts with prefix.
 
         Parameters
-            vserverid: id of virtual server
-            template: template filename without extension
+            prefix: key prefix, or '' for every entry
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-rebuild',
-            'vserverid': vserverid,
-            'template': template
-        })
+        with self.lock:
+            self.db.execute('DELETE FROM cache WHERE substr(key, 1, ?) = ?', (len(prefix), prefix))
 
-    def changeHostname(self, vserverid, hostname):
-        """Updates specified virtual server's hostname.
+class Metrics:
+    # Upper bounds in seconds of the request latency histogram buckets.
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
 
-            https://documentation.solusvm.com/display/DOCS/Change+Hostname
+    def __init__(self, buckets=BUCKETS, tracer=None):
+        """Collects per-action request metrics from one or more clients.
 
         Parameters
-            vserverid: id of virtual server
-            hostname: new hostname
+            buckets: ascending latency histogram bucket bounds in seconds
+            tracer: OpenTelemetry-style tracer providing start_as_current_span(name, attributes=...), or None
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-hostname',
-            'vserverid': vserverid,
-            'hostname': hostname
-        })
+        self.buckets = tuple(buckets)
+        self.tracer = tracer
+        self.lock = threading.Lock()
+
+        self.latency = {}
+        self.bytes = collections.Counter()
+        self.errors = collections.Counter()
+        self.retries = collections.Counter()
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+        self.coalesced = collections.Counter()
+        self.unchanged = collections.Counter()
+
+    def span(self, action):
+        """Opens a tracing span around a query.
 
-    def rebootVirtualServer(self, vserverid):
-        """Reboots specified virtual server.
+        Parameters
+            action: SolusVM API action
+        Returns
+            context manager
+        """
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.start_as_current_span('solusvm '+str(action), attributes={'solusvm.action': str(action)})
 
-            https://documentation.solusvm.com/display/DOCS/Reboot+Virtual+Server
+    def observe(self, action, seconds, nbytes, error):
+        """Records one request sent to the master.
 
         Parameters
-            vserverid: id of virtual server
+            action: SolusVM API action
+            seconds: request latency
+            nbytes: response body size on the wire
+            error: whether the request failed or returned an error status
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-reboot',
-            'vserverid': vserverid
-        })
+        with self.lock:
+            histogram = self.latency.get(action)
+            if histogram is None:
+                histogram = self.latency[action] = [0] * (len(self.buckets) + 2)
+            histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[-1] += seconds
+            self.bytes[action] += nbytes
+            if error:
+                self.errors[action] += 1
+
+    def retry(self, action):
+        """Records a retried request.
 
-    def unmountISO(self, vserverid):
-        """Unmounts ISO from specified virtual server.
+        Parameters
+            action: SolusVM API action
+        Returns
+            None
+        """
+        with self.lock:
+            self.retries[action] += 1
 
-            https://documentation.solusvm.com/display/DOCS/Unmount+ISO
+    def cache(self, action, hit):
+        """Records a cache lookup.
 
         Parameters
-            vserverid: id of virtual server
+            action: SolusVM API action
+            hit: whether the response came from the cache
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-unmountiso',
+        with self.lock:
+            (self.hits if hit else self.misses)[action] += 1
+
+    def coalesce(self, action):
+        """Records a query answered by an identical query already in flight.
+
+        Parameters
+            action: SolusVM API action
+        Returns
+            None
+        """
+        with self.lock:
+            self.coalesced[action] += 1
+
+    def reuse(self, action):
+        """Records a response identical to the previous one, answered without decoding it.
+
+        Parameters
+            action: SolusVM API action
+        Returns
+            None
+        """
+        with self.lock:
+            self.unchanged[action] += 1
+
+    def cacheHitRatio(self, action=None):
+        """Fraction of cache lookups answered from the cache.
+
+        Parameters
+            action: SolusVM API action, or None for all actions
+        Returns
+            float, or None if there were no lookups
+        """
+        with self.lock:
+            hits = self.hits[action] if action else sum(self.hits.values())
+            misses = self.misses[action] if action else sum(self.misses.values())
+        return float(hits) / (hits + misses) if hits + misses else None
+
+    def exportPrometheus(self):
+        """Renders every metric in the Prometheus text exposition format.
+
+        Parameters
+            None
+        Returns
+            string
+        """
+        lines = [
+            '# HELP solusvm_request_duration_seconds SolusVM API request latency.',
+            '# TYPE solusvm_request_duration_seconds histogram'
+        ]
+        with self.lock:
+            for action in sorted(self.latency):
+                histogram = self.latency[action]
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), histogram):
+                    cumulative += count
+                    lines.append('solusvm_request_duration_seconds_bucket{action="%s",le="%s"} %d' % (action, bound, cumulative))
+                lines.append('solusvm_request_duration_seconds_sum{action="%s"} %f' % (action, histogram[-1]))
+                lines.append('solusvm_request_duration_seconds_count{action="%s"} %d' % (action, cumulative))
+
+            for name, description, counter in (
+                ('solusvm_response_bytes_total', 'SolusVM API response body bytes received on the wire, before decompression.', self.bytes),
+                ('solusvm_request_errors_total', 'SolusVM API requests that failed or returned an error status.', self.errors),
+                ('solusvm_request_retries_total', 'SolusVM API requests retried.', self.retries),
+                ('solusvm_cache_hits_total', 'SolusVM API queries answered from the cache.', self.hits),
+                ('solusvm_cache_misses_total', 'SolusVM API cacheable queries sent to the master.', self.misses),
+                ('solusvm_coalesced_total', 'SolusVM API queries sharing an identical query in flight.', self.coalesced),
+                ('solusvm_unchanged_total', 'SolusVM API responses identical to the previous one, reused without decoding.', self.unchanged)
+            ):
+                lines.append('# HELP '+name+' '+description)
+                lines.append('# TYPE '+name+' counter')
+                lines.extend('%s{action="%s"} %d' % (name, action, counter[action]) for action in sorted(counter))
+
+        return '\n'.join(lines)+'\n'
+
+class Response:
+    def __init__(self, status_code, content, url='', wire_bytes=None):
+        """Minimal stand-in for requests.Response served by replay and test transports.
+
+        Parameters
+            status_code: HTTP status code
+            content: response body bytes
+            url: requested url
+            wire_bytes: body size on the wire before decompression, defaults to len(content)
+        Returns
+            None
+        """
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+        self.wire_bytes = len(content) if wire_bytes is None else wire_bytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        pass
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+    def iter_content(self, chunk_size=1):
+        for offset in range(0, len(self.content), chunk_size):
+            yield self.content[offset:offset+chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError('%d error for url: %s' % (self.status_code, self.url), response=self)
+
+def _wireBytes(response, size):
+    """Returns the size a response body took on the wire, before decompression.
+
+    Parameters
+        response: response returned by a transport, or an aiohttp response
+        size: decoded body size, used when the response does not expose its wire size
+    Returns
+        int
+    """
+    wire = getattr(response, 'wire_bytes', None)
+    if wire is not None:
+        return wire
+
+    raw = getattr(response, 'raw', None)
+    if hasattr(raw, 'tell'):
+        return raw.tell()
+
+    length = getattr(response, 'headers', {}).get('Content-Length', '')
+    return int(length) if length.isdigit() else size
+
+class RequestsTransport:
+    def __init__(self, scheme='https', pool_connections=1, pool_maxsize=10, pool_block=False):
+        """Sends queries over a pooled requests session.
+
+            Transports expose send(url, query, timeout, stream=False), taking an
+            encoded query string and returning a requests.Response compatible
+            object, and close().
+
+        Parameters
+            scheme: scheme to mount the pooled adapter on
+            pool_connections: number of per-host connection pools to cache
+            pool_maxsize: maximum number of keep-alive connections per host
+            pool_block: whether to block rather than exceed pool_maxsize connections per host
+        Returns
+            None
+        """
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        self.session.mount(scheme+'://', requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block
+        ))
+
+    def send(self, url, query, timeout, stream=False):
+        """Sends one GET query.
+
+        Parameters
+            url: API url
+            query: encoded query string
+            timeout: (connect, read) timeout tuple in seconds
+            stream: whether to defer reading the response body
+        Returns
+            requests.Response
+        """
+        return self.session.get(url+'?'+query, timeout=timeout, stream=stream)
+
+    def close(self):
+        self.session.close()
+
+# GET vars never written to recordings.
+REDACTED_PARAMS = frozenset(['id', 'key'])
+
+def _decodeQuery(query):
+    """Decodes an encoded query string, dropping rdtype and the credentials.
+
+    Parameters
+        query: encoded query string
+    Returns
+        dictionary GET vars
+    """
+    return dict(
+        (name, value) for name, value in urllib.parse.parse_qsl(query, keep_blank_values=True)
+        if name not in REDACTED_PARAMS and name != 'rdtype'
+    )
+
+class RecordingTransport:
+    def __init__(self, transport, path):
+        """Records every exchange sent through another transport.
+
+            Each exchange is appended to path as one compact JSON line holding its
+            start offset, duration, redacted GET vars, status and body:
+
+                {"t":0.0,"d":0.012,"p":{"action":"vserver-status","vserverid":"101"},"s":200,"b":"{...}"}
+
+            A failed exchange holds "e" instead of a status and body: "timeout",
+            "connection", or the class name of any other exception raised.
+
+        Parameters
+            transport: transport actually sending the queries
+            path: file to append exchanges to
+        Returns
+            None
+        """
+        self.transport = transport
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def send(self, url, query, timeout, stream=False):
+        """Sends one GET query through the wrapped transport, recording the exchange.
+
+        Parameters
+            url: API url
+            query: encoded query string
+            timeout: (connect, read) timeout tuple in seconds
+            stream: whether the caller streams the response; recorded bodies are always read in full
+        Returns
+            response
+        """
+        started = time.monotonic()
+        record = {
+            't': round(started - self.started, 6),
+            'p': _decodeQuery(query)
+        }
+        try:
+            response = self.transport.send(url, query, timeout, stream)
+            record['b'] = response.content.decode('utf-8', 'replace')
+            record['s'] = response.status_code
+        except requests.Timeout:
+            record['e'] = 'timeout'
+            raise
+        except requests.ConnectionError:
+            record['e'] = 'connection'
+            raise
+        except Exception as e:
+            record['e'] = type(e).__name__
+            raise
+        finally:
+            record['d'] = round(time.monotonic() - started, 6)
+            self._sWrite(record)
+
+        return response
+
+    def _sWrite(self, record):
+        """Appends one exchange to the recording.
+
+        Parameters
+            record: dictionary exchange
+        Returns
+            None
+        """
+        line = json.dumps(record, separators=(',', ':'), default=str)+'\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        self.transport.close()
+
+def readRecording(path):
+    """Reads the exchanges of a recording made by RecordingTransport.
+
+        A last line cut short, as left by a process killed mid-write, is skipped.
+
+    Parameters
+        path: recording file
+    Returns
+        list of dictionary exchanges in recorded order
+    """
+    with open(path, encoding='utf-8') as fh:
+        lines = fh.readlines()
+
+    records = []
+    for number, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            if number < len(lines) - 1 or line.endswith('\n'):
+                raise
+    return records
+
+class ReplayTransport:
+    def __init__(self, path, speed=1.0):
+        """Serves responses from a recording made by RecordingTransport instead of a master.
+
+            Queries are matched on their GET vars; repeated queries are served the
+            recorded responses in order, the last one repeating once exhausted.
+
+        Parameters
+            path: recording file
+            speed: factor to accelerate recorded response times by, or 0 to respond immediately
+        Returns
+            None
+        """
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.exchanges = collections.defaultdict(collections.deque)
+        for record in readRecording(path):
+            self.exchanges[self._sKey(record['p'])].append(record)
+
+    @staticmethod
+    def _sKey(params):
+        """Matching key for specified GET vars.
+
+        Parameters
+            params: dictionary GET vars without credentials
+        Returns
+            string
+        """
+        return json.dumps(sorted((name, str(value)) for name, value in params.items()))
+
+    def send(self, url, query, timeout, stream=False):
+        """Serves the recorded response to one GET query.
+
+        Parameters
+            url: API url
+            query: encoded query string
+            timeout: unused
+            stream: unused
+        Returns
+            Response
+        """
+        with self.lock:
+            key = self._sKey(_decodeQuery(query))
+            exchanges = self.exchanges.get(key)
+            if not exchanges:
+                raise requests.ConnectionError('no recorded response for '+key)
+            record = exchanges.popleft() if len(exchanges) > 1 else exchanges[0]
+
+        if self.speed:
+            time.sleep(record['d'] / self.speed)
+
+        if record.get('e') == 'timeout':
+            raise requests.Timeout('recorded timeout')
+        if record.get('e'):
+            raise requests.ConnectionError('recorded connection error')
+
+        return Response(record['s'], record['b'].encode('utf-8'), url)
+
+    def close(self):
+        pass
+
+def replayTraffic(client, path, speed=1.0, max_workers=16):
+    """Re-issues the queries of a recording through a client at their recorded pace.
+
+        Replaying a captured day against a new client version, with the client on a
+        ReplayTransport of the same recording, gives an offline regression benchmark:
+
+            client = SolusVM('solusvm.example.com', 'ID', 'KEY', transport=ReplayTransport(path, speed=60))
+            replayTraffic(client, path, speed=60)
+
+    Parameters
+        client: SolusVM client to send the queries through
+        path: recording file
+        speed: factor to accelerate the recorded arrival times by, or 0 to send as fast as possible
+        max_workers: maximum number of queries in flight at once
+    Returns
+        dictionary of queries sent, errors, elapsed seconds and per-query latencies
+    """
+    records = readRecording(path)
+    latencies = []
+    errors = []
+
+    def send(record):
+        started = time.monotonic()
+        try:
+            client._sQuery(dict(record['p']))
+        except Exception as e:
+            errors.append((record['p'], e))
+        latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for record in records:
+            if speed:
+                delay = started + record['t'] / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(executor.submit(send, record))
+        concurrent.futures.wait(futures)
+
+    return {
+        'queries': len(records),
+        'errors': errors,
+        'elapsed': time.monotonic() - started,
+        'latencies': latencies
+    }
+
+class HTTP2Transport:
+    def __init__(self, pool_maxsize=10, verify=True):
+        """Multiplexes concurrent queries over HTTP/2 connections. Requires httpx with h2.
+
+            Threads sharing one client share its connections, so high fan-out polling
+            rides a handful of multiplexed streams instead of one connection per query.
+
+        Parameters
+            pool_maxsize: maximum number of connections to the master
+            verify: whether to verify TLS certificates
+        Returns
+            None
+        """
+        if httpx is None:
+            raise ImportError('HTTP2Transport requires httpx')
+
+        self.client = httpx.Client(
+            http2=True,
+            verify=verify,
+            limits=httpx.Limits(max_connections=pool_maxsize),
+            headers={'Accept-Encoding': ACCEPT_ENCODING}
+        )
+
+    def send(self, url, query, timeout, stream=False):
+        """Sends one GET query.
+
+        Parameters
+            url: API url
+            query: encoded query string
+            timeout: (connect, read) timeout tuple in seconds
+            stream: unused; bodies are read in full
+        Returns
+            Response
+        """
+        try:
+            response = self.client.get(url+'?'+query, timeout=httpx.Timeout(timeout[1], connect=timeout[0]))
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(str(e))
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e))
+
+        return Response(response.status_code, response.content, url, response.num_bytes_downloaded)
+
+    def close(self):
+        self.client.close()
+
+def _decompress(content, encoding):
+    """Decodes a response body sent with specified Content-Encoding.
+
+    Parameters
+        content: response body bytes
+        encoding: Content-Encoding header, or None
+    Returns
+        bytes
+    """
+    encoding = (encoding or '').strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    if encoding == 'br' and brotli is not None:
+        return brotli.decompress(content)
+    return content
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        http.client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+class UnixSocketTransport:
+    def __init__(self, path, pool_maxsize=10):
+        """Sends queries over a unix socket, typically to a local proxy in front of the master.
+
+        Parameters
+            path: unix socket path
+            pool_maxsize: maximum number of idle keep-alive connections kept
+        Returns
+            None
+        """
+        self.path = path
+        self.pool_maxsize = pool_maxsize
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def _sConnection(self, timeout):
+        """Takes an idle connection, or opens a new one.
+
+        Parameters
+            timeout: (connect, read) timeout tuple in seconds
+        Returns
+            _UnixConnection
+        """
+        with self.lock:
+            if self.idle:
+                connection = self.idle.pop()
+                connection.timeout = timeout[1]
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout[1])
+                return connection
+
+        return _UnixConnection(self.path, timeout[0])
+
+    def send(self, url, query, timeout, stream=False):
+        """Sends one GET query.
+
+        Parameters
+            url: API url, whose host is sent as the Host header
+            query: encoded query string
+            timeout: (connect, read) timeout tuple in seconds
+            stream: unused; bodies are read in full
+        Returns
+            Response
+        """
+        parts = urllib.parse.urlsplit(url)
+        connection = self._sConnection(timeout)
+        try:
+            connection.request('GET', parts.path+'?'+query, headers={'Host': parts.netloc, 'Accept-Encoding': ACCEPT_ENCODING})
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout[1])
+            response = connection.getresponse()
+            body = response.read()
+            content = _decompress(body, response.getheader('Content-Encoding'))
+        except socket.timeout as e:
+            connection.close()
+            raise requests.Timeout(str(e))
+        except (OSError, http.client.HTTPException, zlib.error) as e:
+            connection.close()
+            raise requests.ConnectionError(str(e))
+
+        if response.will_close:
+            connection.close()
+        else:
+            with self.lock:
+                if len(self.idle) < self.pool_maxsize:
+                    self.idle.append(connection)
+                    connection = None
+            if connection is not None:
+                connection.close()
+
+        return Response(response.status, content, url, len(body))
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+class StubTransport:
+    def __init__(self, responses=None):
+        """Test double answering queries from canned responses without any network.
+
+            StubTransport({
+                'vserver-status': {'status': 'success', 'statusmsg': 'online'},
+                'vserver-info': lambda params: {'status': 'success', 'vserverid': params['vserverid']}
+            })
+
+        Parameters
+            responses: dictionary of action to json, a callable of the GET vars returning json, or an exception to raise
+        Returns
+            None
+        """
+        self.responses = dict(responses or {})
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def send(self, url, query, timeout, stream=False):
+        """Answers one GET query, recording its decoded GET vars in calls without rdtype, id and key.
+
+        Parameters
+            url: API url
+            query: encoded query string
+            timeout: unused
+            stream: unused
+        Returns
+            Response
+        """
+        params = _decodeQuery(query)
+        with self.lock:
+            self.calls.append(params)
+
+        response = self.responses.get(params.get('action'))
+        if response is None:
+            return Response(200, json.dumps({'status': 'error', 'statusmsg': 'Invalid action'}).encode('utf-8'), url)
+        if isinstance(response, Exception):
+            raise response
+        if callable(response):
+            response = response(params)
+
+        return Response(200, json.dumps(response).encode('utf-8'), url)
+
+    def close(self):
+        pass
+
+def _quote(value):
+    """Encodes one GET var value as requests does, stringifying non-string values.
+
+    Parameters
+        value: GET var value
+    Returns
+        string
+    """
+    if type(value) is int:
+        return str(value)
+    if isinstance(value, bytes):
+        return urllib.parse.quote_plus(value)
+    return urllib.parse.quote_plus(str(value))
+
+class _QueryTemplate:
+    __slots__ = ('prefix', 'names')
+
+    def __init__(self, action):
+        """Compiled query encoder for one action, holding its encoded action and GET var names.
+
+        Parameters
+            action: SolusVM action
+        Returns
+            None
+        """
+        self.prefix = 'action='+urllib.parse.quote_plus(action)
+        self.names = {}
+
+    def encode(self, kwargs, suffix):
+        """Encodes the varying GET vars of one query between the action and the static suffix.
+
+            None values are dropped and list values repeated, as requests does.
+
+        Parameters
+            kwargs: dictionary GET vars
+            suffix: pre-encoded static GET vars
+        Returns
+            string query
+        """
+        parts = [self.prefix]
+        names = self.names
+        for name, value in kwargs.items():
+            if value is None or name == 'action':
+                continue
+            quoted = names.get(name)
+            if quoted is None:
+                quoted = names[name] = urllib.parse.quote_plus(name)+'='
+            if isinstance(value, (list, tuple)):
+                parts.extend(quoted+_quote(item) for item in value if item is not None)
+            else:
+                parts.append(quoted+_quote(value))
+        parts.append(suffix)
+        return '&'.join(parts)
+
+class SolusVM:
+    def __init__(self, base_url, api_id, api_key, pool_connections=1, pool_maxsize=10, pool_block=False, cache=None, cache_ttls=None, coalesce=True,
+                 connect_timeout=2, read_timeout=2, retries=2, backoff=0.1, breaker=None, scheduler=None, models=False, metrics=None,
+                 scheme='https', port=5656, transport=None, decoded_cache=0):
+        """SolusVM JSON API Library constructor.
+
+        Parameters
+            base_url: SolusVM base_url
+            api_id: SolusVM API authentiction ID hash
+            api_key: SolusVM API authentication key hash
+            pool_connections: number of per-host connection pools to cache
+            pool_maxsize: maximum number of keep-alive connections per host
+            pool_block: whether to block rather than exceed pool_maxsize connections per host
+            cache: MemoryCache, DiskCache or compatible backend for catalogue actions, or None to disable
+            cache_ttls: dictionary of action to cache lifetime in seconds, overriding CACHE_TTLS
+            coalesce: whether concurrent identical read queries share one request
+            connect_timeout: seconds to wait for a connection
+            read_timeout: seconds to wait for a response
+            retries: number of retries for failed read actions; mutating actions are never retried
+            backoff: base delay in seconds for jittered exponential backoff between retries
+            breaker: CircuitBreaker, or None to share one with every client of base_url
+            scheduler: RequestScheduler pacing requests to the master, or None for no pacing
+            models: whether to return Model instances for actions in MODELS instead of dictionaries
+            metrics: Metrics collector, or None to disable instrumentation
+            scheme: https, or http for local stand-ins such as mockserver
+            port: SolusVM admin API port
+            transport: RequestsTransport, HTTP2Transport, UnixSocketTransport, StubTransport, RecordingTransport,
+                ReplayTransport or compatible, or None for a pooled requests session
+            decoded_cache: number of queries whose last decoded response is kept, so an identical
+                response returns the same object without decoding it again; callers must then
+                treat results as read-only. 0, the default, disables reuse
+        Returns
+            None
+        """
+        self.base_url = base_url
+        self.id = api_id
+        self.key = api_key
+        self.scheme = scheme
+        self.port = port
+        self.url = scheme+'://'+base_url+':'+str(port)+'/api/admin/command.php'
+        self.base_query = urllib.parse.urlencode([('rdtype', 'json'), ('id', api_id), ('key', api_key)])
+        self._templates = {}
+
+        self.cache = cache
+        self.cache_ttls = dict(CACHE_TTLS, **(cache_ttls or {}))
+
+        self.coalesce = coalesce
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or getCircuitBreaker(base_url)
+        self.scheduler = scheduler
+        self.models = models
+        self.metrics = metrics
+
+        self.decoded_cache = decoded_cache
+        self._decoded = collections.OrderedDict()
+        self._decoded_lock = threading.Lock()
+
+        self.transport = transport
+        self._sOpen(pool_connections, pool_maxsize, pool_block)
+
+    def _sOpen(self, pool_connections, pool_maxsize, pool_block):
+        """Creates the pooled HTTP transport unless one was given.
+
+        Parameters
+            pool_connections: number of per-host connection pools to cache
+            pool_maxsize: maximum number of keep-alive connections per host
+            pool_block: whether to block rather than exceed pool_maxsize connections per host
+        Returns
+            None
+        """
+        if self.transport is None:
+            self.transport = RequestsTransport(self.scheme, pool_connections, pool_maxsize, pool_block)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Closes pooled connections to the SolusVM master.
+
+        Parameters
+            None
+        Returns
+            None
+        """
+        self.transport.close()
+
+    def _sRequest(self, kwargs):
+        """Builds the URL and encoded query string for the specified query.
+
+            Only the varying GET vars are encoded per call: the action comes from a
+            compiled per-action template and rdtype, id and key were encoded once at
+            construction. kwargs is left unchanged.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            tuple of url, string query
+        """
+        action = kwargs.get('action')
+        template = self._templates.get(action)
+        if template is None:
+            template = self._templates[action] = _QueryTemplate(action)
+
+        return self.url, template.encode(kwargs, self.base_query)
+
+    def invalidateCache(self, action=None):
+        """Drops cached responses from this master.
+
+        Parameters
+            action: action whose responses to drop, or None for all
+        Returns
+            None
+        """
+        if self.cache is not None:
+            self.cache.clear(self.base_url+'|'+(action+'|' if action else ''))
+
+    def _sCacheKey(self, kwargs):
+        """Builds the cache key for the specified query, or None if it is not cacheable.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            string or None
+        """
+        if self.cache is None or kwargs.get('action') not in self.cache_ttls:
+            return None
+        return self.base_url+'|'+kwargs['action']+'|'+self._sParamsKey(kwargs)
+
+    @staticmethod
+    def _sParamsKey(kwargs):
+        """Serialises query vars into a stable key.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            string
+        """
+        return json.dumps(sorted((k, str(v)) for k, v in kwargs.items()))
+
+    def _sCacheStore(self, kwargs, cachekey, result):
+        """Caches a successful catalogue response, or drops the cached responses a mutating action makes stale.
+
+            Only actions listed for it in CACHE_INVALIDATIONS that are cached are dropped, so
+            a shared cache keeps its catalogue across writes to virtual servers and clients.
+
+        Parameters
+            kwargs: dictionary GET vars
+            cachekey: key from _sCacheKey
+            result: json returned by the master
+        Returns
+            None
+        """
+        if cachekey is not None:
+            if isinstance(result, dict) and result.get('status') == 'success':
+                self.cache.set(cachekey, result, self.cache_ttls[kwargs['action']])
+        elif kwargs.get('action') not in READ_ACTIONS:
+            for action in CACHE_INVALIDATIONS.get(kwargs.get('action'), ()):
+                if action in self.cache_ttls:
+                    self.invalidateCache(action)
+
+    def _sModel(self, kwargs, result):
+        """Wraps the records of a response in Model instances when enabled.
+
+            The response itself is left untouched since it may be shared with the cache.
+
+        Parameters
+            kwargs: dictionary GET vars
+            result: json returned by the master
+        Returns
+            json, with records as Model instances
+        """
+        spec = MODELS.get(kwargs.get('action')) if self.models else None
+        if spec is None or not isinstance(result, dict) or result.get('status') not in (None, 'success'):
+            return result
+
+        key, model, commafield = spec
+        if key is None:
+            return model(result)
+
+        records = result.get(key)
+        if isinstance(records, str) and commafield is not None:
+            records = [{commafield: value.strip()} for value in records.split(',') if value.strip()]
+        if not isinstance(records, list):
+            return result
+
+        result = dict(result)
+        result[key] = [model(record) if isinstance(record, dict) else record for record in records]
+        return result
+
+    def _sSpan(self, kwargs):
+        """Opens a tracing span for specified query when metrics are enabled.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            context manager
+        """
+        if self.metrics is None:
+            return contextlib.nullcontext()
+        return self.metrics.span(kwargs.get('action'))
+
+    def _sObserve(self, kwargs, started, nbytes, result):
+        """Records a request sent to the master when metrics are enabled.
+
+        Parameters
+            kwargs: dictionary GET vars
+            started: time.monotonic() when the request was sent
+            nbytes: response body size on the wire
+            result: json returned, or None if the request failed
+        Returns
+            None
+        """
+        if self.metrics is not None:
+            error = result is None or (isinstance(result, dict) and result.get('status') == 'error')
+            self.metrics.observe(kwargs.get('action'), time.monotonic() - started, nbytes, error)
+
+    def _sQuery(self, kwargs, fields=None):
+        """Queries specified SolusVM API with specified query string.
+
+        Parameters
+            kwargs: dictionary GET vars
+            fields: top level fields to keep besides status and statusmsg, or None for all
+        Returns
+            json
+        """
+        with self._sSpan(kwargs):
+            return self._sModel(kwargs, self._sProject(self._sCached(kwargs), fields))
+
+    @staticmethod
+    def _sProject(result, fields):
+        """Trims a response to the requested top level fields.
+
+        Parameters
+            result: json returned by the master
+            fields: fields to keep besides status and statusmsg, or None for all
+        Returns
+            json
+        """
+        if fields is None or not isinstance(result, dict):
+            return result
+        return dict((name, value) for name, value in result.items() if name in fields or name in ('status', 'statusmsg'))
+
+    def _sCached(self, kwargs):
+        """Queries specified SolusVM API, answering catalogue actions from the cache when possible.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            json
+        """
+        cachekey = self._sCacheKey(kwargs)
+        if cachekey is not None:
+            result = self.cache.get(cachekey)
+            if self.metrics is not None:
+                self.metrics.cache(kwargs['action'], result is not None)
+            if result is not None:
+                return result
+
+        try:
+            result = self._sCoalesce(kwargs)
+        except Exception:
+            self._sCacheStore(kwargs, cachekey, None)
+            raise
+
+        self._sCacheStore(kwargs, cachekey, result)
+        return result
+
+    def _sCoalesce(self, kwargs):
+        """Sends specified query, sharing the response with identical read queries already in flight.
+
+            Callers that joined a flight receive their own copy, so results stay safe to mutate.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            json
+        """
+        if not self.coalesce or kwargs.get('action') not in READ_ACTIONS:
+            return self._sFetch(kwargs)
+
+        flightkey = self._sParamsKey(kwargs)
+        with self._inflight_lock:
+            flight = self._inflight.get(flightkey)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[flightkey] = concurrent.futures.Future()
+
+        if not leader:
+            if self.metrics is not None:
+                self.metrics.coalesce(kwargs['action'])
+            return copy.deepcopy(flight.result())
+
+        try:
+            flight.set_result(self._sFetch(kwargs))
+        except Exception as e:
+            flight.set_exception(e)
+        finally:
+            with self._inflight_lock:
+                del self._inflight[flightkey]
+
+        return flight.result()
+
+    def _sAttempts(self, kwargs):
+        """Number of attempts allowed for specified query.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            int
+        """
+        return self.retries + 1 if kwargs.get('action') in READ_ACTIONS else 1
+
+    def _sBackoff(self, attempt):
+        """Full-jitter exponential delay before the next retry.
+
+        Parameters
+            attempt: zero based number of the failed attempt
+        Returns
+            seconds
+        """
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def _sFetch(self, kwargs):
+        """Sends specified query to the SolusVM API, retrying read actions on transport failures.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            json
+        """
+        attempts = self._sAttempts(kwargs)
+        for attempt in range(attempts):
+            if self.scheduler is not None:
+                self.scheduler.acquire(kwargs.get('action'))
+
+            if not self.breaker.allow():
+                raise CircuitOpenError('circuit open for '+self.base_url)
+
+            try:
+                result = self._sSend(kwargs)
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError):
+                self.breaker.record(False)
+                if attempt + 1 == attempts:
+                    raise
+                if self.metrics is not None:
+                    self.metrics.retry(kwargs.get('action'))
+                time.sleep(self._sBackoff(attempt))
+            except Exception:
+                # undecodable responses and other failures still settle a trial call
+                self.breaker.record(False)
+                raise
+            else:
+                self.breaker.record(True)
+                return result
+
+    def _sSend(self, kwargs):
+        """Sends specified query to the SolusVM API once.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            json
+        """
+        url, query = self._sRequest(kwargs)
+        started = time.monotonic()
+        try:
+            response = self.transport.send(url, query, (self.connect_timeout, self.read_timeout))
+            if response.status_code >= 500:
+                response.raise_for_status()
+            result = self._sDecode(kwargs, query, response.content)
+        except Exception:
+            self._sObserve(kwargs, started, 0, None)
+            raise
+
+        self._sObserve(kwargs, started, _wireBytes(response, len(response.content)), result)
+        return result
+
+    def _sDecode(self, kwargs, query, content):
+        """Decodes a response body, reusing the previous result when the body is unchanged.
+
+            Responses are compared by a hash of their body; the last decoded result of
+            up to decoded_cache queries is kept, least recently used first out.
+
+        Parameters
+            kwargs: dictionary GET vars
+            query: encoded query string
+            content: response body bytes
+        Returns
+            json
+        """
+        if not self.decoded_cache:
+            return json.loads(content)
+
+        digest = hashlib.blake2b(content, digest_size=16).digest()
+        with self._decoded_lock:
+            entry = self._decoded.get(query)
+            if entry is not None and entry[0] == digest:
+                self._decoded.move_to_end(query)
+                if self.metrics is not None:
+                    self.metrics.reuse(kwargs.get('action'))
+                return entry[1]
+
+        result = json.loads(content)
+        with self._decoded_lock:
+            self._decoded[query] = (digest, result)
+            self._decoded.move_to_end(query)
+            while len(self._decoded) > self.decoded_cache:
+                self._decoded.popitem(last=False)
+        return result
+
+    def _sStream(self, kwargs, key):
+        """Streams the elements of one array from the specified query's response.
+
+            Streamed queries bypass the cache, coalescing and retries.
+
+        Parameters
+            kwargs: dictionary GET vars
+            key: name of the array within the response
+        Returns
+            generator of json
+        """
+        if self.scheduler is not None:
+            self.scheduler.acquire(kwargs.get('action'))
+
+        if not self.breaker.allow():
+            raise CircuitOpenError('circuit open for '+self.base_url)
+
+        url, query = self._sRequest(kwargs)
+        started = time.monotonic()
+        try:
+            response = self.transport.send(url, query, (self.connect_timeout, self.read_timeout), stream=True)
+            if response.status_code >= 500:
+                response.raise_for_status()
+        except Exception:
+            self.breaker.record(False)
+            self._sObserve(kwargs, started, 0, None)
+            raise
+        self.breaker.record(True)
+
+        model = MODELS[kwargs['action']][1] if self.models and kwargs.get('action') in MODELS else None
+        nbytes = 0
+        with response:
+            stream = JSONArrayStream(key)
+            try:
+                for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                    nbytes += len(chunk)
+                    for record in stream.feed(chunk):
+                        yield model(record) if model and isinstance(record, dict) else record
+                stream.close()
+            except Exception:
+                self._sObserve(kwargs, started, _wireBytes(response, nbytes), None)
+                raise
+        self._sObserve(kwargs, started, _wireBytes(response, nbytes), {})
+
+    @staticmethod
+    def _sBatchItems(items):
+        """Normalises batch items into (vserverid, args) pairs.
+
+        Parameters
+            items: iterable of vserverids or (vserverid, *args) tuples
+        Returns
+            list of (vserverid, args tuple) pairs
+        """
+        return [(item[0], tuple(item)) if isinstance(item, (tuple, list)) else (item, (item,)) for item in items]
+
+    def batch(self, method, items, max_workers=8, rate=None):
+        """Runs a single virtual server method against many virtual servers concurrently.
+
+            batch('suspendVirtualServer', [101, 102])
+            batch('changeBandwidthLimits', [(101, 500, 50), (102, 1000, 100)])
+
+        Parameters
+            method: name of a SolusVM method taking vserverid as its first argument
+            items: iterable of vserverids or (vserverid, *args) tuples
+            max_workers: maximum number of requests in flight at once
+            rate: maximum number of requests started per second, or None for no cap
+        Returns
+            dictionary of results and errors, each ordered by items and keyed by vserverid
+        """
+        call = getattr(self, method)
+        items = self._sBatchItems(items)
+        bucket = TokenBucket(rate) if rate else None
+
+        def run(args):
+            if bucket:
+                bucket.acquire()
+            return call(*args)
+
+        results = collections.OrderedDict()
+        errors = collections.OrderedDict()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(vserverid, executor.submit(run, args)) for vserverid, args in items]
+            for vserverid, future in futures:
+                if future.exception() is not None:
+                    errors[vserverid] = future.exception()
+                else:
+                    results[vserverid] = future.result()
+
+        return {
+            'results': results,
+            'errors': errors
+        }
+
+    def listVirtualServers(self, nodeid):
+        """Lists virtual servers allocated on specified node.
+
+            https://documentation.solusvm.com/display/DOCS/List+Virtual+Servers
+
+        Parameters
+            nodeid: id of node
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'node-virtualservers',
+            'nodeid': nodeid
+        })
+
+    def iterVirtualServers(self, nodeid):
+        """Streams virtual servers allocated on specified node, decoding one at a time.
+
+            https://documentation.solusvm.com/display/DOCS/List+Virtual+Servers
+
+        Parameters
+            nodeid: id of node
+        Returns
+            generator of virtual server json
+        """
+        return self._sStream({
+            'action': 'node-virtualservers',
+            'nodeid': nodeid
+        }, 'virtualservers')
+
+    def listAllVirtualServers(self, vtype='kvm', max_workers=16):
+        """Lists virtual servers allocated on every node, querying nodes concurrently.
+
+            A node that fails to respond is reported in errors rather than aborting the sweep.
+            If the node listing itself fails the result has status error, so a failed sweep
+            is not mistaken for an empty fleet.
+
+        Parameters
+            vtype: openvz|xen|xen hvm|kvm
+            max_workers: maximum number of nodes queried at once
+        Returns
+            dictionary of merged virtualservers, ids of the nodes swept and errors keyed by nodeid, or by 'nodes'
+        """
+        nodes = self.listNodesById(vtype)
+        if self._sFailed(nodes):
+            return self._sNodeListError(nodes)
+        nodeids = self._sNodeIds(nodes)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [(nodeid, executor.submit(self.listVirtualServers, nodeid)) for nodeid in nodeids]
+            return self._sMergeVirtualServers([(nodeid, future.exception() or future.result()) for nodeid, future in futures])
+
+    @staticmethod
+    def _sFailed(response):
+        """Whether a response is an error payload rather than the requested data.
+
+        Parameters
+            response: json returned by the master
+        Returns
+            bool
+        """
+        return not isinstance(response, dict) or response.get('status') not in (None, 'success')
+
+    @staticmethod
+    def _sStatusmsg(response):
+        """Reason a response failed.
+
+        Parameters
+            response: json returned by the master, or an exception
+        Returns
+            string
+        """
+        if isinstance(response, Exception):
+            return str(response) or response.__class__.__name__
+        return response.get('statusmsg', 'unknown error') if isinstance(response, dict) else 'unexpected response'
+
+    @staticmethod
+    def _sNodeListError(response):
+        """Result of a fleet sweep whose node listing failed.
+
+        Parameters
+            response: json returned by listNodesById
+        Returns
+            dictionary with status error, no virtualservers and the failure under errors
+        """
+        statusmsg = SolusVM._sStatusmsg(response)
+        return {
+            'status': 'error',
+            'statusmsg': statusmsg,
+            'virtualservers': [],
+            'nodes': [],
+            'errors': {'nodes': statusmsg}
+        }
+
+    @staticmethod
+    def _sNodeIds(response):
+        """Parses node ids out of a node-idlist response.
+
+        Parameters
+            response: json returned by listNodesById
+        Returns
+            list of node ids
+        """
+        nodes = response.get('nodes') or ''
+        if isinstance(nodes, list):
+            return [str(node['id']) for node in nodes]
+        return [nodeid.strip() for nodeid in nodes.split(',') if nodeid.strip()]
+
+    @staticmethod
+    def _sMergeVirtualServers(results):
+        """Merges per-node node-virtualservers responses.
+
+        Parameters
+            results: list of (nodeid, json or exception) tuples
+        Returns
+            dictionary of merged virtualservers, ids of the nodes swept and errors keyed by nodeid
+        """
+        virtualservers = []
+        errors = {}
+
+        for nodeid, result in results:
+            if isinstance(result, Exception):
+                errors[nodeid] = str(result) or result.__class__.__name__
+            elif result.get('status') != 'success':
+                errors[nodeid] = result.get('statusmsg', 'unknown error')
+            else:
+                virtualservers.extend(result.get('virtualservers') or [])
+
+        return {
+            'status': 'success',
+            'virtualservers': virtualservers,
+            'nodes': [nodeid for nodeid, _ in results],
+            'errors': errors
+        }
+
+    def diablePXE(self, vserverid):
+        """Disables PXE on specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Disable+PXE
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-network-disable',
+            'vserverid': vserverid
+        })
+
+    def enablePXE(self, vserverid):
+        """Enables PXE on specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Enable+PXE
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-network-enable',
+            'vserverid': vserverid
+        })
+
+    def enableTUN(self, vserverid):
+        """Enables TUN/TAP on specified virtual server.
+
+            https://documentation.solusvm.com/pages/viewpage.action?pageId=558498
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-tun-enable',
+            'vserverid': vserverid
+        })
+
+    def disableTUN(self, vserverid):
+        """Disables TUN/TAP on specified virtual server.
+
+            https://documentation.solusvm.com/pages/viewpage.action?pageId=558494
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-tun-disable',
+            'vserverid': vserverid
+        })
+
+    def togglePAE(self, vserverid, pae):
+        """Toggles PAE for specified virtual server.
+
+            https://documentation.solusvm.com/pages/viewpage.action?pageId=558505
+
+        Parameters
+            vserverid: id of virtual server
+            pae: on|off
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-pae',
+            'vserverid': vserverid,
+            'pae':pae
+        })
+
+    def shutdownVirtualServer(self, vserverid):
+        """Shuts down specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Shutdown+Virtual+Server
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-shutdown',
+            'vserverid': vserverid
+        })
+
+    def terminateVirtualServer(self, vserverid, deleteclient=False):
+        """Deletes specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Terminate+Virtual+Server
+
+        Parameters
+            vserverid: id of virtual server
+            deleteclient: whether or not to delete client too
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-terminate',
+            'vserverid': vserverid,
+            'deleteclient': deleteclient
+        })
+
+    def changeVNCPassword(self, vserverid, vncpassword):
+        """Updates VNC password for specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Change+VNC+Password
+
+        Parameters
+            vserverid: id of virtual server
+            vncpassword: new password
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-vncpass',
+            'vserverid': vserverid,
+            'vncpassword': vncpassword
+        })
+
+    def vncInfo(self, vserverid):
+        """Retrieves VNC information for specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/VNC+Info
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-vnc',
+            'vserverid': vserverid
+        })
+
+    def suspendVirtualServer(self, vserverid):
+        """Suspends specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Suspend+Virtual+Server
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-suspend',
+            'vserverid':vserverid
+        })
+
+    def unsuspendVirtualServer(self, vserverid):
+        """Unsuspends specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Unsuspend+Virtual+Server
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-unsuspend',
+            'vserverid': vserverid
+        })
+
+    def virtualServerStatus(self, vserverid, fields=None):
+        """Retrieves status of specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Virtual+Server+Status
+
+        Parameters
+            vserverid: id of virtual server
+            fields: fields to return besides status and statusmsg, or None for all
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-status',
+            'vserverid': vserverid
+        }, fields)
+
+    def changeRootPassword(self, vserverid, rootpassword):
+        """Retrieves status of specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Change+Root+Password
+
+        Parameters
+            vserverid: id of virtual server
+            rootpassword: new root password
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-rootpassword',
+            'vserverid': vserverid,
+            'rootpassword': rootpassword
+        })
+
+    def rebuildVirtualServer(self, vserverid, template):
+        """Rebuilds specified virtual server with specified template.
+
+            https://documentation.solusvm.com/display/DOCS/Rebuild+Virtual+Server
+
+        Parameters
+            vserverid: id of virtual server
+            template: template filename without extension
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-rebuild',
+            'vserverid': vserverid,
+            'template': template
+        })
+
+    def changeHostname(self, vserverid, hostname):
+        """Updates specified virtual server's hostname.
+
+            https://documentation.solusvm.com/display/DOCS/Change+Hostname
+
+        Parameters
+            vserverid: id of virtual server
+            hostname: new hostname
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-hostname',
+            'vserverid': vserverid,
+            'hostname': hostname
+        })
+
+    def rebootVirtualServer(self, vserverid):
+        """Reboots specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Reboot+Virtual+Server
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-reboot',
+            'vserverid': vserverid
+        })
+
+    def unmountISO(self, vserverid):
+        """Unmounts ISO from specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Unmount+ISO
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-unmountiso',
+            'vserverid': vserverid
+        })
+
+    def mountISO(self, vserverid, iso):
+        """Mounts specified ISO to specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Mount+ISO
+
+        Parameters
+            vserverid: id of virtual server
+            iso: filename of iso
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-mountiso',
+            'vserverid': vserverid,
+            'iso': iso
+        })
+
+    def checkVirtualServerExists(self, vserverid):
+        """Checks if specified virtual server exists.
+
+            https://documentation.solusvm.com/display/DOCS/Check+Exists
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-checkexists',
+            'vserverid': vserverid
+        })
+
+    def virtualServerState(self, vserverid, nostatus=False, nographs=False, fields=None):
+        """Retrieves information about specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Virtual+Server+State
+
+            When fields are given the master skips the status unless state is among
+            them, and the graphs unless a graph field is.
+
+        Parameters
+            vserverid: id of virtual server
+            nostatus: whether or not to retrieve status
+            nographs: whether or not to generate graphs
+            fields: fields to return besides status and statusmsg, or None for all
+        Returns
+            json
+        """
+        if fields is not None:
+            fields = frozenset(fields)
+            nostatus = nostatus or 'state' not in fields
+            nographs = nographs or not fields & GRAPH_FIELDS
+
+        return self._sQuery({
+            'action': 'vserver-infoall',
+            'vserverid': vserverid,
+            'nostatus': nostatus,
+            'nographs': nographs
+        }, fields)
+
+    def virtualServerInfo(self, vserverid, fields=None):
+        """Retrieves information about specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Virtual+Server+Information
+
+        Parameters
+            vserverid: id of virtual server
+            fields: fields to return besides status and statusmsg, or None for all
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-info',
+            'vserverid': vserverid
+        }, fields)
+
+    def virtualServerFields(self, vserverid, fields):
+        """Retrieves only the requested fields of specified virtual server through the cheapest action.
+
+            virtualServerFields(101, ['statusmsg'])            # vserver-status
+            virtualServerFields(101, ['hostname', 'template'])  # vserver-info
+            virtualServerFields(101, ['state', 'plan'])         # vserver-infoall without graphs
+
+            Fields are matched against PROJECTIONS; hdd and memory are the vserver-info
+            values when that action covers every requested field.
+
+        Parameters
+            vserverid: id of virtual server
+            fields: fields to return besides status and statusmsg
+        Returns
+            json
+        """
+        fields = frozenset(fields)
+        if fields <= PROJECTIONS[0][1]:
+            return self.virtualServerStatus(vserverid, fields)
+        if fields <= PROJECTIONS[1][1]:
+            return self.virtualServerInfo(vserverid, fields)
+        return self.virtualServerState(vserverid, fields=fields)
+
+    def deleteIPAddress(self, vserverid, ipaddr):
+        """Removes specified IP Address from specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Delete+IP+Address
+
+        Parameters
+            vserverid: id of virtual server
+            ipaddr: ip address
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-delip',
+            'vserverid': vserverid,
+            'ipaddr': ipaddr
+        })
+
+    def toggleSerialConsole(self, vserverid, access=None, time=None):
+        """Retrieves, enables or disables serial console for specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Serial+Console
+
+        Parameters
+            vserverid: id of virtual server
+            access: enable|disable
+            time: 1|2|3|4|5|6|7|8
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-console',
+            'vserverid': vserverid,
+            'time': time,
+            'access': access
+        })
+
+    def changePlan(self, vserverid, plan):
+        """Changes specified virtual server's plan.
+
+            https://documentation.solusvm.com/display/DOCS/Change+Plan
+
+        Parameters
+            vserverid: id of virtual server
+            plan: new plan name
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-change',
+            'vserverid': vserverid,
+            'plan':plan
+        })
+
+    def changeOwner(self, vserverid, clientid):
+        """Changes specified virtual server's owner.
+
+            https://documentation.solusvm.com/display/DOCS/Change+Owner
+
+        Parameters
+            vserverid: id of virtual server
+            clientid: new clients id
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-changeowner',
+            'vserverid': vserverid,
+            'clientid': clientid
+        })
+
+    def changeBootOrder(self, vserverid, bootorder):
+        """Changes specified virtual server's boot order.
+
+            https://documentation.solusvm.com/display/DOCS/Change+Boot+Order
+
+        Parameters
+            vserverid: id of virtual server
+            bootorder: cd|dc|c|d (c=CDROM, d=HDD)
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-bootorder',
+            'vserverid': vserverid,
+            'bootorder': bootorder
+        })
+
+
+    def changeBandwidthLimits(self, vserverid, limit, overlimit):
+        """Changes specified virtual server's bandwidth limits.
+
+            https://documentation.solusvm.com/display/DOCS/Change+Bandwidth+Limits
+
+        Parameters
+            vserverid: id of virtual server
+            limit: bandwidth limit in Gb
+            overlimit: bandwidth overlimit in Gb
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-bandwidth',
+            'vserverid': vserverid,
+            'limit': limit,
+            'overlimit': overlimit
+        })
+
+    def changeMemory(self, vserverid, memory):
+        """Changes specified virtual server's allocated memory.
+
+            https://documentation.solusvm.com/display/DOCS/Change+Memory
+
+        Parameters
+            vserverid: id of virtual server
+            memory: amount in Mb
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-change-memory',
+            'vserverid': vserverid,
+            'memory': memory
+        })
+
+    def changeCPU(self, vserverid, cpu):
+        """Changes specified virtual server's number of CPU cores.
+
+            https://documentation.solusvm.com/display/DOCS/Change+CPU
+
+        Parameters
+            vserverid: id of virtual server
+            cpu: number of cpu cores [1-128]
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-change-cpu',
+            'vserverid': vserverid,
+            'cpu': cpu,
+        })
+
+    def changeHDD(self, vserverid, hdd):
+        """Changes specified virtual server's hard disk size.
+
+            https://documentation.solusvm.com/display/DOCS/Change+Hard+Disk+Size
+
+        Parameters
+            vserverid: id of virtual server
+            hdd: hard disk size in Gb
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-change-hdd',
+            'vserverid': vserverid,
+            'hdd': hdd,
+        })
+
+
+    def addIPAddress(self, vserverid):
+        """Adds an IP address to specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Add+IP+Address
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-addip',
+            'vserverid': vserverid
+        })
+
+    def bootVirtualServer(self, vserverid):
+        """Boots specified virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Boot+Virtual+Server
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'vserver-boot',
             'vserverid': vserverid
         })
 
-    def mountISO(self, vserverid, iso):
-        """Mounts specified ISO to specified virtual server.
+    def createVirtualServer(self, kwargs):
+        """Creates virtual server.
+
+            https://documentation.solusvm.com/display/DOCS/Create+Virtual+Server
+
+        Parameters
+            data: dictionary parameter pairs
+        Returns
+            json
+        """
+        return self._sQuery(dict(kwargs, action='vserver-create'))
+
+    def listNodesById(self, vtype='kvm'):
+        """Lists Nodes by their ID.
+
+            https://documentation.solusvm.com/display/DOCS/List+Nodes+by+ID
+
+        Parameters
+            vtype: openvz|xen|xen hvm|kvm
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'node-idlist',
+            'type': vtype
+        })
+
+    def listNodesByName(self, vtype='kvm'):
+        """List nodes by name.
+
+            https://documentation.solusvm.com/display/DOCS/List+Nodes+by+Name
+
+        Parameters
+            vtype: openvz|xen|xen hvm|kvm
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'listnodes',
+            'type': vtype
+        })
+
+    def listISO(self, vtype='kvm'):
+        """Lists available ISO images.
+
+            https://documentation.solusvm.com/display/DOCS/List+ISO+Images
+
+        Parameters
+            vtype: xen hvm|kvm
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'listiso',
+            'type': vtype
+        })
+
+    def listNodeGroups(self, vtype='kvm'):
+        """List node groups.
+
+            https://documentation.solusvm.com/display/DOCS/List+Node+Groups
+
+        Parameters
+            vtype: xen hvm|kvm
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'listnodegroups',
+            'type': vtype
+        })
+
+    def listNodesIPAddresses(self, nodeid):
+        """List all IP addresses for a node.
+
+            https://documentation.solusvm.com/display/DOCS/List+All+IP+Addresses+for+a+Node
+
+        Parameters
+            nodeid: id of node
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'node-iplist',
+            'nodeid': nodeid
+        })
+
+    def listPlans(self, vtype='kvm'):
+        """List plans.
+
+            https://documentation.solusvm.com/display/DOCS/List+Plans
+
+        Parameters
+            vtype: openvz|xen|xen hvm|kvm
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'listplans',
+            'type': vtype
+        })
+
+    def listTemplates(self, vtype='kvm'):
+        """List templates.
+
+            https://documentation.solusvm.com/display/DOCS/List+Templates
+
+        Parameters
+            vtype: openvz|xen|xen hvm|kvm
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'listtemplates',
+            'type': vtype
+        })
+
+    def iterNodesIPAddresses(self, nodeid):
+        """Streams all IP addresses for a node, decoding one at a time.
+
+            https://documentation.solusvm.com/display/DOCS/List+All+IP+Addresses+for+a+Node
+
+        Parameters
+            nodeid: id of node
+        Returns
+            generator of ip address json
+        """
+        return self._sStream({
+            'action': 'node-iplist',
+            'nodeid': nodeid
+        }, 'ips')
+
+    def xenNodeResources(self, nodeid):
+        """Retrieve resource count from specified xen node.
+
+            https://documentation.solusvm.com/display/DOCS/Xen+Node+Resources
+
+        Parameters
+            nodeid: id of node
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'node-xenresources',
+            'nodeid': nodeid
+        })
+
+    def nodeStatistics(self, nodeid):
+        """Retrieve statistics for specified node.
+
+            https://documentation.solusvm.com/display/DOCS/Node+Statistics
+
+        Parameters
+            nodeid: id of node
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'node-statistics',
+            'nodeid': nodeid
+        })
+
+    def clientAuthenticate(self, username, password):
+        """Authenticates specified username and password.
+
+            https://documentation.solusvm.com/display/DOCS/Client+Authenticate
+
+        Parameters
+            username:
+            password:
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'client-authenticate',
+            'username': username,
+            'password': password
+        })
+
+    def clientExists(self, username):
+        """Checks to see if the specified client exists.
+
+            https://documentation.solusvm.com/display/DOCS/Check+if+Client+Exists
+
+
+        Parameters
+            username:
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'client-checkexists',
+            'username': username
+        })
+
+    def createClient(self, username, password, email, firstname, lastname, company):
+        """Creates a client.
+
+            https://documentation.solusvm.com/pages/viewpage.action?pageId=558430
+
+        Parameters
+            username:
+            password:
+            email:
+            firstname:
+            lastname:
+            company:
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'client-create',
+            'username': username,
+            'password': password,
+            'email': email,
+            'firstname': firstname,
+            'lastname': lastname,
+            'company': company
+        })
+
+    def changeClientPassword(self, username, password):
+        """Updates the specified client's password.
+
+            https://documentation.solusvm.com/display/DOCS/Change+Client+Password
+
+        Parameters
+            username:
+            password:
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'client-updatepassword',
+            'username': username,
+            'password': password
+        })
+
+    def changeClientUsername(self, username, newusername):
+        """Updates the specified client's password.
+
+            https://documentation.solusvm.com/display/DOCS/Change+Client+Username
+
+        Parameters
+            username: old username
+            newusername: new username
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'client-change-username',
+            'username': username,
+            'newusername': newusername
+        })
+
+    def listClients(self):
+        """Lists all clients.
+
+            https://documentation.solusvm.com/display/DOCS/List+Clients
+
+        Parameters
+            None
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action':'client-list'
+        })
+
+    def iterClients(self):
+        """Streams all clients, decoding one at a time.
+
+            https://documentation.solusvm.com/display/DOCS/List+Clients
+
+        Parameters
+            None
+        Returns
+            generator of client json
+        """
+        return self._sStream({
+            'action':'client-list'
+        }, 'clients')
+
+    def deleteClient(self, username):
+        """Deletes specified client.
+
+            https://documentation.solusvm.com/display/DOCS/Delete+Client
+
+        Parameters
+            username:
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'client-delete',
+            'username': username
+        })
+
+    def editClient(self, username, kwargs):
+        """Edits specified client.
+
+            https://documentation.solusvm.com/display/DOCS/Edit+Client
+
+        Parameters
+            username:
+            *firsntame
+            *lastname
+            *company
+            *email
+        Returns
+            json
+        """
+        return self._sQuery(dict(kwargs, action='client-edit', username=username))
+
+    def deleteReseller(self, username):
+        """Deletes specified reseller.
+
+            https://documentation.solusvm.com/display/DOCS/Delete+Reseller
+
+        Parameters
+            username:
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'reseller-delete',
+            'username': username
+        })
+
+    def resellerInfo(self, username):
+        """Retrieves details of specified reseller.
+
+            https://documentation.solusvm.com/display/DOCS/Reseller+Information
+
+        Parameters
+            username:
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action': 'reseller-info',
+            'username': username
+        })
+
+    def listResellers(self):
+        """Lists all resellers.
+
+            https://documentation.solusvm.com/display/DOCS/List+Resellers
+
+        Parameters
+            None
+        Returns
+            json
+        """
+        return self._sQuery({
+            'action':'reseller-list'
+        })
+
+    def createReseller(self, kwargs):
+        """Creates reseller.
+
+            https://documentation.solusvm.com/display/DOCS/Create+Reseller
+
+        Parameters
+            data: dictionary key/value pairs
+        Returns
+            json
+        """
+        return self._sQuery(dict(kwargs, action='reseller-create'))
+
+    def modifyResellerResources(self, username, kwargs):
+        """Modifies reseller's available resources.
+
+            https://documentation.solusvm.com/display/DOCS/Modify+Reseller+Resources
+
+        Parameters
+            username:
+            data: dictionary key/value pairs
+        Returns
+            json
+        """
+        return self._sQuery(dict(kwargs, action='reseller-modifyresources', username=username))
+
+
+class AsyncSolusVM(SolusVM):
+    def __init__(self, base_url, api_id, api_key, max_concurrency=100, pool_maxsize=100, **options):
+        """SolusVM asyncio JSON API Library constructor.
+
+        Exposes the same methods as SolusVM, each returning a coroutine.
+        Requires aiohttp.
+
+        Parameters
+            base_url: SolusVM base_url
+            api_id: SolusVM API authentiction ID hash
+            api_key: SolusVM API authentication key hash
+            max_concurrency: maximum number of requests in flight at once
+            pool_maxsize: maximum number of keep-alive connections to the master
+            options: any further SolusVM keyword options; a transport given here runs on the default executor
+        Returns
+            None
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncSolusVM requires aiohttp')
+
+        self.max_concurrency = max_concurrency
+        SolusVM.__init__(self, base_url, api_id, api_key, pool_maxsize=pool_maxsize, **options)
+
+    def _sOpen(self, pool_connections, pool_maxsize, pool_block):
+        """Defers creating the aiohttp session until inside the running loop.
+
+        Parameters
+            pool_connections: unused
+            pool_maxsize: maximum number of keep-alive connections to the master
+            pool_block: unused
+        Returns
+            None
+        """
+        self.pool_maxsize = pool_maxsize
+        self.session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def __enter__(self):
+        raise TypeError('use "async with" with AsyncSolusVM')
+
+    async def close(self):
+        """Closes pooled connections to the SolusVM master.
+
+        Parameters
+            None
+        Returns
+            None
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.transport is not None:
+            self.transport.close()
+
+    def _sSession(self):
+        """Returns the aiohttp session, creating it inside the running loop on first use.
+
+        Parameters
+            None
+        Returns
+            aiohttp.ClientSession
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_maxsize),
+                headers={'Accept-Encoding': ACCEPT_ENCODING},
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        return self.session
+
+    async def _sQuery(self, kwargs, fields=None):
+        """Queries specified SolusVM API with specified query string.
+
+        Parameters
+            kwargs: dictionary GET vars
+            fields: top level fields to keep besides status and statusmsg, or None for all
+        Returns
+            json
+        """
+        with self._sSpan(kwargs):
+            return self._sModel(kwargs, self._sProject(await self._sCached(kwargs), fields))
+
+    async def _sCached(self, kwargs):
+        """Queries specified SolusVM API, answering catalogue actions from the cache when possible.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            json
+        """
+        cachekey = self._sCacheKey(kwargs)
+        if cachekey is not None:
+            result = self.cache.get(cachekey)
+            if self.metrics is not None:
+                self.metrics.cache(kwargs['action'], result is not None)
+            if result is not None:
+                return result
+
+        try:
+            result = await self._sCoalesce(kwargs)
+        except Exception:
+            self._sCacheStore(kwargs, cachekey, None)
+            raise
+
+        self._sCacheStore(kwargs, cachekey, result)
+        return result
+
+    async def _sCoalesce(self, kwargs):
+        """Sends specified query, sharing the response with identical read queries already in flight.
+
+            Callers that joined a flight receive their own copy, so results stay safe to mutate.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            json
+        """
+        if not self.coalesce or kwargs.get('action') not in READ_ACTIONS:
+            return await self._sFetch(kwargs)
+
+        flightkey = self._sParamsKey(kwargs)
+        flight = self._inflight.get(flightkey)
+        if flight is not None:
+            if self.metrics is not None:
+                self.metrics.coalesce(kwargs['action'])
+            return copy.deepcopy(await asyncio.shield(flight))
+
+        flight = self._inflight[flightkey] = asyncio.get_running_loop().create_future()
+        try:
+            flight.set_result(await self._sFetch(kwargs))
+        except Exception as e:
+            flight.set_exception(e)
+            # mark retrieved so a flight without followers does not log a warning
+            flight.exception()
+        finally:
+            del self._inflight[flightkey]
+
+        return flight.result()
+
+    async def _sFetch(self, kwargs):
+        """Sends specified query to the SolusVM API, retrying read actions on transport failures.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            json
+        """
+        attempts = self._sAttempts(kwargs)
+        for attempt in range(attempts):
+            if self.scheduler is not None:
+                # RequestScheduler blocks, so wait for it off the event loop
+                await asyncio.get_running_loop().run_in_executor(None, self.scheduler.acquire, kwargs.get('action'))
+
+            if not self.breaker.allow():
+                raise CircuitOpenError('circuit open for '+self.base_url)
+
+            try:
+                result = await self._sSend(kwargs)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError, asyncio.TimeoutError,
+                    requests.ConnectionError, requests.Timeout, requests.HTTPError):
+                # transports raise the requests exceptions, the aiohttp session its own
+                self.breaker.record(False)
+                if attempt + 1 == attempts:
+                    raise
+                if self.metrics is not None:
+                    self.metrics.retry(kwargs.get('action'))
+                await asyncio.sleep(self._sBackoff(attempt))
+            except Exception:
+                # undecodable responses and other failures still settle a trial call
+                self.breaker.record(False)
+                raise
+            else:
+                self.breaker.record(True)
+                return result
+
+    async def _sSend(self, kwargs):
+        """Sends specified query to the SolusVM API once.
+
+        Parameters
+            kwargs: dictionary GET vars
+        Returns
+            json
+        """
+        url, query = self._sRequest(kwargs)
+        if self.transport is not None:
+            return await self._sTransportSend(kwargs, url, query)
+
+        session = self._sSession()
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                async with session.get(yarl.URL(url+'?'+query, encoded=True)) as response:
+                    if response.status >= 500:
+                        response.raise_for_status()
+                    body = await response.read()
+                    nbytes = _wireBytes(response, len(body))
+                result = self._sDecode(kwargs, query, body)
+            except Exception:
+                self._sObserve(kwargs, started, 0, None)
+                raise
+
+            self._sObserve(kwargs, started, nbytes, result)
+            return result
+
+    async def _sTransportSend(self, kwargs, url, query):
+        """Sends specified query once through the blocking transport on the default executor.
+
+        Parameters
+            kwargs: dictionary GET vars
+            url: API url
+            query: encoded query string
+        Returns
+            json
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                response = await asyncio.get_running_loop().run_in_executor(
+                    None, self.transport.send, url, query, (self.connect_timeout, self.read_timeout)
+                )
+                if response.status_code >= 500:
+                    response.raise_for_status()
+                result = self._sDecode(kwargs, query, response.content)
+            except Exception:
+                self._sObserve(kwargs, started, 0, None)
+                raise
+
+            self._sObserve(kwargs, started, _wireBytes(response, len(response.content)), result)
+            return result
+
+    async def _sStream(self, kwargs, key):
+        """Streams the elements of one array from the specified query's response.
+
+            Streamed queries bypass the cache, coalescing and retries.
+
+        Parameters
+            kwargs: dictionary GET vars
+            key: name of the array within the response
+        Returns
+            async generator of json
+        """
+        if self.scheduler is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.scheduler.acquire, kwargs.get('action'))
+
+        if not self.breaker.allow():
+            raise CircuitOpenError('circuit open for '+self.base_url)
+
+        url, query = self._sRequest(kwargs)
+        if self.transport is not None:
+            try:
+                result = await self._sTransportSend(kwargs, url, query)
+            except Exception:
+                self.breaker.record(False)
+                raise
+            self.breaker.record(True)
+
+            model = MODELS[kwargs['action']][1] if self.models and kwargs.get('action') in MODELS else None
+            for record in result.get(key) or []:
+                yield model(record) if model and isinstance(record, dict) else record
+            return
+
+        session = self._sSession()
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                response = await session.get(yarl.URL(url+'?'+query, encoded=True))
+                if response.status >= 500:
+                    response.raise_for_status()
+            except Exception:
+                self.breaker.record(False)
+                self._sObserve(kwargs, started, 0, None)
+                raise
+            self.breaker.record(True)
+
+            model = MODELS[kwargs['action']][1] if self.models and kwargs.get('action') in MODELS else None
+            nbytes = 0
+            async with response:
+                stream = JSONArrayStream(key)
+                try:
+                    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                        nbytes += len(chunk)
+                        for record in stream.feed(chunk):
+                            yield model(record) if model and isinstance(record, dict) else record
+                    stream.close()
+                except Exception:
+                    self._sObserve(kwargs, started, _wireBytes(response, nbytes), None)
+                    raise
+            self._sObserve(kwargs, started, _wireBytes(response, nbytes), {})
+
+    async def listAllVirtualServers(self, vtype='kvm'):
+        """Lists virtual servers allocated on every node, querying nodes concurrently.
+
+            A node that fails to respond is reported in errors rather than aborting the sweep.
+            If the node listing itself fails the result has status error.
+
+        Parameters
+            vtype: openvz|xen|xen hvm|kvm
+        Returns
+            dictionary of merged virtualservers, ids of the nodes swept and errors keyed by nodeid, or by 'nodes'
+        """
+        nodes = await self.listNodesById(vtype)
+        if self._sFailed(nodes):
+            return self._sNodeListError(nodes)
+        nodeids = self._sNodeIds(nodes)
+        results = await asyncio.gather(*[self.listVirtualServers(nodeid) for nodeid in nodeids], return_exceptions=True)
+        return self._sMergeVirtualServers(list(zip(nodeids, results)))
+
+    async def batch(self, method, items, max_workers=None, rate=None):
+        """Runs a single virtual server method against many virtual servers concurrently.
+
+            await batch('suspendVirtualServer', [101, 102])
+            await batch('changeBandwidthLimits', [(101, 500, 50), (102, 1000, 100)])
+
+        Parameters
+            method: name of a SolusVM method taking vserverid as its first argument
+            items: iterable of vserverids or (vserverid, *args) tuples
+            max_workers: maximum number of requests in flight at once, or None for max_concurrency
+            rate: maximum number of requests started per second, or None for no cap
+        Returns
+            dictionary of results and errors, each ordered by items and keyed by vserverid
+        """
+        call = getattr(self, method)
+        items = self._sBatchItems(items)
+        bucket = TokenBucket(rate) if rate else None
+        semaphore = asyncio.Semaphore(max_workers or self.max_concurrency)
+
+        async def run(args):
+            async with semaphore:
+                if bucket:
+                    await asyncio.sleep(bucket.reserve())
+                return await call(*args)
+
+        outcomes = await asyncio.gather(*[run(args) for vserverid, args in items], return_exceptions=True)
+
+        results = collections.OrderedDict()
+        errors = collections.OrderedDict()
+
+        for (vserverid, args), outcome in zip(items, outcomes):
+            if isinstance(outcome, Exception):
+                errors[vserverid] = outcome
+            else:
+                results[vserverid] = outcome
+
+        return {
+            'results': results,
+            'errors': errors
+        }
+
+
+class SolusVMCluster:
+    # Methods fanned out to every master and merged.
+    FANOUT = frozenset([
+        'listAllVirtualServers',
+        'listClients',
+        'listISO',
+        'listNodeGroups',
+        'listNodesById',
+        'listNodesByName',
+        'listPlans',
+        'listResellers',
+        'listTemplates'
+    ])
+
+    def __init__(self, masters, max_workers=16, refresh_interval=60, vtypes=VTYPES):
+        """Client spanning several SolusVM masters.
+
+            Methods taking a vserverid or nodeid are routed to the owning master via an
+            index built by refreshIndex() over every type in vtypes. Methods in FANOUT query
+            every master concurrently and merge the results. An id present on several
+            masters is ambiguous and raises SolusVMError rather than being routed; call such
+            ids on a client from masters.
+
+        Parameters
+            masters: iterable of SolusVM clients
+            max_workers: maximum number of masters queried at once
+            refresh_interval: minimum seconds between index refreshes triggered by unknown ids
+            vtypes: virtualization types to index, from VTYPES
+        Returns
+            None
+        """
+        self.masters = collections.OrderedDict((master.base_url, master) for master in masters)
+        self.refresh_interval = refresh_interval
+        self.vtypes = tuple(vtypes)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+        self.vservers = {}
+        self.nodes = {}
+        self.refreshed = None
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Closes every master and the worker pool.
+
+        Parameters
+            None
+        Returns
+            None
+        """
+        self.executor.shutdown()
+        for master in self.masters.values():
+            master.close()
+
+    def fanout(self, method, *args, **kwargs):
+        """Calls specified method on every master concurrently.
+
+        Parameters
+            method: name of a SolusVM method
+            args: positional arguments for method
+            kwargs: keyword arguments for method
+        Returns
+            ordered dictionary of base_url to json, or to the raised exception
+        """
+        futures = [(base_url, self.executor.submit(getattr(master, method), *args, **kwargs)) for base_url, master in self.masters.items()]
+        return collections.OrderedDict((base_url, future.exception() or future.result()) for base_url, future in futures)
+
+    @staticmethod
+    def _sMerge(results):
+        """Merges per-master responses, tagging records with the master they came from.
+
+            Lists are concatenated, comma separated strings are joined and dictionaries
+            are combined under (base_url, key) keys.
+
+        Parameters
+            results: ordered dictionary of base_url to json or exception
+        Returns
+            dictionary of merged json and errors keyed by base_url
+        """
+        merged = {'status': 'success'}
+        errors = {}
+
+        for base_url, result in results.items():
+            if isinstance(result, Exception):
+                errors[base_url] = str(result) or result.__class__.__name__
+                continue
+            if result.get('status') != 'success':
+                errors[base_url] = result.get('statusmsg', 'unknown error')
+                continue
+
+            for key, value in result.items():
+                if key in ('status', 'statusmsg'):
+                    continue
+                if isinstance(value, list):
+                    merged.setdefault(key, []).extend(dict(item, master=base_url) if isinstance(item, dict) else item for item in value)
+                elif isinstance(value, dict):
+                    merged.setdefault(key, {}).update(((base_url, k), v) for k, v in value.items())
+                elif value:
+                    merged[key] = merged[key]+','+str(value) if merged.get(key) else str(value)
+
+        merged.setdefault('errors', {}).update(errors)
+        return merged
+
+    def refreshIndex(self, vtypes=None):
+        """Rebuilds the vserverid and nodeid to master index from every master and virtualization type.
+
+            Every (master, vtype) sweep runs concurrently and the results are merged into one
+            index. Refreshes are serialized, so concurrent callers do not sweep the masters at once.
+
+        Parameters
+            vtypes: virtualization types to index, or None for the cluster's vtypes
+        Returns
+            dictionary of vtype to errors keyed by base_url, or by (base_url, nodeid) for failed
+            nodes; vtypes without errors are left out
+        """
+        vtypes = self.vtypes if vtypes is None else tuple(vtypes)
+        with self.refresh_lock:
+            futures = [
+                (vtype, base_url, self.executor.submit(master.listAllVirtualServers, vtype))
+                for vtype in vtypes for base_url, master in self.masters.items()
+            ]
+            results = collections.OrderedDict((vtype, collections.OrderedDict()) for vtype in vtypes)
+            for vtype, base_url, future in futures:
+                results[vtype][base_url] = future.exception() or future.result()
+
+            # each id maps to every master reporting it; more than one makes it ambiguous
+            vservers = {}
+            nodeids = {}
+            for swept in results.values():
+                for base_url, result in swept.items():
+                    if SolusVM._sFailed(result):
+                        continue
+                    for nodeid in result.get('nodes', []):
+                        owners = nodeids.setdefault(str(nodeid), [])
+                        if base_url not in owners:
+                            owners.append(base_url)
+                    for vserver in result.get('virtualservers', []):
+                        if 'vserverid' in vserver:
+                            owners = vservers.setdefault(str(vserver['vserverid']), [])
+                            if base_url not in owners:
+                                owners.append(base_url)
+
+            with self.lock:
+                self.vservers = vservers
+                self.nodes = nodeids
+                self.refreshed = time.monotonic()
+
+        errors = {}
+        for vtype, swept in results.items():
+            failed = self._sMerge(swept)['errors']
+            if failed:
+                errors[vtype] = failed
+        return errors
+
+    def master(self, vserverid=None, nodeid=None):
+        """Finds the master owning specified virtual server or node, refreshing the index on a miss.
+
+        Parameters
+            vserverid: id of virtual server
+            nodeid: id of node
+        Returns
+            SolusVM
+        """
+        kind, key = ('vserver', str(vserverid)) if vserverid is not None else ('node', str(nodeid))
+        index = self.vservers if kind == 'vserver' else self.nodes
+
+        if key not in index:
+            # one refresh at a time; callers that waited find the index already fresh
+            with self.refresh_lock:
+                with self.lock:
+                    stale = self.refreshed is None or time.monotonic() - self.refreshed >= self.refresh_interval
+                if stale:
+                    self.refreshIndex()
+            index = self.vservers if kind == 'vserver' else self.nodes
+
+        owners = index.get(key)
+        if not owners:
+            raise SolusVMError('no master found for '+kind+' '+key)
+        if len(owners) > 1:
+            raise SolusVMError(kind+' '+key+' is ambiguous, found on masters '+', '.join(owners))
+        return self.masters[owners[0]]
+
+    def __getattr__(self, name):
+        """Routes SolusVM methods to the owning master, or fans out list methods.
+
+        Parameters
+            name: name of a SolusVM method
+        Returns
+            callable
+        """
+        if name in self.FANOUT:
+            return lambda *args, **kwargs: self._sMerge(self.fanout(name, *args, **kwargs))
+
+        method = getattr(SolusVM, name, None)
+        if name.startswith('_') or method is None:
+            raise AttributeError(name)
+
+        params = list(inspect.signature(method).parameters)[1:2]
+        if params == ['vserverid']:
+            return lambda vserverid, *args, **kwargs: getattr(self.master(vserverid=vserverid), name)(vserverid, *args, **kwargs)
+        if params == ['nodeid']:
+            return lambda nodeid, *args, **kwargs: getattr(self.master(nodeid=nodeid), name)(nodeid, *args, **kwargs)
+
+        raise AttributeError(name+' cannot be routed; call it on a client from masters')
+
+
+class Inventory:
+    def __init__(self, client, path=':memory:', max_workers=16):
+        """Local SQLite index of nodes, virtual servers, IP addresses and clients.
+
+            sync() refreshes it from the master, writing only rows that changed; lookups
+            are answered locally and keep working while the master is unreachable.
+
+        Parameters
+            client: SolusVM client
+            path: database file path, or ':memory:'
+            max_workers: maximum number of nodes queried at once during sync
+        Returns
+            None
+        """
+        self.client = client
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS nodes (nodeid TEXT PRIMARY KEY, synced REAL);
+            CREATE TABLE IF NOT EXISTS vservers (vserverid TEXT PRIMARY KEY, nodeid TEXT, clientid TEXT, ipaddress TEXT, record TEXT);
+            CREATE INDEX IF NOT EXISTS vservers_nodeid ON vservers (nodeid);
+            CREATE INDEX IF NOT EXISTS vservers_clientid ON vservers (clientid);
+            CREATE INDEX IF NOT EXISTS vservers_ipaddress ON vservers (ipaddress);
+            CREATE TABLE IF NOT EXISTS ips (ipaddress TEXT PRIMARY KEY, nodeid TEXT, vserverid TEXT, record TEXT);
+            CREATE INDEX IF NOT EXISTS ips_nodeid ON ips (nodeid);
+            CREATE TABLE IF NOT EXISTS clients (clientid TEXT PRIMARY KEY, username TEXT, record TEXT);
+            CREATE INDEX IF NOT EXISTS clients_username ON clients (username);
+        """)
+
+    def close(self):
+        """Closes the database.
+
+        Parameters
+            None
+        Returns
+            None
+        """
+        self.db.close()
+
+    @staticmethod
+    def _sRecords(response, key):
+        """Extracts records from a list response as dictionaries.
+
+        Parameters
+            response: json returned by the master
+            key: name of the records list
+        Returns
+            list of dictionaries
+        """
+        return [record.asDict() if isinstance(record, Model) else record for record in response.get(key) or [] if isinstance(record, (dict, Model))]
+
+    def _sDiff(self, table, keycolumn, scope, rows):
+        """Writes changed rows and deletes vanished rows within a scope.
+
+        Parameters
+            table: table name
+            keycolumn: primary key column
+            scope: (column, value) limiting the rows replaced, or None for the whole table
+            rows: dictionary of key to column tuples, record json last
+        Returns
+            tuple of added, changed and removed counts
+        """
+        where, args = (' WHERE '+scope[0]+' = ?', (scope[1],)) if scope else ('', ())
+        existing = dict(self.db.execute('SELECT '+keycolumn+', record FROM '+table+where, args))
+
+        added = changed = 0
+        for key, row in rows.items():
+            if key not in existing:
+                added += 1
+            elif existing[key] != row[-1]:
+                changed += 1
+            else:
+                continue
+            self.db.execute('INSERT OR REPLACE INTO '+table+' VALUES ('+','.join('?' * (len(row) + 1))+')', (key,) + row)
+
+        removed = [(key,) for key in existing if key not in rows]
+        self.db.executemany('DELETE FROM '+table+' WHERE '+keycolumn+' = ?', removed)
+        return added, changed, len(removed)
+
+    def sync(self, vtype='kvm', nodeids=None, clients=True):
+        """Refreshes the index from the master, querying nodes concurrently.
+
+            Each node's virtual servers and IP addresses are diffed against the stored
+            rows so only changes are written. Nodes that fail keep their previous rows.
+
+        Parameters
+            vtype: openvz|xen|xen hvm|kvm
+            nodeids: list of node ids to refresh, or None for every node
+            clients: whether to refresh clients too
+        Returns
+            dictionary of added, changed and removed counts and errors keyed by nodeid, or by
+            'nodes' when the node listing failed and nothing was changed
+        """
+        full = nodeids is None
+        if full:
+            nodes = self.client.listNodesById(vtype)
+            if not isinstance(nodes, dict) or nodes.get('status') != 'success':
+                # keep every stored row rather than treating a failed listing as an empty fleet
+                statusmsg = nodes.get('statusmsg', 'unknown error') if isinstance(nodes, dict) else 'unexpected response'
+                return {'added': 0, 'changed': 0, 'removed': 0, 'errors': {'nodes': statusmsg}}
+            nodeids = self.client._sNodeIds(nodes)
+        nodeids = [str(nodeid) for nodeid in nodeids]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            vservers = [(nodeid, executor.submit(self.client.listVirtualServers, nodeid)) for nodeid in nodeids]
+            ips = [(nodeid, executor.submit(self.client.listNodesIPAddresses, nodeid)) for nodeid in nodeids]
+            clientlist = executor.submit(self.client.listClients) if clients else None
+
+            vservers = [(nodeid, future.exception() or future.result()) for nodeid, future in vservers]
+            ips = [(nodeid, future.exception() or future.result()) for nodeid, future in ips]
+            clientlist = clientlist.exception() or clientlist.result() if clientlist else None
+
+        summary = {'added': 0, 'changed': 0, 'removed': 0, 'errors': {}}
+
+        def count(counts):
+            summary['added'] += counts[0]
+            summary['changed'] += counts[1]
+            summary['removed'] += counts[2]
+
+        with self.lock, self.db:
+            now = time.time()
+            for (nodeid, result), (_, iplist) in zip(vservers, ips):
+                failed = result if isinstance(result, Exception) or result.get('status') != 'success' else None
+                if failed is not None:
+                    summary['errors'][nodeid] = str(failed) if isinstance(failed, Exception) else failed.get('statusmsg', 'unknown error')
+                    continue
+
+                count(self._sDiff('vservers', 'vserverid', ('nodeid', nodeid), dict(
+                    (str(record['vserverid']), (nodeid, str(record.get('clientid')), record.get('ipaddress'), json.dumps(record, sort_keys=True)))
+                    for record in self._sRecords(result, 'virtualservers') if 'vserverid' in record
+                )))
+
+                if not isinstance(iplist, Exception) and iplist.get('status') == 'success':
+                    count(self._sDiff('ips', 'ipaddress', ('nodeid', nodeid), dict(
+                        (record.get('ipaddress') or record.get('ip'), (nodeid, str(record.get('vserverid')), json.dumps(record, sort_keys=True)))
+                        for record in self._sRecords(iplist, 'ips') if record.get('ipaddress') or record.get('ip')
+                    )))
+
+                self.db.execute('INSERT OR REPLACE INTO nodes VALUES (?, ?)', (nodeid, now))
+
+            if full:
+                for (nodeid,) in self.db.execute('SELECT nodeid FROM nodes').fetchall():
+                    if nodeid not in nodeids:
+                        count(self._sDiff('vservers', 'vserverid', ('nodeid', nodeid), {}))
+                        count(self._sDiff('ips', 'ipaddress', ('nodeid', nodeid), {}))
+                        self.db.execute('DELETE FROM nodes WHERE nodeid = ?', (nodeid,))
+
+            if clientlist is not None:
+                if isinstance(clientlist, Exception) or clientlist.get('status') != 'success':
+                    summary['errors']['clients'] = str(clientlist) if isinstance(clientlist, Exception) else clientlist.get('statusmsg', 'unknown error')
+                else:
+                    count(self._sDiff('clients', 'clientid', None, dict(
+                        (str(record['id']), (record.get('username'), json.dumps(record, sort_keys=True)))
+                        for record in self._sRecords(clientlist, 'clients') if 'id' in record
+                    )))
+
+        return summary
+
+    def _sOne(self, query, args):
+        """Runs a query returning the first column of its first row, or None."""
+        with self.lock:
+            row = self.db.execute(query, args).fetchone()
+        return row[0] if row else None
+
+    def _sAll(self, query, args):
+        """Runs a query decoding the record json of every row."""
+        with self.lock:
+            return [json.loads(row[0]) for row in self.db.execute(query, args)]
+
+    def nodeOf(self, vserverid):
+        """Finds the node hosting specified virtual server.
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            nodeid, or None if unknown
+        """
+        return self._sOne('SELECT nodeid FROM vservers WHERE vserverid = ?', (str(vserverid),))
+
+    def virtualServer(self, vserverid):
+        """Retrieves the stored record of specified virtual server.
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            dictionary, or None if unknown
+        """
+        record = self._sOne('SELECT record FROM vservers WHERE vserverid = ?', (str(vserverid),))
+        return json.loads(record) if record else None
+
+    def virtualServersOnNode(self, nodeid):
+        """Lists stored virtual servers on specified node.
+
+        Parameters
+            nodeid: id of node
+        Returns
+            list of dictionaries
+        """
+        return self._sAll('SELECT record FROM vservers WHERE nodeid = ?', (str(nodeid),))
+
+    def ownerOfIP(self, ipaddress):
+        """Finds the virtual server and client using specified IP address.
+
+        Parameters
+            ipaddress: ip address
+        Returns
+            dictionary of vserverid and clientid, or None if unassigned or unknown
+        """
+        with self.lock:
+            row = self.db.execute(
+                'SELECT vservers.vserverid, vservers.clientid FROM ips JOIN vservers ON ips.vserverid = vservers.vserverid WHERE ips.ipaddress = ?',
+                (ipaddress,)
+            ).fetchone() or self.db.execute('SELECT vserverid, clientid FROM vservers WHERE ipaddress = ?', (ipaddress,)).fetchone()
+        return {'vserverid': row[0], 'clientid': row[1]} if row else None
+
+    def serversOfClient(self, clientid):
+        """Lists stored virtual servers owned by specified client.
+
+        Parameters
+            clientid: id of client
+        Returns
+            list of dictionaries
+        """
+        return self._sAll('SELECT record FROM vservers WHERE clientid = ?', (str(clientid),))
+
+    def findClient(self, clientid=None, username=None):
+        """Retrieves the stored record of specified client.
+
+        Parameters
+            clientid: id of client
+            username: username of client, used when clientid is None
+        Returns
+            dictionary, or None if unknown
+        """
+        if clientid is not None:
+            record = self._sOne('SELECT record FROM clients WHERE clientid = ?', (str(clientid),))
+        else:
+            record = self._sOne('SELECT record FROM clients WHERE username = ?', (username,))
+        return json.loads(record) if record else None
+
+
+class ChangeEvent:
+    __slots__ = ('vserverid', 'old', 'new', 'time')
+
+    def __init__(self, vserverid, old, new):
+        """Change observed by a Watcher on a virtual server.
+
+        Parameters
+            vserverid: id of virtual server
+            old: previous value
+            new: current value
+        Returns
+            None
+        """
+        self.vserverid = vserverid
+        self.old = old
+        self.new = new
+        self.time = time.time()
+
+    def __repr__(self):
+        return self.__class__.__name__+'('+repr(self.vserverid)+', '+repr(self.old)+', '+repr(self.new)+')'
+
+class StatusChanged(ChangeEvent):
+    __slots__ = ()
+
+class Suspended(ChangeEvent):
+    __slots__ = ()
+
+class Unsuspended(ChangeEvent):
+    __slots__ = ()
+
+class IPAdded(ChangeEvent):
+    __slots__ = ()
+
+class IPRemoved(ChangeEvent):
+    __slots__ = ()
+
+class PlanChanged(ChangeEvent):
+    __slots__ = ()
+
+# vserver-infoall fields Watcher compares between polls.
+WATCHED_FIELDS = frozenset(['state', 'suspended', 'plan', 'mainipaddress', 'ipaddresses'])
+
+class Watcher:
+    def __init__(self, client, vserverids=(), min_interval=15, max_interval=300, max_workers=32):
+        """Polls virtual servers and emits ChangeEvents when their state differs from the last poll.
+
+            Each virtual server has its own interval, doubling up to max_interval while it
+            stays unchanged and dropping back to min_interval when it changes. Only the
+            watched fields of each response are kept between polls.
+
+        Parameters
+            client: SolusVM client
+            vserverids: ids of virtual servers to watch
+            min_interval: shortest seconds between polls of one virtual server
+            max_interval: longest seconds between polls of one virtual server
+            max_workers: maximum number of requests in flight at once
+        Returns
+            None
+        """
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_workers = max_workers
+
+        self.due = []
+        self.scheduled = {}
+        self.intervals = {}
+        self.snapshots = {}
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+        for vserverid in vserverids:
+            self.add(vserverid)
+
+    def add(self, vserverid):
+        """Starts watching specified virtual server, polling it on the next cycle.
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            None
+        """
+        with self.lock:
+            if vserverid not in self.intervals:
+                self.intervals[vserverid] = self.min_interval
+                self.scheduled[vserverid] = time.monotonic()
+                heapq.heappush(self.due, (self.scheduled[vserverid], vserverid))
+
+    def remove(self, vserverid):
+        """Stops watching specified virtual server.
+
+        Parameters
+            vserverid: id of virtual server
+        Returns
+            None
+        """
+        with self.lock:
+            self.intervals.pop(vserverid, None)
+            self.scheduled.pop(vserverid, None)
+            self.snapshots.pop(vserverid, None)
+
+    def on(self, eventtype, callback):
+        """Registers a callback for events of specified type, or ChangeEvent for every event.
 
-            https://documentation.solusvm.com/display/DOCS/Mount+ISO
+        Parameters
+            eventtype: ChangeEvent subclass
+            callback: callable taking the event
+        Returns
+            None
+        """
+        self.callbacks.append((eventtype, callback))
+
+    @staticmethod
+    def _sSnapshot(state):
+        """Extracts the watched fields from a vserver-infoall response.
+
+        Parameters
+            state: json returned by virtualServerState
+        Returns
+            dictionary of watched fields
+        """
+        ips = set(ip.strip() for ip in (state.get('ipaddresses') or '').split(',') if ip.strip())
+        if state.get('mainipaddress'):
+            ips.add(state['mainipaddress'])
+        return {
+            'state': state.get('state'),
+            'suspended': state.get('suspended'),
+            'plan': state.get('plan'),
+            'ips': frozenset(ips)
+        }
+
+    @staticmethod
+    def _sDiff(vserverid, old, new):
+        """Compares two snapshots.
 
         Parameters
             vserverid: id of virtual server
-            iso: filename of iso
+            old: previous snapshot
+            new: current snapshot
         Returns
-            json
+            list of ChangeEvents
         """
-        return self._sQuery({
-            'action': 'vserver-mountiso',
-            'vserverid': vserverid,
-            'iso': iso
-        })
+        events = []
+        if old['state'] != new['state']:
+            events.append(StatusChanged(vserverid, old['state'], new['state']))
+        if old['suspended'] != new['suspended']:
+            suspended = str(new['suspended']).lower() in ('1', 'true', 'yes', 'suspended')
+            events.append((Suspended if suspended else Unsuspended)(vserverid, old['suspended'], new['suspended']))
+        if old['plan'] != new['plan']:
+            events.append(PlanChanged(vserverid, old['plan'], new['plan']))
+        events.extend(IPAdded(vserverid, None, ip) for ip in sorted(new['ips'] - old['ips']))
+        events.extend(IPRemoved(vserverid, ip, None) for ip in sorted(old['ips'] - new['ips']))
+        return events
+
+    def delay(self):
+        """Seconds until the next virtual server is due.
 
-    def checkVirtualServerExists(self, vserverid):
-        """Checks if specified virtual server exists.
+        Parameters
+            None
+        Returns
+            seconds, or None if nothing is watched
+        """
+        with self.lock:
+            return max(0.0, self.due[0][0] - time.monotonic()) if self.due else None
 
-            https://documentation.solusvm.com/display/DOCS/Check+Exists
+    def poll(self):
+        """Polls every virtual server that is due and dispatches resulting events.
 
         Parameters
-            vserverid: id of virtual server
+            None
         Returns
-            json
+            list of ChangeEvents
         """
-        return self._sQuery({
-            'action': 'vserver-checkexists',
-            'vserverid': vserverid
-        })
+        now = time.monotonic()
+        with self.lock:
+            due = []
+            while self.due and self.due[0][0] <= now:
+                scheduled, vserverid = heapq.heappop(self.due)
+                # entries left behind by remove() and re-add() are stale
+                if self.scheduled.get(vserverid) == scheduled:
+                    due.append(vserverid)
+
+        if not due:
+            return []
+
+        outcome = self.client.batch('virtualServerState', [(vserverid, False, True, WATCHED_FIELDS) for vserverid in due], max_workers=self.max_workers)
+
+        events = []
+        with self.lock:
+            for vserverid in due:
+                if vserverid not in self.intervals:
+                    continue
+                interval = self.intervals[vserverid]
+                state = outcome['results'].get(vserverid)
+                if isinstance(state, dict) and state.get('status') == 'success':
+                    snapshot = self._sSnapshot(state)
+                    previous = self.snapshots.get(vserverid)
+                    self.snapshots[vserverid] = snapshot
+                    if previous is not None:
+                        changes = self._sDiff(vserverid, previous, snapshot)
+                        interval = self.min_interval if changes else min(self.max_interval, interval * 2)
+                        events.extend(changes)
+                self.intervals[vserverid] = interval
+                self.scheduled[vserverid] = now + interval
+                heapq.heappush(self.due, (now + interval, vserverid))
+
+        for event in events:
+            for eventtype, callback in self.callbacks:
+                if isinstance(event, eventtype):
+                    callback(event)
+
+        return events
+
+    def run(self, stop=None):
+        """Polls until stop is set, sleeping between due virtual servers.
 
-    def virtualServerState(self, vserverid, nostatus=False, nographs=False):
-        """Retrieves information about specified virtual server.
+        Parameters
+            stop: threading.Event ending the loop, or None to run forever
+        Returns
+            None
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.poll()
+            delay = self.delay()
+            stop.wait(self.min_interval if delay is None else delay)
 
-            https://documentation.solusvm.com/display/DOCS/Virtual+Server+State
+    async def events(self):
+        """Polls forever, yielding events as an async iterator. Polls run in the default executor.
 
         Parameters
-            vserverid: id of virtual server
-            nostatus: whether or not to retrieve status
-            nographs: whether or not to generate graphs
+            None
         Returns
-            json
+            async generator of ChangeEvents
         """
-        return self._sQuery({
-            'action': 'vserver-infoall',
-            'vserverid': vserverid,
-            'nostatus': nostatus,
-            'nographs': nographs
-        })
+        loop = asyncio.get_running_loop()
+        while True:
+            for event in await loop.run_in_executor(None, self.poll):
+                yield event
+            delay = self.delay()
+            await asyncio.sleep(self.min_interval if delay is None else delay)
 
-    def virtualServerInfo(self, vserverid):
-        """Retrieves information about specified virtual server.
 
-            https://documentation.solusvm.com/display/DOCS/Virtual+Server+Information
+class Placement:
+    # node-statistics fields a plan may require; the first orders the capacity index.
+    RESOURCES = ('freememory', 'freedisk', 'freeips')
+
+    def __init__(self, client, plans, vtype='kvm', nodegroups=None, ttl=30, max_workers=16):
+        """Chooses nodes for new virtual servers from concurrently gathered node statistics.
+
+            Statistics are cached for ttl seconds in a capacity index ordered by free
+            memory, so a placement usually inspects only the first few nodes.
 
         Parameters
-            vserverid: id of virtual server
+            client: SolusVM client
+            plans: dictionary of plan name to requirements, keyed by RESOURCES fields in node-statistics units
+            vtype: openvz|xen|xen hvm|kvm
+            nodegroups: dictionary of node group id to node ids, or None to use each node's nodegroup
+                statistic; bestNode raises SolusVMError for a node group when a node lacks it
+            ttl: seconds before statistics are gathered again
+            max_workers: maximum number of nodes queried at once
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-info',
-            'vserverid': vserverid
-        })
+        self.client = client
+        self.plans = plans
+        self.vtype = vtype
+        self.nodegroups = nodegroups
+        self.ttl = ttl
+        self.max_workers = max_workers
+
+        self.index = {}
+        self.groupnames = {}
+        self.errors = {}
+        self.ungrouped = []
+        self.refreshed = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _sGroups(response):
+        """Parses a listnodegroups response of comma separated id|name pairs.
 
-    def deleteIPAddress(self, vserverid, ipaddr):
-        """Removes specified IP Address from specified virtual server.
+        Parameters
+            response: json returned by listNodeGroups
+        Returns
+            dictionary of node group name to id
+        """
+        groups = {}
+        for group in (response.get('nodegroups') or '').split(','):
+            groupid, _, name = group.strip().partition('|')
+            if groupid:
+                groups[name or groupid] = groupid
+        return groups
 
-            https://documentation.solusvm.com/display/DOCS/Delete+IP+Address
+    def refresh(self):
+        """Gathers statistics from every node and rebuilds the capacity index.
+
+            A failed node, plan or node group listing raises SolusVMError with the master's
+            statusmsg and leaves the previous index in place.
 
         Parameters
-            vserverid: id of virtual server
-            ipaddr: ip address
+            None
         Returns
-            json
+            dictionary of errors keyed by nodeid
         """
-        return self._sQuery({
-            'action': 'vserver-delip',
-            'vserverid': vserverid,
-            'ipaddr': ipaddr
-        })
+        client = self.client
+        nodes = client.listNodesById(self.vtype)
+        if client._sFailed(nodes):
+            # an empty index would read as no capacity anywhere
+            raise SolusVMError('node listing failed: '+client._sStatusmsg(nodes))
+        nodeids = client._sNodeIds(nodes)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            plans = executor.submit(client.listPlans, self.vtype)
+            groups = executor.submit(client.listNodeGroups, self.vtype)
+            futures = [(nodeid, executor.submit(client.nodeStatistics, nodeid)) for nodeid in nodeids]
+            stats = [(nodeid, future.exception() or future.result()) for nodeid, future in futures]
+            plans, groups = plans.result(), groups.result()
+
+        if client._sFailed(plans):
+            raise SolusVMError('plan listing failed: '+client._sStatusmsg(plans))
+        if client._sFailed(groups):
+            raise SolusVMError('node group listing failed: '+client._sStatusmsg(groups))
+
+        known = plans.get('plans') or ''
+        known = set(plan.strip() for plan in known.split(',')) if isinstance(known, str) else set(plan['name'] for plan in known)
+        unknown = [plan for plan in self.plans if plan not in known]
+        if unknown:
+            raise SolusVMError('unknown plans: '+', '.join(sorted(unknown)))
+
+        membership = {}
+        for groupid, members in (self.nodegroups or {}).items():
+            membership.update((str(nodeid), str(groupid)) for nodeid in members)
+
+        index = {}
+        errors = {}
+        ungrouped = []
+        for nodeid, result in stats:
+            if isinstance(result, Exception) or result.get('status') not in (None, 'success'):
+                errors[nodeid] = str(result) if isinstance(result, Exception) else result.get('statusmsg', 'unknown error')
+                continue
+            capacity = [_number(result.get(resource)) for resource in self.RESOURCES]
+            if not all(isinstance(value, (int, float)) for value in capacity):
+                errors[nodeid] = 'incomplete statistics'
+                continue
+            groupid = membership.get(nodeid) if self.nodegroups is not None else result.get('nodegroup')
+            if self.nodegroups is None and groupid is None:
+                ungrouped.append(nodeid)
+            entry = capacity + [nodeid]
+            index.setdefault(None, []).append(entry)
+            if groupid is not None:
+                index.setdefault(str(groupid), []).append(entry)
+
+        for entries in index.values():
+            entries.sort(key=lambda entry: entry[0], reverse=True)
+
+        with self.lock:
+            self.index = index
+            self.groupnames = self._sGroups(groups)
+            self.errors = errors
+            self.ungrouped = ungrouped
+            self.refreshed = time.monotonic()
+
+        return errors
+
+    def bestNode(self, plan, nodegroup=None, reserve=False):
+        """Finds the node with most free memory able to host specified plan.
 
-    def toggleSerialConsole(self, vserverid, access=None, time=None):
-        """Retrieves, enables or disables serial console for specified virtual server.
+        Parameters
+            plan: plan name from plans
+            nodegroup: node group id or name, or None for any node
+            reserve: whether to deduct the plan from the chosen node until the next refresh
+        Returns
+            nodeid, or None if no node has capacity
+        """
+        with self.lock:
+            stale = self.refreshed is None or time.monotonic() - self.refreshed >= self.ttl
+        if stale:
+            self.refresh()
+
+        requirements = [self.plans[plan].get(resource, 0) for resource in self.RESOURCES]
+
+        with self.lock:
+            if nodegroup is not None:
+                if self.ungrouped:
+                    raise SolusVMError('node statistics of nodes '+', '.join(self.ungrouped)+' have no nodegroup; pass nodegroups to Placement')
+                nodegroup = self.groupnames.get(str(nodegroup), str(nodegroup))
+            entries = self.index.get(nodegroup, [])
+
+            for entry in entries:
+                if entry[0] < requirements[0]:
+                    return None
+                if all(entry[i] >= requirements[i] for i in range(1, len(requirements))):
+                    if reserve:
+                        for i, required in enumerate(requirements):
+                            entry[i] -= required
+                        for group in self.index.values():
+                            group.sort(key=lambda other: other[0], reverse=True)
+                    return entry[-1]
+
+        return None
+
+class ProvisioningPipeline:
+    def __init__(self, client, max_workers=16, min_interval=2, max_interval=30, timeout=1800, settle=300):
+        """Submits provisioning jobs concurrently and tracks them to completion with one shared poller.
+
+            Each job returns a concurrent.futures.Future resolving to the job's response once
+            vserver-status reports the virtual server online, or raising ProvisioningError when
+            the job is rejected, the server is disabled or missing, or timeout passes. Rebuilds
+            and plan changes act on servers that are already online, so they resolve only
+            after the server has been seen leaving online and coming back, or after it has
+            stayed online for settle seconds. Servers are polled in batches by a single
+            thread, each on an interval growing from min_interval to max_interval. Use
+            asyncio.wrap_future to await a job.
+
+                with ProvisioningPipeline(solus) as pipeline:
+                    futures = [pipeline.createVirtualServer(spec) for spec in specs]
+                    concurrent.futures.wait(futures)
 
-            https://documentation.solusvm.com/display/DOCS/Serial+Console
+        Parameters
+            client: SolusVM client
+            max_workers: maximum number of submissions or status queries in flight at once
+            min_interval: seconds before the first status poll of a job
+            max_interval: longest seconds between status polls of one job
+            timeout: seconds after acceptance before a job is failed
+            settle: seconds a rebuild or plan change may report online without going offline before it is taken as done
+        Returns
+            None
+        """
+        self.client = client
+        self.max_workers = max_workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.settle = settle
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs = {}
+        self.due = []
+        self.futures = set()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.poller = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def createVirtualServer(self, kwargs):
+        """Creates a virtual server, resolving once it is online.
+
+        Parameters
+            kwargs: dictionary parameter pairs for SolusVM.createVirtualServer
+        Returns
+            concurrent.futures.Future
+        """
+        return self._sSubmit(self.client.createVirtualServer, (kwargs,), None, False)
+
+    def rebuildVirtualServer(self, vserverid, template):
+        """Rebuilds a virtual server, resolving once it has gone offline and is online again.
 
         Parameters
             vserverid: id of virtual server
-            access: enable|disable
-            time: 1|2|3|4|5|6|7|8
+            template: template filename without extension
         Returns
-            json
+            concurrent.futures.Future
         """
-        return self._sQuery({
-            'action': 'vserver-console',
-            'vserverid': vserverid,
-            'time': time,
-            'access': access
-        })
+        return self._sSubmit(self.client.rebuildVirtualServer, (vserverid, template), vserverid, True)
 
     def changePlan(self, vserverid, plan):
-        """Changes specified virtual server's plan.
-
-            https://documentation.solusvm.com/display/DOCS/Change+Plan
+        """Changes a virtual server's plan, resolving once it has gone offline and is online again.
 
         Parameters
             vserverid: id of virtual server
             plan: new plan name
         Returns
-            json
+            concurrent.futures.Future
         """
-        return self._sQuery({
-            'action': 'vserver-change',
-            'vserverid': vserverid,
-            'plan':plan
-        })
-
-    def changeOwner(self, vserverid, clientid):
-        """Changes specified virtual server's owner.
+        return self._sSubmit(self.client.changePlan, (vserverid, plan), vserverid, True)
 
-            https://documentation.solusvm.com/display/DOCS/Change+Owner
+    def track(self, vserverid, response=None, restart=False):
+        """Tracks a job already accepted by the master.
 
         Parameters
             vserverid: id of virtual server
-            clientid: new clients id
+            response: json the master returned for the job, or None
+            restart: whether the server was online when the job was accepted and must go offline first
         Returns
-            json
+            concurrent.futures.Future
         """
-        return self._sQuery({
-            'action': 'vserver-changeowner',
-            'vserverid': vserverid,
-            'clientid': clientid
-        })
-
-    def changeBootOrder(self, vserverid, bootorder):
-        """Changes specified virtual server's boot order.
+        future = self._sFuture()
+        self._sTrack(str(vserverid), future, response or {'status': 'success'}, restart)
+        return future
 
-            https://documentation.solusvm.com/display/DOCS/Change+Boot+Order
+    def _sFuture(self):
+        """Creates a future counted as outstanding until it resolves.
 
         Parameters
-            vserverid: id of virtual server
-            bootorder: cd|dc|c|d (c=CDROM, d=HDD)
+            None
         Returns
-            json
+            concurrent.futures.Future
         """
-        return self._sQuery({
-            'action': 'vserver-bootorder',
-            'vserverid': vserverid,
-            'bootorder': bootorder
-        })
+        future = concurrent.futures.Future()
+        with self.condition:
+            if self.closed:
+                raise SolusVMError('provisioning pipeline closed')
+            self.futures.add(future)
+        future.add_done_callback(self._sDone)
+        return future
 
+    def _sDone(self, future):
+        with self.condition:
+            self.futures.discard(future)
 
-    def changeBandwidthLimits(self, vserverid, limit, overlimit):
-        """Changes specified virtual server's bandwidth limits.
+    def _sSubmit(self, call, args, vserverid, restart):
+        """Sends a job to the master on the executor.
 
-            https://documentation.solusvm.com/display/DOCS/Change+Bandwidth+Limits
+        Parameters
+            call: client method submitting the job
+            args: positional arguments for call
+            vserverid: id of the virtual server, or None to take it from the response
+            restart: whether the server is online before the job and must go offline first
+        Returns
+            concurrent.futures.Future
+        """
+        future = self._sFuture()
+        self.executor.submit(self._sStart, future, call, args, vserverid, restart)
+        return future
+
+    def _sStart(self, future, call, args, vserverid, restart):
+        """Submits one job and starts tracking it once accepted.
 
         Parameters
-            vserverid: id of virtual server
-            limit: bandwidth limit in Gb
-            overlimit: bandwidth overlimit in Gb
+            future: the job's future
+            call: client method submitting the job
+            args: positional arguments for call
+            vserverid: id of the virtual server, or None to take it from the response
+            restart: whether the server is online before the job and must go offline first
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-bandwidth',
-            'vserverid': vserverid,
-            'limit': limit,
-            'overlimit': overlimit
-        })
+        try:
+            response = call(*args)
+        except Exception as e:
+            future.set_exception(e)
+            return
 
-    def changeMemory(self, vserverid, memory):
-        """Changes specified virtual server's allocated memory.
+        if not isinstance(response, dict) or response.get('status') != 'success':
+            future.set_exception(ProvisioningError(response.get('statusmsg', 'unknown error') if isinstance(response, dict) else 'unexpected response'))
+            return
 
-            https://documentation.solusvm.com/display/DOCS/Change+Memory
+        vserverid = response.get('vserverid') if vserverid is None else vserverid
+        if vserverid is None:
+            future.set_exception(ProvisioningError('no vserverid in response'))
+            return
+
+        self._sTrack(str(vserverid), future, response, restart)
+
+    def _sTrack(self, vserverid, future, response, restart):
+        """Adds a job to the poller, sharing polls with other jobs of the same virtual server.
+
+            A restarting job waits in job['restarting'] until the server is seen offline or
+            its settle deadline passes, and only then counts an online status as completion.
 
         Parameters
             vserverid: id of virtual server
-            memory: amount in Mb
+            future: the job's future
+            response: json the master returned for the job
+            restart: whether the server must go offline before online counts as done
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-change-memory',
-            'vserverid': vserverid,
-            'memory': memory
-        })
+        with self.condition:
+            if self.closed:
+                future.set_exception(SolusVMError('provisioning pipeline closed'))
+                return
+
+            now = time.monotonic()
+            job = self.jobs.get(vserverid)
+            if job is not None:
+                if restart:
+                    job['restarting'].append((future, response, now + self.settle))
+                else:
+                    job['futures'].append((future, response))
+                return
+
+            self.jobs[vserverid] = {
+                'futures': [] if restart else [(future, response)],
+                'restarting': [(future, response, now + self.settle)] if restart else [],
+                'deadline': now + self.timeout,
+                'interval': self.min_interval
+            }
+            heapq.heappush(self.due, (now + self.min_interval, vserverid))
+
+            if self.poller is None:
+                self.poller = threading.Thread(target=self._sRun, name='solusvm-provisioning', daemon=True)
+                self.poller.start()
+            self.condition.notify()
+
+    def _sRun(self):
+        """Poller thread: waits for due jobs and polls them in batches until closed.
 
-    def changeCPU(self, vserverid, cpu):
-        """Changes specified virtual server's number of CPU cores.
+        Parameters
+            None
+        Returns
+            None
+        """
+        while True:
+            with self.condition:
+                while not self.closed:
+                    now = time.monotonic()
+                    if self.due and self.due[0][0] <= now:
+                        break
+                    self.condition.wait(self.due[0][0] - now if self.due else None)
+                if self.closed:
+                    return
+
+                due = []
+                while self.due and self.due[0][0] <= now:
+                    vserverid = heapq.heappop(self.due)[1]
+                    if vserverid in self.jobs:
+                        due.append(vserverid)
+
+            self._sPoll(due)
+
+    def _sPoll(self, due):
+        """Polls the status of due virtual servers once and settles finished jobs.
 
-            https://documentation.solusvm.com/display/DOCS/Change+CPU
+        Parameters
+            due: ids of virtual servers to poll
+        Returns
+            None
+        """
+        outcome = self.client.batch('virtualServerStatus', due, max_workers=self.max_workers)
+        now = time.monotonic()
+
+        finished = []
+        with self.condition:
+            for vserverid in due:
+                job = self.jobs.get(vserverid)
+                if job is None:
+                    continue
+
+                status = outcome['results'].get(vserverid)
+                online = False
+                error = None
+                if isinstance(status, dict) and status.get('status') == 'success':
+                    online = status.get('statusmsg') == 'online'
+                    if status.get('statusmsg') == 'disabled':
+                        error = 'virtual server disabled'
+                elif isinstance(status, dict):
+                    error = status.get('statusmsg', 'unknown error')
+
+                # restarting jobs count online only once the server has left it or settle has passed
+                offline = isinstance(status, dict) and status.get('status') == 'success' and not online
+                restarting = []
+                for future, response, settled in job['restarting']:
+                    if offline or now >= settled:
+                        job['futures'].append((future, response))
+                    else:
+                        restarting.append((future, response, settled))
+                job['restarting'] = restarting
+
+                if not online and error is None and now >= job['deadline']:
+                    error = 'timed out waiting for virtual server to come online'
+
+                if error is not None:
+                    del self.jobs[vserverid]
+                    finished.append((vserverid, job['futures'] + [entry[:2] for entry in restarting], error))
+                elif online and job['futures']:
+                    futures, job['futures'] = job['futures'], []
+                    finished.append((vserverid, futures, None))
+                    if not restarting:
+                        del self.jobs[vserverid]
+                    else:
+                        heapq.heappush(self.due, (now + job['interval'], vserverid))
+                else:
+                    job['interval'] = min(self.max_interval, job['interval'] * 1.5)
+                    heapq.heappush(self.due, (now + job['interval'], vserverid))
+
+        for vserverid, futures, error in finished:
+            for future, response in futures:
+                if error is None:
+                    future.set_result(dict(response, vserverid=vserverid, state='online'))
+                else:
+                    future.set_exception(ProvisioningError(vserverid+': '+error))
+
+    def pending(self):
+        """Number of jobs not yet resolved.
 
         Parameters
-            vserverid: id of virtual server
-            cpu: number of cpu cores [1-128]
+            None
         Returns
-            json
+            int
         """
-        return self._sQuery({
-            'action': 'vserver-change-cpu',
-            'vserverid': vserverid,
-            'cpu': cpu,
-        })
+        with self.condition:
+            return len(self.futures)
 
-    def changeHDD(self, vserverid, hdd):
-        """Changes specified virtual server's hard disk size.
+    def close(self, wait=True):
+        """Stops the pipeline.
 
-            https://documentation.solusvm.com/display/DOCS/Change+Hard+Disk+Size
+        Parameters
+            wait: whether to wait for outstanding jobs to resolve first; otherwise they fail
+        Returns
+            None
+        """
+        if wait:
+            with self.condition:
+                futures = list(self.futures)
+            concurrent.futures.wait(futures)
+
+        self.executor.shutdown(wait=wait)
+        with self.condition:
+            self.closed = True
+            jobs, self.jobs, self.due = self.jobs, {}, []
+            self.condition.notify_all()
+        for job in jobs.values():
+            for future, response in job['futures'] + [entry[:2] for entry in job['restarting']]:
+                future.set_exception(SolusVMError('provisioning pipeline closed'))
+
+        if self.poller is not None:
+            self.poller.join()
+
+class MaintenanceOrchestrator:
+    # operation name to (client method, vserver-status statusmsg expected afterwards,
+    # whether guests are online before the operation and must be seen leaving it)
+    OPERATIONS = {
+        'boot': ('bootVirtualServer', 'online', False),
+        'reboot': ('rebootVirtualServer', 'online', True),
+        'rebuild': ('rebuildVirtualServer', 'online', True),
+        'shutdown': ('shutdownVirtualServer', 'offline', False)
+    }
+
+    def __init__(self, client, operation, nodeids, args=(), window=4, max_nodes=1, error_budget=0.05,
+                 checkpoint=None, health_timeout=300, poll_interval=5, settle=60):
+        """Runs an operation across every virtual server of some nodes in rolling waves.
+
+            Each node is worked through in waves of window virtual servers. After a wave the
+            orchestrator polls vserver-status until the wave reaches the expected state or
+            health_timeout passes, then starts the next wave. Once the failures of this run
+            exceed error_budget of the virtual servers attempted, no further waves start and
+            the run returns paused. Progress is written to checkpoint after every wave, and a
+            new orchestrator on the same checkpoint resumes where the last one stopped.
+            Waves that must come back online are tracked by a ProvisioningPipeline, so a
+            reboot or rebuild only counts once each guest has been seen leaving online, or
+            has stayed online for settle seconds.
+
+                orchestrator = MaintenanceOrchestrator(solus, 'reboot', [1, 2], window=4, checkpoint='reboot.json')
+                summary = orchestrator.run()
 
         Parameters
-            vserverid: id of virtual server
-            hdd: hard disk size in Gb
+            client: SolusVM client
+            operation: boot|reboot|rebuild|shutdown
+            nodeids: ids of nodes to work through
+            args: further positional arguments for the operation, such as the rebuild template
+            window: maximum number of virtual servers per node operated on at once
+            max_nodes: maximum number of nodes worked on at once
+            error_budget: fraction of attempted virtual servers allowed to fail before pausing
+            checkpoint: JSON file recording progress, or None to keep it in memory only
+            health_timeout: seconds a wave may take to reach the expected state
+            poll_interval: seconds between health polls of a wave
+            settle: seconds a rebooted or rebuilt guest may report online without going offline before it is taken as done
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'vserver-change-hdd',
-            'vserverid': vserverid,
-            'hdd': hdd,
-        })
+        if operation not in self.OPERATIONS:
+            raise SolusVMError('unknown operation: '+operation)
+
+        self.client = client
+        self.operation = operation
+        self.args = list(args)
+        self.window = window
+        self.max_nodes = max_nodes
+        self.error_budget = error_budget
+        self.checkpoint = checkpoint
+        self.health_timeout = health_timeout
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.pipeline = None
+
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.state = {'operation': operation, 'args': self.args, 'paused': None, 'nodes': collections.OrderedDict()}
+        if checkpoint is not None and os.path.exists(checkpoint):
+            self._sLoad()
+        for nodeid in nodeids:
+            self.state['nodes'].setdefault(str(nodeid), {'pending': None, 'done': [], 'failed': {}})
+
+        self.attempted = 0
+        self.failures = 0
+
+    def _sLoad(self):
+        """Restores progress from the checkpoint file.
 
+        Parameters
+            None
+        Returns
+            None
+        """
+        with open(self.checkpoint, encoding='utf-8') as fh:
+            state = json.load(fh, object_pairs_hook=collections.OrderedDict)
+        if state.get('operation') != self.operation or state.get('args') != self.args:
+            raise SolusVMError('checkpoint '+self.checkpoint+' belongs to '+str(state.get('operation'))+' '+json.dumps(state.get('args')))
+        self.state = state
 
-    def addIPAddress(self, vserverid):
-        """Adds an IP address to specified virtual server.
+    def _sSave(self):
+        """Writes progress to the checkpoint file, replacing it atomically.
 
-            https://documentation.solusvm.com/display/DOCS/Add+IP+Address
+        Parameters
+            None
+        Returns
+            None
+        """
+        if self.checkpoint is None:
+            return
+        # node threads save concurrently; serialize so each replace finds its own file
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps(self.state, indent=1)
+            with open(self.checkpoint+'.tmp', 'w', encoding='utf-8') as fh:
+                fh.write(data)
+            os.replace(self.checkpoint+'.tmp', self.checkpoint)
+
+    def _sExhausted(self):
+        """Whether this run's failures exceed the error budget.
 
         Parameters
-            vserverid: id of virtual server
+            None
         Returns
-            json
+            bool
         """
-        return self._sQuery({
-            'action': 'vserver-addip',
-            'vserverid': vserverid
-        })
+        return self.failures > self.error_budget * self.attempted
 
-    def bootVirtualServer(self, vserverid):
-        """Boots specified virtual server.
+    def _sHealth(self, vserverids):
+        """Waits until every virtual server of a wave reaches the expected state or the health timeout passes.
 
-            https://documentation.solusvm.com/display/DOCS/Boot+Virtual+Server
+            Waves expected online are tracked on the run's pipeline; others are polled here.
 
         Parameters
-            vserverid: id of virtual server
+            vserverids: ids of virtual servers in the wave
         Returns
-            json
+            dictionary of errors keyed by vserverid
         """
-        return self._sQuery({
-            'action': 'vserver-boot',
-            'vserverid': vserverid
-        })
+        expected, restart = self.OPERATIONS[self.operation][1:]
+        errors = {}
+        if expected == 'online':
+            futures = [(vserverid, self.pipeline.track(vserverid, restart=restart)) for vserverid in vserverids]
+            for vserverid, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[vserverid] = str(e) or e.__class__.__name__
+            return errors
+
+        deadline = time.monotonic() + self.health_timeout
+        waiting = list(vserverids)
+        while waiting:
+            outcome = self.client.batch('virtualServerStatus', waiting, max_workers=self.window)
+            waiting = [
+                vserverid for vserverid in waiting
+                if not isinstance(outcome['results'].get(vserverid), dict) or outcome['results'][vserverid].get('statusmsg') != expected
+            ]
+            if not waiting:
+                break
+            if time.monotonic() >= deadline:
+                for vserverid in waiting:
+                    status = outcome['results'].get(vserverid) or {}
+                    errors[vserverid] = 'not '+expected+' after '+str(self.health_timeout)+'s'+(
+                        ' (statusmsg '+str(status.get('statusmsg'))+')' if isinstance(status, dict) and status.get('statusmsg') else ''
+                    )
+                break
+            time.sleep(self.poll_interval)
+        return errors
+
+    def _sNode(self, nodeid):
+        """Works through one node's virtual servers wave by wave.
 
-    def createVirtualServer(self, kwargs):
-        """Creates virtual server.
+        Parameters
+            nodeid: id of node
+        Returns
+            None
+        """
+        node = self.state['nodes'][nodeid]
+        if node['pending'] is None:
+            try:
+                response = self.client.listVirtualServers(nodeid)
+            except Exception as e:
+                response = {'status': 'error', 'statusmsg': str(e) or e.__class__.__name__}
+            if not isinstance(response, dict) or response.get('status') not in (None, 'success'):
+                # a node that cannot be listed is reported but not charged to the wave error budget
+                with self.lock:
+                    node['failed']['node'] = response.get('statusmsg', 'unknown error') if isinstance(response, dict) else 'unexpected response'
+                self._sSave()
+                return
+            with self.lock:
+                node['pending'] = [
+                    str(record.get('vserverid')) for record in response.get('virtualservers') or []
+                    if str(record.get('vserverid')) not in node['done']
+                ]
+            self._sSave()
+
+        method = self.OPERATIONS[self.operation][0]
+        while node['pending']:
+            with self.lock:
+                if self.state['paused'] or self._sExhausted():
+                    return
+                wave = node['pending'][:self.window]
+
+            outcome = self.client.batch(method, [tuple([vserverid]+self.args) for vserverid in wave], max_workers=self.window)
+            errors = dict(
+                (vserverid, str(error) or error.__class__.__name__) for vserverid, error in outcome['errors'].items()
+            )
+            for vserverid, response in outcome['results'].items():
+                if isinstance(response, dict) and response.get('status') == 'error':
+                    errors[vserverid] = response.get('statusmsg', 'unknown error')
+            errors.update(self._sHealth([vserverid for vserverid in wave if vserverid not in errors]))
+
+            with self.lock:
+                node['pending'] = node['pending'][len(wave):]
+                node['done'].extend(vserverid for vserverid in wave if vserverid not in errors)
+                node['failed'].update(errors)
+                self.attempted += len(wave)
+                self.failures += len(errors)
+                if self._sExhausted() and not self.state['paused']:
+                    self.state['paused'] = 'error budget exhausted: %d of %d failed' % (self.failures, self.attempted)
+            self._sSave()
+
+    def run(self, retry_failed=False):
+        """Works through the nodes until done or paused, saving progress after every wave.
 
-            https://documentation.solusvm.com/display/DOCS/Create+Virtual+Server
+        Parameters
+            retry_failed: whether to operate again on virtual servers that failed in earlier runs
+        Returns
+            dictionary of done and pending counts, failures keyed by nodeid and the pause reason, if any
+        """
+        with self.lock:
+            self.state['paused'] = None
+            if retry_failed:
+                for node in self.state['nodes'].values():
+                    failed = [vserverid for vserverid in node['failed'] if vserverid != 'node']
+                    node['pending'] = failed + (node['pending'] or []) if node['pending'] is not None else None
+                    node['failed'] = {}
+
+        nodeids = [nodeid for nodeid, node in self.state['nodes'].items() if node['pending'] is None or node['pending']]
+        self.pipeline = ProvisioningPipeline(self.client, max_workers=self.window * self.max_nodes, min_interval=self.poll_interval,
+                                             max_interval=self.poll_interval, timeout=self.health_timeout, settle=self.settle)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_nodes) as executor:
+                for future in [executor.submit(self._sNode, nodeid) for nodeid in nodeids]:
+                    future.result()
+        finally:
+            self.pipeline.close()
+
+        return self.summary()
+
+    def summary(self):
+        """Reports progress so far.
+
+        Parameters
+            None
+        Returns
+            dictionary of done and pending counts, failures keyed by nodeid and the pause reason, if any
+        """
+        with self.lock:
+            nodes = self.state['nodes']
+            return {
+                'done': sum(len(node['done']) for node in nodes.values()),
+                'pending': sum(len(node['pending']) if node['pending'] is not None else 0 for node in nodes.values()),
+                'failed': dict((nodeid, dict(node['failed'])) for nodeid, node in nodes.items() if node['failed']),
+                'paused': self.state['paused']
+            }
+
+class TimeSeries:
+    # array typecodes of the columns every sample has besides its values
+    INDEX_COLUMNS = (('time', 'd'), ('series', 'I'))
+
+    def __init__(self, columns, capacity=65536, path=None):
+        """Columnar ring buffer of samples, each a time, a series and one float per column.
+
+            Every column is an array.array. When numpy is installed, range queries and
+            aggregations run vectorized: segment columns are viewed in place with
+            numpy.frombuffer, and only the queried columns of the in-memory buffer are
+            copied, under the lock. Without numpy they fall back to Python loops. Without a path the oldest samples are
+            overwritten once capacity is reached. With a path each full buffer, and the
+            partial buffer on close, is written to a segment file in that directory and
+            read back through mmap.
+
+        Parameters
+            columns: names of the value columns
+            capacity: number of samples held in memory
+            path: directory for on-disk segments, or None to keep samples in memory only
+        Returns
+            None
+        """
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self.path = path
+        self.keys = []
+        self.index = {}
+        self.segments = []
+        self.lock = threading.Lock()
+
+        self.data = collections.OrderedDict(
+            (name, array.array(typecode, bytes(array.array(typecode).itemsize * capacity)))
+            for name, typecode in self.INDEX_COLUMNS + tuple((column, 'd') for column in self.columns)
+        )
+        self.head = 0
+        self.size = 0
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            if os.path.exists(os.path.join(path, 'series.json')):
+                with open(os.path.join(path, 'series.json'), encoding='utf-8') as fh:
+                    self.keys = json.load(fh)
+                self.index = dict((key, i) for i, key in enumerate(self.keys))
+            for filename in sorted(os.listdir(path)):
+                if filename.startswith('segment-') and filename.endswith('.bin'):
+                    self.segments.append(self._sMap(os.path.join(path, filename)))
+
+    def _sSeries(self, key):
+        """Index of the series of specified key, registering it on first use.
 
         Parameters
-            data: dictionary parameter pairs
+            key: series key
         Returns
-            json
+            int
         """
-        kwargs['action'] = 'vserver-create'
-        return self._sQuery(kwargs)
+        series = self.index.get(key)
+        if series is None:
+            series = self.index[key] = len(self.keys)
+            self.keys.append(key)
+        return series
 
-    def listNodesById(self, vtype='kvm'):
-        """Lists Nodes by their ID.
-
-            https://documentation.solusvm.com/display/DOCS/List+Nodes+by+ID
+    def append(self, timestamp, rows):
+        """Appends one sample per series taken at one time.
 
         Parameters
-            vtype: openvz|xen|xen hvm|kvm
+            timestamp: seconds since the epoch
+            rows: iterable of (key, dictionary of column values) pairs; missing columns are stored as NaN
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'node-idlist',
-            'type': vtype
-        })
-
-    def listNodesByName(self, vtype='kvm'):
-        """List nodes by name.
-
-            https://documentation.solusvm.com/display/DOCS/List+Nodes+by+Name
+        data = self.data
+        columns = [(data[column], column) for column in self.columns]
+        nan = float('nan')
+        with self.lock:
+            for key, values in rows:
+                position = self.head
+                data['time'][position] = timestamp
+                data['series'][position] = self._sSeries(str(key))
+                for values_column, column in columns:
+                    value = values.get(column)
+                    values_column[position] = nan if value is None else value
+                self.head = (position + 1) % self.capacity
+                self.size = min(self.size + 1, self.capacity)
+                if self.path is not None and self.head == 0:
+                    self._sSpill()
+
+    def _sSpill(self):
+        """Writes the buffered samples to a new segment file and empties the buffer.
 
         Parameters
-            vtype: openvz|xen|xen hvm|kvm
+            None
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'listnodes',
-            'type': vtype
-        })
-
-    def listISO(self, vtype='kvm'):
-        """Lists available ISO images.
-
-            https://documentation.solusvm.com/display/DOCS/List+ISO+Images
+        times = self.data['time']
+        header = json.dumps({
+            'rows': self.size,
+            'columns': [[name, column.typecode] for name, column in self.data.items()],
+            'start': min(times[:self.size]),
+            'end': max(times[:self.size])
+        }).encode('utf-8')
+        header += b' ' * (-(len(header) + 8) % 8)
+
+        filename = os.path.join(self.path, 'segment-%08d.bin' % len(self.segments))
+        with open(filename+'.tmp', 'wb') as fh:
+            fh.write(len(header).to_bytes(8, 'little'))
+            fh.write(header)
+            for column in self.data.values():
+                view = memoryview(column)[:self.size]
+                fh.write(view)
+                fh.write(b'\0' * (-view.nbytes % 8))
+        os.replace(filename+'.tmp', filename)
+
+        with open(os.path.join(self.path, 'series.json.tmp'), 'w', encoding='utf-8') as fh:
+            json.dump(self.keys, fh)
+        os.replace(os.path.join(self.path, 'series.json.tmp'), os.path.join(self.path, 'series.json'))
+
+        self.segments.append(self._sMap(filename))
+        self.head = 0
+        self.size = 0
+
+    @staticmethod
+    def _sMap(filename):
+        """Memory-maps a segment file.
 
         Parameters
-            vtype: xen hvm|kvm
+            filename: segment file
         Returns
-            json
+            dictionary of the segment's header and column views
         """
-        return self._sQuery({
-            'action': 'listiso',
-            'type': vtype
-        })
+        with open(filename, 'rb') as fh:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(mapped)
+        length = int.from_bytes(buffer[:8], 'little')
+        header = json.loads(bytes(buffer[8:8+length]).decode('utf-8'))
 
-    def listNodeGroups(self, vtype='kvm'):
-        """List node groups.
+        offset = 8 + length
+        columns = {}
+        for name, typecode in header['columns']:
+            nbytes = array.array(typecode).itemsize * header['rows']
+            columns[name] = buffer[offset:offset+nbytes].cast(typecode)
+            offset += nbytes + (-nbytes % 8)
 
-            https://documentation.solusvm.com/display/DOCS/List+Node+Groups
+        return {'start': header['start'], 'end': header['end'], 'columns': columns, 'mmap': mapped}
+
+    def _sChunks(self, start, end):
+        """Column views of every segment and in-memory piece that may hold samples in range.
 
         Parameters
-            vtype: xen hvm|kvm
+            start: earliest sample time, or None
+            end: sample time to stop before, or None
         Returns
-            json
+            list of (dictionary of column name to memoryview, whether it is an immutable segment) pairs
         """
-        return self._sQuery({
-            'action': 'listnodegroups',
-            'type': vtype
-        })
-
-    def listNodesIPAddresses(self, nodeid):
-        """List all IP addresses for a node.
+        chunks = [
+            (segment['columns'], True) for segment in self.segments
+            if (start is None or segment['end'] >= start) and (end is None or segment['start'] < end)
+        ]
+        # oldest first: a wrapped buffer's oldest samples follow head
+        pieces = [(self.head, self.capacity), (0, self.head)] if self.size == self.capacity else [(0, self.size)]
+        for first, last in pieces:
+            if last > first:
+                chunks.append((dict((name, memoryview(column)[first:last]) for name, column in self.data.items()), False))
+        return chunks
+
+    def _sSelect(self, column, start, end, key=None):
+        """Gathers times, series indexes and values of samples in range with a value.
 
-            https://documentation.solusvm.com/display/DOCS/List+All+IP+Addresses+for+a+Node
+        Parameters
+            column: value column
+            start: earliest sample time, or None
+            end: sample time to stop before, or None
+            key: series key to restrict to, or None for every series
+        Returns
+            tuple of times, series indexes and values; numpy arrays if numpy is installed, otherwise lists
+        """
+        series = self.index.get(str(key)) if key is not None else None
+        if key is not None and series is None:
+            return ([], [], []) if numpy is None else (numpy.empty(0), numpy.empty(0, dtype=numpy.uint32), numpy.empty(0))
+
+        names = ('time', 'series', column)
+        with self.lock:
+            chunks = self._sChunks(start, end)
+            if numpy is not None:
+                # view immutable segments in place; copy in-memory pieces out while locked
+                chunks = [
+                    dict((name, numpy.frombuffer(chunk[name], dtype=chunk[name].format) if mapped else numpy.array(chunk[name])) for name in names)
+                    for chunk, mapped in chunks
+                ]
+            else:
+                chunks = [dict((name, list(chunk[name])) for name in names) for chunk, mapped in chunks]
+
+        if numpy is None:
+            times, indexes, values = [], [], []
+            for chunk in chunks:
+                for t, s, v in zip(chunk['time'], chunk['series'], chunk[column]):
+                    if (start is None or t >= start) and (end is None or t < end) and (series is None or s == series) and v == v:
+                        times.append(t)
+                        indexes.append(s)
+                        values.append(v)
+            return times, indexes, values
+
+        times = numpy.concatenate([chunk['time'] for chunk in chunks]) if chunks else numpy.empty(0)
+        indexes = numpy.concatenate([chunk['series'] for chunk in chunks]) if chunks else numpy.empty(0, dtype=numpy.uint32)
+        values = numpy.concatenate([chunk[column] for chunk in chunks]) if chunks else numpy.empty(0)
+        mask = ~numpy.isnan(values)
+        if start is not None:
+            mask &= times >= start
+        if end is not None:
+            mask &= times < end
+        if series is not None:
+            mask &= indexes == series
+        return times[mask], indexes[mask], values[mask]
+
+    def series(self, key, column, start=None, end=None):
+        """Samples of one series in time order.
 
         Parameters
-            nodeid: id of node
+            key: series key
+            column: value column
+            start: earliest sample time, or None
+            end: sample time to stop before, or None
         Returns
-            json
+            tuple of times and values; numpy arrays if numpy is installed, otherwise lists
         """
-        return self._sQuery({
-            'action': 'node-iplist',
-            'nodeid': nodeid
-        })
+        times, _, values = self._sSelect(column, start, end, key)
+        if numpy is None:
+            ordered = sorted(zip(times, values))
+            return [t for t, _ in ordered], [v for _, v in ordered]
+        order = numpy.argsort(times, kind='stable')
+        return times[order], values[order]
 
-    def listPlans(self, vtype='kvm'):
-        """List plans.
+    def aggregate(self, column, how='mean', start=None, end=None):
+        """Aggregates each series' samples in range.
 
-            https://documentation.solusvm.com/display/DOCS/List+Plans
+        Parameters
+            column: value column
+            how: mean|sum|min|max|count|last
+            start: earliest sample time, or None
+            end: sample time to stop before, or None
+        Returns
+            dictionary of series key to value, for series with samples in range
+        """
+        times, indexes, values = self._sSelect(column, start, end)
+        if numpy is None:
+            groups = {}
+            for t, s, v in sorted(zip(times, indexes, values)):
+                groups.setdefault(s, []).append(v)
+            reducers = {'mean': lambda vs: sum(vs) / len(vs), 'sum': sum, 'min': min, 'max': max, 'count': len, 'last': lambda vs: vs[-1]}
+            return dict((self.keys[s], reducers[how](vs)) for s, vs in groups.items())
+
+        present, result = self._sReduce(indexes, times, values, how)
+        keys = self.keys
+        return dict(zip([keys[s] for s in present.tolist()], result.tolist()))
+
+    @staticmethod
+    def _sReduce(groups, times, values, how):
+        """Vectorized per-group reduction.
 
         Parameters
-            vtype: openvz|xen|xen hvm|kvm
+            groups: numpy array of non-negative group numbers
+            times: numpy array of sample times
+            values: numpy array of sample values
+            how: mean|sum|min|max|count|last
         Returns
-            json
+            tuple of numpy arrays of the groups present and their reduced values
         """
-        return self._sQuery({
-            'action': 'listplans',
-            'type': vtype
-        })
+        if how not in ('mean', 'sum', 'min', 'max', 'count', 'last'):
+            raise SolusVMError('unknown aggregation: '+how)
+
+        present, inverse = numpy.unique(groups, return_inverse=True)
+        if how in ('mean', 'sum', 'count'):
+            counts = numpy.bincount(inverse, minlength=len(present)).astype(float)
+            if how == 'count':
+                return present, counts
+            sums = numpy.bincount(inverse, weights=values, minlength=len(present))
+            return present, sums if how == 'sum' else sums / counts
+        if how == 'last':
+            order = numpy.lexsort((times, inverse))
+            last = numpy.r_[inverse[order][1:] != inverse[order][:-1], True] if len(order) else numpy.empty(0, dtype=bool)
+            return present, values[order][last]
+
+        result = numpy.full(len(present), numpy.inf if how == 'min' else -numpy.inf)
+        (numpy.minimum if how == 'min' else numpy.maximum).at(result, inverse, values)
+        return present, result
+
+    def downsample(self, column, step, how='mean', start=None, end=None):
+        """Aggregates every series into buckets of step seconds.
 
-    def listTemplates(self, vtype='kvm'):
-        """List templates.
+        Parameters
+            column: value column
+            step: bucket width in seconds
+            how: mean|sum|min|max|count|last
+            start: earliest sample time, or None
+            end: sample time to stop before, or None
+        Returns
+            dictionary of series key to (bucket start times, values), each in time order
+        """
+        times, indexes, values = self._sSelect(column, start, end)
+        if numpy is None:
+            buckets = {}
+            for t, s, v in sorted(zip(times, indexes, values)):
+                buckets.setdefault((s, int(t // step)), []).append(v)
+            reducers = {'mean': lambda vs: sum(vs) / len(vs), 'sum': sum, 'min': min, 'max': max, 'count': len, 'last': lambda vs: vs[-1]}
+            result = {}
+            for (s, bucket), vs in sorted(buckets.items()):
+                pair = result.setdefault(self.keys[s], ([], []))
+                pair[0].append(bucket * step)
+                pair[1].append(reducers[how](vs))
+            return result
+
+        if not len(times):
+            return {}
+        buckets = numpy.floor_divide(times, step).astype(numpy.int64)
+        first = buckets.min()
+        width = int(buckets.max() - first) + 1
+        present, reduced = self._sReduce(indexes.astype(numpy.int64) * width + (buckets - first), times, values, how)
+
+        series = present // width
+        starts = (present % width + first) * step
+        bounds = numpy.flatnonzero(numpy.r_[True, series[1:] != series[:-1], True])
+        keys = self.keys
+        return dict(
+            (keys[int(series[bounds[i]])], (starts[bounds[i]:bounds[i+1]], reduced[bounds[i]:bounds[i+1]]))
+            for i in range(len(bounds) - 1)
+        )
+
+    def close(self):
+        """Writes any buffered samples to a final segment and releases the memory maps of on-disk segments.
 
-            https://documentation.solusvm.com/display/DOCS/List+Templates
+        Parameters
+            None
+        Returns
+            None
+        """
+        with self.lock:
+            if self.path is not None and self.size:
+                self._sSpill()
+            segments, self.segments = self.segments, []
+        for segment in segments:
+            for view in segment['columns'].values():
+                view.release()
+            segment['mmap'].close()
+
+class TimeSeriesCollector:
+    # node-statistics fields sampled per node
+    NODE_COLUMNS = ('freememory', 'totalmemory', 'freedisk', 'totaldisk', 'freeips', 'virtualservers')
+    # vserver-infoall total,used,free,percent fields sampled per virtual server
+    VSERVER_FIELDS = ('bandwidth', 'memory', 'hdd')
+    VSERVER_COLUMNS = ('bandwidth_total', 'bandwidth_used', 'memory_total', 'memory_used', 'hdd_total', 'hdd_used')
+
+    def __init__(self, client, nodeids=None, vserverids=None, vtype='kvm', interval=60, capacity=65536, path=None, max_workers=32):
+        """Samples node statistics and virtual server usage concurrently into TimeSeries buffers.
+
+            collector.nodes holds one series per node and collector.vservers one per virtual
+            server, keyed by id. Each buffer keeps its last capacity samples across all of its
+            series, so without a path 50000 virtual servers fill the default capacity in about
+            one collection; pass a path to keep history.
 
         Parameters
+            client: SolusVM client
+            nodeids: ids of nodes to sample, or None for every node of vtype
+            vserverids: ids of virtual servers to sample, or None for every virtual server on the sampled nodes
             vtype: openvz|xen|xen hvm|kvm
+            interval: seconds between samples when running
+            capacity: number of samples each buffer holds in memory, shared by all of its series
+            path: directory for on-disk segments, or None to keep only the last capacity samples
+            max_workers: maximum number of requests in flight at once
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'listtemplates',
-            'type': vtype
-        })
+        self.client = client
+        self.nodeids = nodeids
+        self.vserverids = vserverids
+        self.vtype = vtype
+        self.interval = interval
+        self.max_workers = max_workers
 
-    def xenNodeResources(self, nodeid):
-        """Retrieve resource count from specified xen node.
+        self.nodes = TimeSeries(self.NODE_COLUMNS, capacity, os.path.join(path, 'nodes') if path else None)
+        self.vservers = TimeSeries(self.VSERVER_COLUMNS, capacity, os.path.join(path, 'vservers') if path else None)
 
-            https://documentation.solusvm.com/display/DOCS/Xen+Node+Resources
+    @staticmethod
+    def _sUsage(state, field):
+        """Parses one total,used,free,percent field of a vserver-infoall response.
 
         Parameters
-            nodeid: id of node
+            state: json returned by virtualServerState
+            field: bandwidth|memory|hdd
         Returns
-            json
+            tuple of total and used, or (None, None) if absent
         """
-        return self._sQuery({
-            'action': 'node-xenresources',
-            'nodeid': nodeid
-        })
+        parts = str(state.get(field) or '').split(',')
+        try:
+            return float(parts[0]), float(parts[1])
+        except (IndexError, ValueError):
+            return None, None
 
-    def nodeStatistics(self, nodeid):
-        """Retrieve statistics for specified node.
+    def collect(self):
+        """Takes one sample of every node and virtual server.
 
-            https://documentation.solusvm.com/display/DOCS/Node+Statistics
+            errors holds 'nodes' when the node listing failed, 'virtualservers <nodeid>'
+            when a node's virtual servers could not be listed, 'node <nodeid>' when its
+            statistics could not be read and the vserverid of each failed virtual server.
 
         Parameters
-            nodeid: id of node
+            None
         Returns
-            json
+            dictionary of sampled node and virtual server counts and errors keyed as above
         """
-        return self._sQuery({
-            'action': 'node-statistics',
-            'nodeid': nodeid
-        })
-
-    def clientAuthenticate(self, username, password):
-        """Authenticates specified username and password.
-
-            https://documentation.solusvm.com/display/DOCS/Client+Authenticate
+        client = self.client
+        now = time.time()
+        errors = {}
+
+        nodeids = self.nodeids
+        vserverids = self.vserverids
+        if vserverids is None:
+            if nodeids is None:
+                servers = client.listAllVirtualServers(self.vtype, max_workers=self.max_workers)
+                nodeids = servers['nodes']
+            else:
+                listed = client.batch('listVirtualServers', nodeids, max_workers=self.max_workers)
+                servers = client._sMergeVirtualServers(list(listed['results'].items()) + list(listed['errors'].items()))
+            vserverids = [record.get('vserverid') for record in servers.get('virtualservers', [])]
+            errors.update(
+                ('nodes' if nodeid == 'nodes' else 'virtualservers '+str(nodeid), error) for nodeid, error in servers['errors'].items()
+            )
+        elif nodeids is None:
+            response = client.listNodesById(self.vtype)
+            if client._sFailed(response):
+                errors['nodes'] = client._sStatusmsg(response)
+            nodeids = client._sNodeIds(response) if isinstance(response, dict) else []
+
+        nodes = client.batch('nodeStatistics', nodeids, max_workers=self.max_workers)
+        vservers = client.batch(
+            'virtualServerState', [(vserverid, True, True, self.VSERVER_FIELDS) for vserverid in vserverids], max_workers=self.max_workers
+        )
+
+        noderows = []
+        for nodeid, stats in nodes['results'].items():
+            if stats.get('status') not in (None, 'success'):
+                errors['node '+str(nodeid)] = stats.get('statusmsg', 'unknown error')
+                continue
+            row = {}
+            for column in self.NODE_COLUMNS:
+                try:
+                    row[column] = float(stats.get(column))
+                except (TypeError, ValueError):
+                    pass
+            noderows.append((nodeid, row))
+
+        vserverrows = []
+        for vserverid, state in vservers['results'].items():
+            if state.get('status') != 'success':
+                errors[str(vserverid)] = state.get('statusmsg', 'unknown error')
+                continue
+            row = {}
+            for field in self.VSERVER_FIELDS:
+                row[field+'_total'], row[field+'_used'] = self._sUsage(state, field)
+            vserverrows.append((vserverid, row))
+
+        errors.update(('node '+str(nodeid), str(error) or error.__class__.__name__) for nodeid, error in nodes['errors'].items())
+        errors.update((str(vserverid), str(error) or error.__class__.__name__) for vserverid, error in vservers['errors'].items())
+
+        self.nodes.append(now, noderows)
+        self.vservers.append(now, vserverrows)
+        return {'nodes': len(noderows), 'vservers': len(vserverrows), 'errors': errors}
+
+    def run(self, stop=None):
+        """Samples every interval until stop is set.
 
         Parameters
-            username:
-            password:
+            stop: threading.Event ending the loop, or None to run forever
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'client-authenticate',
-            'username': username,
-            'password': password
-        })
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            started = time.monotonic()
+            self.collect()
+            stop.wait(max(0, self.interval - (time.monotonic() - started)))
 
-    def clientExists(self, username):
-        """Checks to see if the specified client exists.
+    def close(self):
+        self.nodes.close()
+        self.vservers.close()
 
-            https://documentation.solusvm.com/display/DOCS/Check+if+Client+Exists
+class FleetAnalytics:
+    # node-statistics fields loaded per node
+    NODE_COLUMNS = ('freememory', 'totalmemory', 'freedisk', 'totaldisk', 'freeips', 'virtualservers')
+
+    def __init__(self, client, vtype='kvm', nodegroups=None, max_workers=32):
+        """Vectorized utilization queries over node statistics and virtual server usage. Requires numpy.
 
+            load() gathers the fleet into columnar numpy arrays: analytics.nodes and
+            analytics.vservers are dictionaries of column name to array, one element per
+            node or virtual server, with id and nodegroup columns alongside the metrics.
+
+                analytics.load(usage=True)
+                analytics.filter('nodes', lambda c: (c['memory_used_pct'] > 0.85) | (c['disk_used_pct'] > 0.85))
+                analytics.top('vservers', 'bandwidth_used', 20)
 
         Parameters
-            username:
+            client: SolusVM client
+            vtype: openvz|xen|xen hvm|kvm
+            nodegroups: dictionary of node group id to node ids, or None to use each node's nodegroup
+                statistic; groupBy raises SolusVMError when a node lacks it
+            max_workers: maximum number of requests in flight at once
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action': 'client-checkexists',
-            'username': username
-        })
+        if numpy is None:
+            raise ImportError('FleetAnalytics requires numpy')
 
-    def createClient(self, username, password, email, firstname, lastname, company):
-        """Creates a client.
+        self.client = client
+        self.vtype = vtype
+        self.nodegroups = nodegroups
+        self.max_workers = max_workers
 
-            https://documentation.solusvm.com/pages/viewpage.action?pageId=558430
+        self.nodes = {}
+        self.vservers = {}
+        self.errors = {}
+        self.ungrouped = []
+
+    def load(self, usage=False, collector=None):
+        """Gathers node statistics, node groups and virtual servers into columnar arrays.
+
+            Virtual server usage columns (bandwidth, memory and hdd total, used and
+            used_pct) come from the latest sample of collector when given, otherwise from
+            vserver-infoall when usage is set; without either they are NaN. A failed node
+            or node group listing raises SolusVMError and keeps the previously loaded arrays.
 
         Parameters
-            username:
-            password:
-            email:
-            firstname:
-            lastname:
-            company:
+            usage: whether to query every virtual server's usage
+            collector: TimeSeriesCollector whose latest samples supply usage, or None
         Returns
-            json
+            dictionary of errors keyed by 'node <nodeid>' for statistics, 'virtualservers <nodeid>'
+            for listings and vserverid for usage
         """
-        return self._sQuery({
-            'action': 'client-create',
-            'username': username,
-            'password': password,
-            'email': email,
-            'firstname': firstname,
-            'lastname': lastname,
-            'company': company
-        })
-
-    def changeClientPassword(self, username, password):
-        """Updates the specified client's password.
-
-            https://documentation.solusvm.com/display/DOCS/Change+Client+Password
+        client = self.client
+        response = client.listNodesById(self.vtype)
+        if client._sFailed(response):
+            # an empty fleet would read as no load anywhere
+            raise SolusVMError('node listing failed: '+client._sStatusmsg(response))
+        nodeids = [str(nodeid) for nodeid in client._sNodeIds(response)]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            groups = executor.submit(client.listNodeGroups, self.vtype)
+            listed = executor.submit(client.batch, 'listVirtualServers', nodeids, self.max_workers)
+            stats = client.batch('nodeStatistics', nodeids, max_workers=self.max_workers)
+            groups, listed = groups.result(), listed.result()
+
+        if client._sFailed(groups):
+            raise SolusVMError('node group listing failed: '+client._sStatusmsg(groups))
+
+        groupnames = dict((groupid, name) for name, groupid in Placement._sGroups(groups).items())
+        membership = {}
+        for groupid, members in (self.nodegroups or {}).items():
+            membership.update((str(nodeid), str(groupid)) for nodeid in members)
+
+        errors = {}
+        nodes = []
+        ungrouped = []
+        for nodeid in nodeids:
+            result = stats['results'].get(nodeid, stats['errors'].get(nodeid))
+            if isinstance(result, Exception) or result.get('status') not in (None, 'success'):
+                errors['node '+nodeid] = str(result) if isinstance(result, Exception) else result.get('statusmsg', 'unknown error')
+                continue
+            groupid = membership.get(nodeid) if self.nodegroups is not None else result.get('nodegroup')
+            if self.nodegroups is None and groupid is None:
+                ungrouped.append(nodeid)
+            nodes.append((nodeid, groupnames.get(str(groupid), str(groupid) if groupid is not None else ''), result))
+
+        self.nodes = self._sNodeColumns(nodes)
+        self.ungrouped = ungrouped
+
+        nodegroup = dict(zip(self.nodes['id'].tolist(), self.nodes['nodegroup'].tolist()))
+        vservers = []
+        for nodeid in nodeids:
+            result = listed['results'].get(nodeid, listed['errors'].get(nodeid))
+            if isinstance(result, Exception) or result.get('status') not in (None, 'success'):
+                errors['virtualservers '+nodeid] = client._sStatusmsg(result)
+                continue
+            vservers.extend((str(record.get('vserverid')), nodeid) for record in result.get('virtualservers') or [])
+
+        self.vservers = {
+            'id': numpy.array([vserverid for vserverid, _ in vservers], dtype=object),
+            'node': numpy.array([nodeid for _, nodeid in vservers], dtype=object),
+            'nodegroup': numpy.array([nodegroup.get(nodeid, '') for _, nodeid in vservers], dtype=object)
+        }
+        if collector is not None:
+            self._sCollectedUsage(collector)
+        elif usage:
+            errors.update(self._sQueriedUsage())
+        else:
+            for column in TimeSeriesCollector.VSERVER_COLUMNS:
+                self.vservers[column] = numpy.full(len(vservers), numpy.nan)
+        for field in TimeSeriesCollector.VSERVER_FIELDS:
+            self.vservers[field+'_used_pct'] = self._sRatio(self.vservers[field+'_used'], self.vservers[field+'_total'])
+
+        self.errors = errors
+        return errors
+
+    @staticmethod
+    def _sRatio(numerator, denominator):
+        """Elementwise ratio, NaN where the denominator is zero or missing.
 
         Parameters
-            username:
-            password:
+            numerator: numpy array
+            denominator: numpy array
         Returns
-            json
+            numpy array
         """
-        return self._sQuery({
-            'action': 'client-updatepassword',
-            'username': username,
-            'password': password
-        })
-
-    def changeClientUsername(self, username, newusername):
-        """Updates the specified client's password.
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.where(denominator > 0, numerator / denominator, numpy.nan)
 
-            https://documentation.solusvm.com/display/DOCS/Change+Client+Username
+    def _sNodeColumns(self, nodes):
+        """Builds the node columns.
 
         Parameters
-            username: old username
-            newusername: new username
+            nodes: list of (nodeid, node group name, json) tuples
         Returns
-            json
+            dictionary of column name to numpy array
         """
-        return self._sQuery({
-            'action': 'client-change-username',
-            'username': username,
-            'newusername': newusername
-        })
+        columns = {
+            'id': numpy.array([nodeid for nodeid, _, _ in nodes], dtype=object),
+            'nodegroup': numpy.array([group for _, group, _ in nodes], dtype=object)
+        }
+        for column in self.NODE_COLUMNS:
+            values = [_number(result.get(column)) for _, _, result in nodes]
+            columns[column] = numpy.array([value if isinstance(value, (int, float)) else numpy.nan for value in values], dtype=float)
 
-    def listClients(self):
-        """Lists all clients.
+        columns['memory_used_pct'] = 1 - self._sRatio(columns['freememory'], columns['totalmemory'])
+        columns['disk_used_pct'] = 1 - self._sRatio(columns['freedisk'], columns['totaldisk'])
+        return columns
 
-            https://documentation.solusvm.com/display/DOCS/List+Clients
+    def _sCollectedUsage(self, collector):
+        """Fills virtual server usage columns from a collector's latest samples.
 
         Parameters
-            None
+            collector: TimeSeriesCollector
         Returns
-            json
+            None
         """
-        return self._sQuery({
-            'action':'client-list'
-        })
+        ids = self.vservers['id'].tolist()
+        for column in TimeSeriesCollector.VSERVER_COLUMNS:
+            latest = collector.vservers.aggregate(column, 'last')
+            self.vservers[column] = numpy.array([latest.get(vserverid, numpy.nan) for vserverid in ids], dtype=float)
 
-    def deleteClient(self, username):
-        """Deletes specified client.
-
-            https://documentation.solusvm.com/display/DOCS/Delete+Client
+    def _sQueriedUsage(self):
+        """Fills virtual server usage columns from vserver-infoall.
 
         Parameters
-            username:
+            None
         Returns
-            json
+            dictionary of errors keyed by vserverid
         """
-        return self._sQuery({
-            'action': 'client-delete',
-            'username': username
-        })
-
-    def editClient(self, username, kwargs):
-        """Edits specified client.
-
-            https://documentation.solusvm.com/display/DOCS/Edit+Client
+        ids = self.vservers['id'].tolist()
+        outcome = self.client.batch(
+            'virtualServerState', [(vserverid, True, True, TimeSeriesCollector.VSERVER_FIELDS) for vserverid in ids], max_workers=self.max_workers
+        )
+
+        errors = dict((vserverid, str(error) or error.__class__.__name__) for vserverid, error in outcome['errors'].items())
+        columns = dict((column, numpy.full(len(ids), numpy.nan)) for column in TimeSeriesCollector.VSERVER_COLUMNS)
+        for i, vserverid in enumerate(ids):
+            state = outcome['results'].get(vserverid)
+            if state is None:
+                continue
+            if state.get('status') != 'success':
+                errors[vserverid] = state.get('statusmsg', 'unknown error')
+                continue
+            for field in TimeSeriesCollector.VSERVER_FIELDS:
+                columns[field+'_total'][i], columns[field+'_used'][i] = TimeSeriesCollector._sUsage(state, field)
+
+        self.vservers.update(columns)
+        return errors
+
+    def _sTable(self, of):
+        """Columns of nodes or vservers.
 
         Parameters
-            username:
-            *firsntame
-            *lastname
-            *company
-            *email
+            of: nodes|vservers
         Returns
-            json
+            dictionary of column name to numpy array
         """
-        kwargs['action'] = 'client-edit'
-        kwargs['username'] = username
-        return self._sQuery(kwargs)
-
-    def deleteReseller(self, username):
-        """Deletes specified reseller.
+        if of not in ('nodes', 'vservers'):
+            raise SolusVMError('unknown table: '+str(of))
+        return getattr(self, of)
 
-            https://documentation.solusvm.com/display/DOCS/Delete+Reseller
+    def filter(self, of, predicate):
+        """Ids of rows matching a vectorized predicate.
 
         Parameters
-            username:
+            of: nodes|vservers
+            predicate: callable taking the column dictionary and returning a boolean numpy array
         Returns
-            json
+            list of ids
         """
-        return self._sQuery({
-            'action': 'reseller-delete',
-            'username': username
-        })
+        table = self._sTable(of)
+        return table['id'][numpy.asarray(predicate(table), dtype=bool)].tolist()
 
-    def resellerInfo(self, username):
-        """Retrieves details of specified reseller.
+    def above(self, of, thresholds):
+        """Ids of rows above any of several thresholds.
 
-            https://documentation.solusvm.com/display/DOCS/Reseller+Information
+            analytics.above('nodes', {'memory_used_pct': 0.85, 'disk_used_pct': 0.85})
 
         Parameters
-            username:
+            of: nodes|vservers
+            thresholds: dictionary of column name to threshold
         Returns
-            json
+            list of ids
         """
-        return self._sQuery({
-            'action': 'reseller-info',
-            'username': username
-        })
-
-    def listResellers(self):
-        """Lists all resellers.
+        table = self._sTable(of)
+        mask = numpy.zeros(len(table['id']), dtype=bool)
+        for column, threshold in thresholds.items():
+            mask |= table[column] > threshold
+        return table['id'][mask].tolist()
 
-            https://documentation.solusvm.com/display/DOCS/List+Resellers
+    def percentiles(self, of, column, q=(50, 90, 99)):
+        """Percentiles of a column, ignoring missing values.
 
         Parameters
-            None
+            of: nodes|vservers
+            column: column name
+            q: percentiles between 0 and 100
         Returns
-            json
+            dictionary of percentile to value
         """
-        return self._sQuery({
-            'action':'reseller-list'
-        })
-
-    def createReseller(self, kwargs):
-        """Creates reseller.
+        values = self._sTable(of)[column]
+        values = values[~numpy.isnan(values)]
+        if not len(values):
+            return dict((p, None) for p in q)
+        return dict(zip(q, numpy.percentile(values, q).tolist()))
 
-            https://documentation.solusvm.com/display/DOCS/Create+Reseller
+    def groupBy(self, of, column, how='mean'):
+        """Aggregates a column per node group.
 
         Parameters
-            data: dictionary key/value pairs
+            of: nodes|vservers
+            column: column name
+            how: mean|sum|min|max|count
         Returns
-            json
+            dictionary of node group name to value
         """
-        kwargs['action'] = 'reseller-create'
-        return self._sQuery(kwargs)
-
-    def modifyResellerResources(self, username, kwargs):
-        """Modifies reseller's available resources.
-
-            https://documentation.solusvm.com/display/DOCS/Modify+Reseller+Resources
+        if self.ungrouped:
+            raise SolusVMError('node statistics of nodes '+', '.join(self.ungrouped)+' have no nodegroup; pass nodegroups to FleetAnalytics')
+        table = self._sTable(of)
+        values = table[column]
+        present = ~numpy.isnan(values)
+        names, groups = numpy.unique(table['nodegroup'][present].astype(str), return_inverse=True)
+        found, reduced = TimeSeries._sReduce(groups, numpy.zeros(len(groups)), values[present], how)
+        return dict(zip(names[found].tolist(), reduced.tolist()))
+
+    def top(self, of, column, n=20, largest=True):
+        """Ranks rows by a column.
 
         Parameters
-            username:
-            data: dictionary key/value pairs
+            of: nodes|vservers
+            column: column name
+            n: number of rows to return
+            largest: whether to rank descending
         Returns
-            json
+            list of (id, value) tuples in rank order
         """
-        kwargs['action'] = 'reseller-modifyresources'
-        kwargs['username'] = username
-        return self._sQuery(kwargs)
+        table = self._sTable(of)
+        values = table[column]
+        candidates = numpy.flatnonzero(~numpy.isnan(values))
+        keys = -values[candidates] if largest else values[candidates]
+        if n < len(candidates):
+            part = numpy.argpartition(keys, n)[:n]
+            candidates, keys = candidates[part], keys[part]
+        order = candidates[numpy.argsort(keys, kind='stable')]
+        return list(zip(table['id'][order].tolist(), values[order].tolist()))
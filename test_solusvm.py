@@ -0,0 +1,968 @@
+import asyncio
+import json
+import socketserver
+import threading
+import time
+
+import pytest
+import requests
+
+import mockserver
+import solusvm
+from mockserver import MockSolusVM
+
+
+def _client(responses, **options):
+    """Builds a client answered by a StubTransport, with its own circuit breaker.
+
+    Parameters
+        responses: dictionary of action to json, callable or exception
+        options: further SolusVM keyword options
+    Returns
+        tuple of SolusVM, StubTransport
+    """
+    transport = solusvm.StubTransport(responses)
+    options.setdefault('breaker', solusvm.CircuitBreaker())
+    options.setdefault('backoff', 0)
+    return solusvm.SolusVM('stub.example.com', 'ID', 'KEY', transport=transport, **options), transport
+
+def _mockClient(mock, **options):
+    """Builds a client of a running MockSolusVM, with its own circuit breaker.
+
+    Parameters
+        mock: MockSolusVM
+        options: further SolusVM keyword options
+    Returns
+        SolusVM
+    """
+    options.setdefault('breaker', solusvm.CircuitBreaker())
+    return solusvm.SolusVM(mock.host, mock.api_id, mock.api_key, scheme='http', port=mock.port, **options)
+
+def _actions(transport, action):
+    return sum(1 for params in transport.calls if params.get('action') == action)
+
+NODE_LIST_ERROR = {'status': 'error', 'statusmsg': 'Invalid ipaddress'}
+
+
+def test_queries_reuse_one_pooled_connection():
+    with MockSolusVM(nodes=1, vservers=2) as mock:
+        with _mockClient(mock, pool_maxsize=4) as client:
+            for _ in range(5):
+                assert client.virtualServerStatus(100)['statusmsg'] == 'online'
+            pools = client.transport.session.get_adapter(client.url).poolmanager.pools
+            assert [pools[key].num_connections for key in pools.keys()] == [1]
+
+@pytest.mark.skipif(solusvm.aiohttp is None, reason='requires aiohttp')
+def test_async_client_matches_sync_client():
+    async def query(mock):
+        async with solusvm.AsyncSolusVM(mock.host, mock.api_id, mock.api_key, scheme='http', port=mock.port, breaker=solusvm.CircuitBreaker()) as client:
+            return await asyncio.gather(client.virtualServerInfo(101), *[client.virtualServerStatus(vserverid) for vserverid in range(100, 110)])
+
+    with MockSolusVM(nodes=2, vservers=5) as mock:
+        results = asyncio.run(query(mock))
+        with _mockClient(mock) as client:
+            assert results[0] == client.virtualServerInfo(101)
+    assert [result['statusmsg'] for result in results[1:]] == ['online'] * 10
+
+def test_listAllVirtualServers_merges_nodes_and_reports_failed_ones():
+    def listing(params):
+        if params['nodeid'] == '2':
+            return {'status': 'error', 'statusmsg': 'Node not found'}
+        return {'status': 'success', 'virtualservers': [{'vserverid': params['nodeid']+'0'}]}
+    client, transport = _client({'node-idlist': {'status': 'success', 'nodes': '1,2,3'}, 'node-virtualservers': listing})
+    fleet = client.listAllVirtualServers(max_workers=3)
+    assert fleet['status'] == 'success'
+    assert sorted(vserver['vserverid'] for vserver in fleet['virtualservers']) == ['10', '30']
+    assert fleet['errors'] == {'2': 'Node not found'}
+
+def test_listAllVirtualServers_reports_node_list_error():
+    client, transport = _client({'node-idlist': NODE_LIST_ERROR})
+    fleet = client.listAllVirtualServers()
+    assert fleet['status'] == 'error'
+    assert fleet['errors'] == {'nodes': 'Invalid ipaddress'}
+    assert _actions(transport, 'node-virtualservers') == 0
+
+def test_listAllVirtualServers_reports_rejected_key_against_mock():
+    with MockSolusVM(nodes=2, vservers=3) as mock:
+        with solusvm.SolusVM(mock.host, mock.api_id, 'WRONG', scheme='http', port=mock.port, breaker=solusvm.CircuitBreaker()) as client:
+            fleet = client.listAllVirtualServers()
+    assert fleet['status'] == 'error'
+    assert fleet['errors'] == {'nodes': 'Invalid id or key'}
+
+@pytest.mark.skipif(solusvm.aiohttp is None, reason='requires aiohttp')
+def test_async_listAllVirtualServers_reports_node_list_error():
+    async def sweep():
+        async with solusvm.AsyncSolusVM('stub.example.com', 'ID', 'KEY', transport=solusvm.StubTransport({'node-idlist': NODE_LIST_ERROR}),
+                                        breaker=solusvm.CircuitBreaker()) as client:
+            return await client.listAllVirtualServers()
+    assert asyncio.run(sweep())['errors'] == {'nodes': 'Invalid ipaddress'}
+
+def test_batch_results_follow_item_order():
+    def suspend(params):
+        vserverid = int(params['vserverid'])
+        if vserverid == 103:
+            raise solusvm.SolusVMError('refused')
+        # later items finish first
+        time.sleep((110 - vserverid) * 0.002)
+        return {'status': 'success', 'vserverid': params['vserverid']}
+    client, transport = _client({'vserver-suspend': suspend})
+    outcome = client.batch('suspendVirtualServer', range(100, 108), max_workers=8)
+    assert list(outcome['results']) == [100, 101, 102, 104, 105, 106, 107]
+    assert [result['vserverid'] for result in outcome['results'].values()] == ['100', '101', '102', '104', '105', '106', '107']
+    assert list(outcome['errors']) == [103]
+    assert str(outcome['errors'][103]) == 'refused'
+
+def test_batch_passes_tuple_arguments():
+    client, transport = _client({'vserver-bandwidth': lambda params: dict(params, status='success')})
+    outcome = client.batch('changeBandwidthLimits', [(101, 500, 50), (102, 1000, 100)])
+    assert [(result['vserverid'], result['limit'], result['overlimit']) for result in outcome['results'].values()] == [('101', '500', '50'), ('102', '1000', '100')]
+
+def test_memory_cache_expires_and_evicts_least_recently_used():
+    cache = solusvm.MemoryCache(maxsize=2)
+    cache.set('a', 1, 60)
+    cache.set('b', 2, 60)
+    assert cache.get('a') == 1
+    cache.set('c', 3, 60)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+    cache.set('d', 4, 0.01)
+    time.sleep(0.02)
+    assert cache.get('d') is None
+
+def test_disk_cache_is_shared_and_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    writer = solusvm.DiskCache(path, maxsize=2)
+    reader = solusvm.DiskCache(path, maxsize=2)
+    writer.set('a', {'plans': 'small'}, 60)
+    time.sleep(0.01)
+    writer.set('b', 2, 60)
+    assert reader.get('a') == {'plans': 'small'}
+    time.sleep(0.01)
+    writer.set('c', 3, 60)
+    assert (reader.get('a'), reader.get('b'), reader.get('c')) == ({'plans': 'small'}, None, 3)
+
+    writer.set('d', 4, 0.01)
+    time.sleep(0.02)
+    assert reader.get('d') is None
+    writer.clear('c')
+    assert reader.get('c') is None
+
+def test_catalogue_responses_are_cached_until_invalidated():
+    client, transport = _client({'listplans': {'status': 'success', 'plans': 'small'}}, cache=solusvm.MemoryCache())
+    assert client.listPlans()['plans'] == 'small'
+    assert client.listPlans()['plans'] == 'small'
+    assert _actions(transport, 'listplans') == 1
+    client.invalidateCache('listplans')
+    client.listPlans()
+    assert _actions(transport, 'listplans') == 2
+
+def test_mutating_call_keeps_catalogue_cached():
+    client, transport = _client({
+        'listplans': {'status': 'success', 'plans': 'small'},
+        'vserver-info': {'status': 'success', 'vserverid': '1'},
+        'vserver-boot': {'status': 'success'}
+    }, cache=solusvm.MemoryCache(), cache_ttls={'vserver-info': 60})
+    client.listPlans()
+    client.virtualServerInfo(1)
+    client.bootVirtualServer(1)
+    client.listPlans()
+    client.virtualServerInfo(1)
+    assert _actions(transport, 'listplans') == 1
+    assert _actions(transport, 'vserver-info') == 2
+
+def test_terminate_invalidates_cached_clients():
+    client, transport = _client({
+        'client-list': {'status': 'success', 'clients': []},
+        'vserver-terminate': {'status': 'success'}
+    }, cache=solusvm.MemoryCache(), cache_ttls={'client-list': 60})
+    client.listClients()
+    client.terminateVirtualServer(1, deleteclient=True)
+    client.listClients()
+    assert _actions(transport, 'client-list') == 2
+
+def _slow(response, delay=0.1):
+    def answer(params):
+        time.sleep(delay)
+        return response
+    return answer
+
+def test_concurrent_identical_reads_share_one_request():
+    client, transport = _client({'vserver-info': _slow({'status': 'success', 'vserverid': '1', 'ips': ['10.0.0.1']})})
+    out = [None] * 4
+    def query(i):
+        out[i] = client.virtualServerInfo(1)
+    threads = [threading.Thread(target=query, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert _actions(transport, 'vserver-info') == 1
+    assert all(result == out[0] for result in out)
+    # every caller gets its own copy
+    assert len(set(id(result) for result in out)) == 4
+    out[1]['ips'].append('10.0.0.2')
+    assert out[0]['ips'] == ['10.0.0.1']
+
+def test_mutating_calls_are_not_coalesced():
+    client, transport = _client({'vserver-boot': _slow({'status': 'success'}, 0.05)})
+    threads = [threading.Thread(target=client.bootVirtualServer, args=(1,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert _actions(transport, 'vserver-boot') == 3
+
+@pytest.mark.skipif(solusvm.aiohttp is None, reason='requires aiohttp')
+def test_async_coalesced_reads_get_their_own_copy():
+    transport = solusvm.StubTransport({'vserver-info': _slow({'status': 'success', 'vserverid': '1'})})
+
+    async def query():
+        async with solusvm.AsyncSolusVM('stub.example.com', 'ID', 'KEY', transport=transport, breaker=solusvm.CircuitBreaker()) as client:
+            return await asyncio.gather(*[client.virtualServerInfo(1) for _ in range(3)])
+    out = asyncio.run(query())
+    assert _actions(transport, 'vserver-info') == 1
+    assert out[0] == out[1] == out[2]
+    assert out[0] is not out[1] and out[1] is not out[2]
+
+def test_reads_are_retried_and_writes_are_not():
+    client, transport = _client({
+        'vserver-status': requests.ConnectionError('refused'),
+        'vserver-boot': requests.ConnectionError('refused')
+    }, retries=2, breaker=solusvm.CircuitBreaker(min_calls=100))
+    with pytest.raises(requests.ConnectionError):
+        client.virtualServerStatus(1)
+    with pytest.raises(requests.ConnectionError):
+        client.bootVirtualServer(1)
+    assert _actions(transport, 'vserver-status') == 3
+    assert _actions(transport, 'vserver-boot') == 1
+
+def test_server_errors_are_retried_against_mock():
+    with MockSolusVM(nodes=1, vservers=1, error_rate=1.0) as mock:
+        with _mockClient(mock, retries=2, backoff=0, breaker=solusvm.CircuitBreaker(min_calls=100)) as client:
+            with pytest.raises(requests.HTTPError):
+                client.virtualServerStatus(100)
+        assert mock.requests == 3
+
+def test_breaker_opens_and_fails_fast():
+    breaker = solusvm.CircuitBreaker(threshold=0.5, window=4, min_calls=4, reset_timeout=60)
+    client, transport = _client({'vserver-status': requests.ConnectionError('refused')}, retries=0, breaker=breaker)
+    for _ in range(4):
+        with pytest.raises(requests.ConnectionError):
+            client.virtualServerStatus(1)
+    with pytest.raises(solusvm.CircuitOpenError):
+        client.virtualServerStatus(1)
+    assert _actions(transport, 'vserver-status') == 4
+
+def test_breaker_trial_settles_on_non_requests_failure():
+    breaker = solusvm.CircuitBreaker(window=1, min_calls=1, reset_timeout=0.05)
+    client, transport = _client({'vserver-status': ValueError('bad json')}, breaker=breaker, retries=0)
+    with pytest.raises(ValueError):
+        client.virtualServerStatus(1)
+    time.sleep(0.06)
+    with pytest.raises(ValueError):
+        client.virtualServerStatus(1)
+
+    transport.responses['vserver-status'] = {'status': 'success', 'statusmsg': 'online'}
+    time.sleep(0.06)
+    assert client.virtualServerStatus(1)['statusmsg'] == 'online'
+
+def test_scheduler_dispatches_higher_priority_first():
+    scheduler = solusvm.RequestScheduler(rate=10, burst=1)
+    scheduler.acquire('listplans')
+    order = []
+    def send(action):
+        scheduler.acquire(action)
+        order.append(action)
+
+    threads = [threading.Thread(target=send, args=(action,)) for action in ('node-statistics', 'client-list', 'listplans')]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.01)
+    interactive = threading.Thread(target=send, args=('vserver-status',))
+    interactive.start()
+    for thread in threads + [interactive]:
+        thread.join()
+
+    assert order == ['vserver-status', 'listplans', 'node-statistics', 'client-list']
+    stats = scheduler.stats()
+    assert stats['dispatched'] == {solusvm.PRIORITY_INTERACTIVE: 1, solusvm.PRIORITY_NORMAL: 2, solusvm.PRIORITY_BACKGROUND: 2}
+    assert sum(stats['queued'].values()) == 0
+
+def test_scheduler_paces_requests_to_rate():
+    client, transport = _client({'vserver-status': {'status': 'success', 'statusmsg': 'online'}},
+                                scheduler=solusvm.RequestScheduler(rate=1000, action_limits={'vserver-status': (20, 1)}))
+    started = time.monotonic()
+    for _ in range(5):
+        client.virtualServerStatus(1)
+    # one request of burst, then four waiting 1/20s each
+    assert time.monotonic() - started >= 0.19
+
+def _master(base_url, fleet):
+    """Builds a stub master hosting virtual servers of several virtualization types.
+
+    Parameters
+        base_url: base_url of the master
+        fleet: dictionary of vtype to dictionary of nodeid to vserverids
+    Returns
+        tuple of SolusVM, StubTransport
+    """
+    nodetypes = dict((nodeid, vtype) for vtype, nodes in fleet.items() for nodeid in nodes)
+    transport = solusvm.StubTransport({
+        'node-idlist': lambda params: {'status': 'success', 'nodes': ','.join(fleet.get(params['type'], {}))},
+        'node-virtualservers': lambda params: {'status': 'success', 'virtualservers': [
+            {'vserverid': vserverid} for vserverid in fleet[nodetypes[params['nodeid']]][params['nodeid']]
+        ]},
+        'vserver-status': lambda params: {'status': 'success', 'statusmsg': 'online', 'master': base_url}
+    })
+    return solusvm.SolusVM(base_url, 'ID', 'KEY', transport=transport, breaker=solusvm.CircuitBreaker()), transport
+
+def test_cluster_routes_every_virtualization_type():
+    first, _ = _master('master1.example.com', {'kvm': {'1': ['10']}, 'openvz': {'2': ['20']}})
+    second, _ = _master('master2.example.com', {'xen': {'3': ['30']}})
+    with solusvm.SolusVMCluster([first, second]) as cluster:
+        assert cluster.refreshIndex() == {}
+        assert cluster.virtualServerStatus(10)['master'] == 'master1.example.com'
+        assert cluster.virtualServerStatus(20)['master'] == 'master1.example.com'
+        assert cluster.virtualServerStatus(30)['master'] == 'master2.example.com'
+        assert cluster.master(nodeid=3) is second
+
+def test_cluster_refreshes_on_miss_and_lists_nodes_once_per_type():
+    first, transport = _master('master1.example.com', {'openvz': {'1': ['7']}})
+    with solusvm.SolusVMCluster([first], vtypes=['openvz', 'kvm']) as cluster:
+        assert cluster.master(vserverid=7) is first
+    assert _actions(transport, 'node-idlist') == 2
+
+def test_cluster_fans_out_list_calls():
+    first, _ = _master('master1.example.com', {'kvm': {'1': ['10']}})
+    second, _ = _master('master2.example.com', {'kvm': {'2': ['20']}})
+    with solusvm.SolusVMCluster([first, second]) as cluster:
+        fleet = cluster.listAllVirtualServers('kvm')
+    assert [(vserver['vserverid'], vserver['master']) for vserver in fleet['virtualservers']] == [
+        ('10', 'master1.example.com'), ('20', 'master2.example.com')
+    ]
+
+def test_cluster_reports_errors_per_type():
+    first, transport = _master('master1.example.com', {'kvm': {'1': ['10']}})
+    transport.responses['node-idlist'] = lambda params: (
+        {'status': 'success', 'nodes': '1'} if params['type'] == 'kvm' else {'status': 'error', 'statusmsg': 'Invalid type'}
+    )
+    with solusvm.SolusVMCluster([first], vtypes=['kvm', 'xen']) as cluster:
+        assert cluster.refreshIndex() == {'xen': {'master1.example.com': 'Invalid type'}}
+        assert cluster.master(vserverid=10) is first
+
+def test_cluster_rejects_ambiguous_ids():
+    first, _ = _master('master1.example.com', {'kvm': {'1': ['10', '11']}})
+    second, _ = _master('master2.example.com', {'kvm': {'2': ['11', '12']}})
+    with solusvm.SolusVMCluster([first, second], vtypes=['kvm']) as cluster:
+        assert cluster.master(vserverid=12) is second
+        with pytest.raises(solusvm.SolusVMError):
+            cluster.virtualServerStatus(11)
+
+def test_cluster_concurrent_misses_refresh_once():
+    first, transport = _master('master1.example.com', {'kvm': {'1': ['10']}})
+    second, _ = _master('master2.example.com', {'kvm': {'2': ['12']}})
+    with solusvm.SolusVMCluster([first, second], vtypes=['kvm']) as cluster:
+        threads = [threading.Thread(target=cluster.master, kwargs={'vserverid': 12}) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert _actions(transport, 'node-idlist') == 1
+
+def test_array_stream_decodes_records_split_across_chunks():
+    records = [{'vserverid': str(i), 'hostname': 'v\u00e9%d.example.com' % i, 'memory': 1024 * i} for i in range(20)]
+    body = json.dumps({'status': 'success', 'virtualservers': records, 'after': [1, 2]}, ensure_ascii=False).encode('utf-8')
+    for size in (1, 3, 7, 64):
+        stream = solusvm.JSONArrayStream('virtualservers')
+        decoded = []
+        for offset in range(0, len(body), size):
+            decoded.extend(stream.feed(body[offset:offset+size]))
+        stream.close()
+        assert decoded == records
+
+def test_array_stream_waits_for_numbers_cut_by_a_chunk():
+    stream = solusvm.JSONArrayStream('ids')
+    assert stream.feed(b'{"ids": [12') == []
+    assert stream.feed(b'34, 5') == [1234]
+    assert stream.feed(b']}') == [5]
+    stream.close()
+
+def test_array_stream_raises_error_status_and_truncation():
+    stream = solusvm.JSONArrayStream('virtualservers')
+    stream.feed(b'{"status": "error", "statusmsg": "Node not found"}')
+    with pytest.raises(solusvm.SolusVMError):
+        stream.close()
+
+    stream = solusvm.JSONArrayStream('virtualservers')
+    stream.feed(b'{"virtualservers": [{"vserverid": "1"}, ')
+    with pytest.raises(solusvm.SolusVMError):
+        stream.close()
+
+def test_iterVirtualServers_streams_from_mock():
+    with MockSolusVM(nodes=2, vservers=30) as mock:
+        with _mockClient(mock) as client:
+            streamed = [vserver['vserverid'] for vserver in client.iterVirtualServers(2)]
+            listed = [vserver['vserverid'] for vserver in client.listVirtualServers(2)['virtualservers']]
+    assert streamed == listed and len(streamed) == 30
+
+def test_model_converts_numeric_fields_lazily():
+    vserver = solusvm.VirtualServer({'vserverid': '101', 'ctid-xid': 'kvm101', 'memory': '1024', 'custom': 'x'})
+    assert vserver._memory == '1024'
+    assert vserver.memory == 1024
+    assert vserver._memory == 1024
+    assert vserver.ctid_xid == 'kvm101'
+    assert vserver.hostname is None
+    assert vserver['ctid-xid'] == 'kvm101'
+    assert vserver.get('custom') == 'x' and 'custom' in vserver
+    assert vserver.asDict()['vserverid'] == 101
+    with pytest.raises(AttributeError):
+        vserver.unknown = 1
+
+def test_models_are_opt_in():
+    responses = {'node-virtualservers': {'status': 'success', 'virtualservers': [{'vserverid': '101', 'memory': '2048'}]}}
+    client, transport = _client(responses)
+    assert client.listVirtualServers(1)['virtualservers'][0]['memory'] == '2048'
+
+    client, transport = _client(responses, models=True)
+    vserver = client.listVirtualServers(1)['virtualservers'][0]
+    assert isinstance(vserver, solusvm.VirtualServer)
+    assert vserver.memory == 2048
+
+def test_inventory_syncs_incrementally_from_mock():
+    with MockSolusVM(nodes=2, vservers=3, clients=5) as mock:
+        with _mockClient(mock) as client:
+            inventory = solusvm.Inventory(client)
+            assert inventory.sync() == {'added': 17, 'changed': 0, 'removed': 0, 'errors': {}}
+            assert inventory.sync() == {'added': 0, 'changed': 0, 'removed': 0, 'errors': {}}
+
+            mock.vservers['100']['hostname'] = 'renamed.example.com'
+            del mock.vservers['101']
+            assert inventory.sync(clients=False) == {'added': 0, 'changed': 1, 'removed': 2, 'errors': {}}
+
+            assert inventory.nodeOf(103) == '2'
+            assert inventory.virtualServer(100)['hostname'] == 'renamed.example.com'
+            assert inventory.virtualServer(101) is None
+            assert sorted(vserver['vserverid'] for vserver in inventory.virtualServersOnNode(1)) == ['100', '102']
+            assert inventory.ownerOfIP(mock.vservers['102']['ipaddress']) == {'vserverid': '102', 'clientid': mock.vservers['102']['clientid']}
+            clientid = mock.vservers['103']['clientid']
+            assert '103' in [vserver['vserverid'] for vserver in inventory.serversOfClient(clientid)]
+            assert inventory.findClient(username='client1')['id'] == '1'
+            inventory.close()
+
+def test_inventory_keeps_rows_when_node_listing_fails():
+    client, transport = _client({
+        'node-idlist': {'status': 'success', 'nodes': '1'},
+        'node-virtualservers': {'status': 'success', 'virtualservers': [{'vserverid': '10', 'ipaddress': '10.0.0.10'}]},
+        'node-iplist': {'status': 'success', 'ips': ''}
+    })
+    inventory = solusvm.Inventory(client)
+    inventory.sync(clients=False)
+    assert inventory.nodeOf(10) == '1'
+
+    transport.responses['node-idlist'] = NODE_LIST_ERROR
+    outcome = inventory.sync(clients=False)
+    assert outcome['errors'] == {'nodes': 'Invalid ipaddress'}
+    assert outcome['removed'] == 0
+    assert inventory.nodeOf(10) == '1'
+    inventory.close()
+
+def test_watcher_emits_typed_events_from_mock():
+    with MockSolusVM(nodes=1, vservers=2) as mock:
+        with _mockClient(mock) as client:
+            watcher = solusvm.Watcher(client, ['100', '101'], min_interval=0, max_interval=0)
+            seen = []
+            watcher.on(solusvm.StatusChanged, seen.append)
+            assert watcher.poll() == []
+
+            mock.vservers['100']['state'] = 'offline'
+            mock.vservers['101']['suspended'] = '1'
+            mock.vservers['101']['plan'] = 'large' if mock.vservers['101']['plan'] != 'large' else 'small'
+            old = mock.vservers['100']['ipaddress']
+            mock.vservers['100']['ipaddress'] = '192.0.2.1'
+            events = watcher.poll()
+
+    kinds = sorted((event.__class__.__name__, event.vserverid) for event in events)
+    assert kinds == [('IPAdded', '100'), ('IPRemoved', '100'), ('PlanChanged', '101'), ('StatusChanged', '100'), ('Suspended', '101')]
+    assert [(event.old, event.new) for event in seen] == [('online', 'offline')]
+    removed = [event for event in events if isinstance(event, solusvm.IPRemoved)][0]
+    assert (removed.old, removed.new) == (old, None)
+
+def test_watcher_backs_off_while_unchanged():
+    client, transport = _client({'vserver-infoall': {'status': 'success', 'state': 'online', 'suspended': '0', 'plan': 'small'}})
+    watcher = solusvm.Watcher(client, ['1'], min_interval=1, max_interval=4)
+    watcher.poll()
+    assert watcher.intervals['1'] == 1
+    # make it due again without waiting
+    for _ in range(3):
+        with watcher.lock:
+            watcher.scheduled['1'] = 0
+            watcher.due = [(0, '1')]
+        watcher.poll()
+    assert watcher.intervals['1'] == 4
+    assert 3 < watcher.delay() <= 4
+
+STATISTICS = {'status': 'success', 'freememory': 4096, 'totalmemory': 8192, 'freedisk': 100, 'totaldisk': 200, 'freeips': 5, 'virtualservers': 1}
+
+def _fleet(**responses):
+    """Builds a stub client of a two node fleet with uniform statistics.
+
+    Parameters
+        responses: actions answered differently
+    Returns
+        tuple of SolusVM, StubTransport
+    """
+    return _client(dict({
+        'node-idlist': {'status': 'success', 'nodes': '1,2'},
+        'listplans': {'status': 'success', 'plans': 'small'},
+        'listnodegroups': {'status': 'success', 'nodegroups': '1|Default'},
+        'node-statistics': STATISTICS,
+        'node-virtualservers': {'status': 'success', 'virtualservers': []}
+    }, **responses))
+
+def test_placement_picks_most_free_memory_and_reserves():
+    with MockSolusVM(nodes=3, vservers=0) as mock:
+        mock.nodes['2']['totalmemory'] = str(1024 * 1024)
+        with _mockClient(mock) as client:
+            placement = solusvm.Placement(client, {'small': {'freememory': 1024, 'freeips': 0}, 'large': {'freememory': 10 ** 9}},
+                                          nodegroups={'1': ['1', '3'], '2': ['2']})
+            assert placement.bestNode('large') is None
+            assert placement.bestNode('small') == '2'
+            assert placement.bestNode('small', nodegroup='Default') in ('1', '3')
+
+            placement = solusvm.Placement(client, {'large': {'freememory': 600 * 1024}})
+            assert placement.bestNode('large', reserve=True) == '2'
+            assert placement.bestNode('large') is None
+
+def test_placement_rejects_unknown_plans():
+    client, transport = _fleet()
+    with pytest.raises(solusvm.SolusVMError):
+        solusvm.Placement(client, {'missing': {'freememory': 1}}).refresh()
+
+@pytest.mark.parametrize('action', ['node-idlist', 'listplans', 'listnodegroups'])
+def test_placement_raises_on_failed_listing(action):
+    client, transport = _fleet(**{action: NODE_LIST_ERROR})
+    placement = solusvm.Placement(client, {'small': {'freememory': 1024}})
+    with pytest.raises(solusvm.SolusVMError, match='Invalid ipaddress'):
+        placement.bestNode('small')
+
+def test_placement_requires_node_group_membership():
+    client, transport = _fleet()
+    placement = solusvm.Placement(client, {'small': {'freememory': 1024}})
+    assert placement.bestNode('small') is not None
+    with pytest.raises(solusvm.SolusVMError):
+        placement.bestNode('small', nodegroup='Default')
+
+    placement = solusvm.Placement(client, {'small': {'freememory': 1024}}, nodegroups={'1': [2]})
+    assert placement.bestNode('small', nodegroup='Default') == '2'
+
+class _Tracer:
+    def __init__(self):
+        self.spans = []
+
+    def start_as_current_span(self, name, attributes=None):
+        self.spans.append((name, attributes))
+        return solusvm.contextlib.nullcontext()
+
+def test_metrics_export_latency_histograms_and_counters():
+    tracer = _Tracer()
+    metrics = solusvm.Metrics(buckets=(0.1, 1), tracer=tracer)
+    client, transport = _client({'listplans': {'status': 'success', 'plans': 'small'},
+                                 'vserver-status': {'status': 'error', 'statusmsg': 'Invalid vserverid'}},
+                                metrics=metrics, cache=solusvm.MemoryCache())
+    client.listPlans('kvm')
+    client.listPlans('kvm')
+    client.virtualServerStatus(100)
+
+    assert metrics.cacheHitRatio() == 0.5
+    assert metrics.cacheHitRatio('vserver-status') is None
+    assert ('solusvm vserver-status', {'solusvm.action': 'vserver-status'}) in tracer.spans
+    lines = metrics.exportPrometheus().splitlines()
+    assert 'solusvm_request_duration_seconds_bucket{action="listplans",le="0.1"} 1' in lines
+    assert 'solusvm_request_duration_seconds_bucket{action="listplans",le="+Inf"} 1' in lines
+    assert 'solusvm_request_duration_seconds_count{action="vserver-status"} 1' in lines
+    assert 'solusvm_request_errors_total{action="vserver-status"} 1' in lines
+    assert 'solusvm_cache_hits_total{action="listplans"} 1' in lines
+    assert 'solusvm_cache_misses_total{action="listplans"} 1' in lines
+    assert '# TYPE solusvm_response_bytes_total counter' in lines
+
+def test_metrics_count_compressed_bytes_on_the_wire():
+    metrics = solusvm.Metrics()
+    with MockSolusVM(nodes=1, vservers=200, compress=True) as mock:
+        with _mockClient(mock, metrics=metrics) as client:
+            decoded = len(json.dumps(client.listVirtualServers(1)))
+            assert 0 < metrics.bytes['node-virtualservers'] < decoded / 2
+            list(client.iterVirtualServers(1))
+            assert metrics.bytes['node-virtualservers'] < decoded
+
+def test_mock_creates_and_terminates_virtual_servers():
+    with MockSolusVM(nodes=2, vservers=1) as mock:
+        with _mockClient(mock) as client:
+            created = client.createVirtualServer({'nodeid': '2', 'plan': 'large', 'hostname': 'new.example.com'})
+            assert created['status'] == 'success'
+            info = client.virtualServerInfo(created['vserverid'])
+            assert (info['hostname'], info['node'], info['memory']) == ('new.example.com', '2', '4096')
+            assert client.terminateVirtualServer(created['vserverid'])['status'] == 'success'
+            assert client.virtualServerInfo(created['vserverid'])['status'] == 'error'
+
+def test_mock_injects_server_errors_and_rejects_bad_keys():
+    with MockSolusVM(nodes=1, vservers=1, error_rate=1.0) as mock:
+        with _mockClient(mock, retries=0) as client:
+            with pytest.raises(requests.HTTPError):
+                client.virtualServerStatus(100)
+        assert mock.requests == 1
+
+    with MockSolusVM(nodes=1, vservers=1) as mock:
+        with solusvm.SolusVM(mock.host, 'ID', 'WRONG', scheme='http', port=mock.port, breaker=solusvm.CircuitBreaker()) as client:
+            assert client.virtualServerStatus(100) == {'status': 'error', 'statusmsg': 'Invalid id or key'}
+
+def test_mock_compresses_large_responses():
+    with MockSolusVM(nodes=1, vservers=50, compress=True) as mock:
+        response = requests.get('http://%s:%d/api/admin/command.php' % (mock.host, mock.port),
+                                params={'id': mock.api_id, 'key': mock.api_key, 'action': 'node-virtualservers', 'nodeid': '1'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert len(response.json()['virtualservers']) == 50
+
+def test_recording_replays_responses_and_failures(tmp_path):
+    path = str(tmp_path / 'traffic.jsonl')
+    responses = {'vserver-status': {'status': 'success', 'statusmsg': 'online'},
+                 'vserver-info': requests.exceptions.ChunkedEncodingError('connection broken'),
+                 'node-idlist': requests.Timeout('read timed out')}
+    client, transport = _client(responses, retries=0)
+    client.transport = solusvm.RecordingTransport(transport, path)
+    assert client.virtualServerStatus(100)['statusmsg'] == 'online'
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.virtualServerInfo(100)
+    with pytest.raises(requests.Timeout):
+        client.listNodesById()
+    client.transport.close()
+
+    records = solusvm.readRecording(path)
+    assert [record.get('e') for record in records] == [None, 'ChunkedEncodingError', 'timeout']
+    assert all('id' not in record['p'] and 'key' not in record['p'] for record in records)
+
+    replay = solusvm.SolusVM('stub.example.com', 'ID', 'KEY', transport=solusvm.ReplayTransport(path, speed=0),
+                             breaker=solusvm.CircuitBreaker(), retries=0)
+    assert replay.virtualServerStatus(100) == {'status': 'success', 'statusmsg': 'online'}
+    with pytest.raises(requests.ConnectionError):
+        replay.virtualServerInfo(100)
+    with pytest.raises(requests.Timeout):
+        replay.listNodesById()
+    assert solusvm.replayTraffic(replay, path, speed=0)['errors'][0][0] == {'action': 'vserver-info', 'vserverid': '100'}
+
+def test_readRecording_skips_a_torn_last_line(tmp_path):
+    path = tmp_path / 'traffic.jsonl'
+    path.write_text('{"t":0,"d":0,"p":{"action":"listplans"},"s":200,"b":"{}"}\n{"t":0.1,"d":0,"p":{"act')
+    assert [record['p'] for record in solusvm.readRecording(str(path))] == [{'action': 'listplans'}]
+
+    path.write_text('{"t":0,"d":0,"p":{"act\n{"t":0.1,"d":0,"p":{"action":"listplans"},"s":200,"b":"{}"}\n')
+    with pytest.raises(ValueError):
+        solusvm.readRecording(str(path))
+
+def test_stub_transport_answers_canned_responses_and_records_calls():
+    client, transport = _client({'vserver-info': lambda params: {'status': 'success', 'vserverid': params['vserverid']}})
+    assert client.virtualServerInfo(7) == {'status': 'success', 'vserverid': '7'}
+    assert client.virtualServerStatus(7) == {'status': 'error', 'statusmsg': 'Invalid action'}
+    assert transport.calls == [{'action': 'vserver-info', 'vserverid': '7'}, {'action': 'vserver-status', 'vserverid': '7'}]
+
+class _UnixHandler(mockserver._Handler):
+    disable_nagle_algorithm = False
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+def test_unix_socket_transport_keeps_connections_alive(tmp_path):
+    path = str(tmp_path / 'solusvm.sock')
+    mock = MockSolusVM(nodes=1, vservers=200, compress=True)
+    server = _UnixServer(path, _UnixHandler)
+    server.mock = mock
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        metrics = solusvm.Metrics()
+        transport = solusvm.UnixSocketTransport(path, pool_maxsize=2)
+        with solusvm.SolusVM('master.example.com', 'ID', 'KEY', transport=transport, metrics=metrics, breaker=solusvm.CircuitBreaker()) as client:
+            for _ in range(3):
+                assert client.virtualServerStatus(100)['statusmsg'] == 'online'
+            assert len(transport.idle) == 1
+            decoded = len(json.dumps(client.listVirtualServers(1)))
+            assert metrics.bytes['node-virtualservers'] < decoded / 2
+        assert transport.idle == []
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_http2_transport_sends_queries_to_mock():
+    pytest.importorskip('h2')
+    if solusvm.httpx is None:
+        pytest.skip('requires httpx')
+    with MockSolusVM(nodes=1, vservers=2) as mock:
+        with _mockClient(mock, transport=solusvm.HTTP2Transport()) as client:
+            assert client.virtualServerStatus(101)['statusmsg'] == 'online'
+
+@pytest.mark.skipif(solusvm.aiohttp is None, reason='requires aiohttp')
+def test_async_transport_failures_are_retried_and_recorded():
+    transport = solusvm.StubTransport({'vserver-status': requests.ConnectionError('refused')})
+    breaker = solusvm.CircuitBreaker(min_calls=100)
+
+    async def status():
+        async with solusvm.AsyncSolusVM('stub.example.com', 'ID', 'KEY', transport=transport, breaker=breaker, retries=2, backoff=0) as client:
+            return await client.virtualServerStatus(1)
+    with pytest.raises(requests.ConnectionError):
+        asyncio.run(status())
+    assert len(transport.calls) == 3
+    assert list(breaker.outcomes) == [False, False, False]
+
+@pytest.mark.parametrize('params', [
+    {'vserverid': 101},
+    {'vserverid': '101', 'hostname': 'web 1.example.com'},
+    {'username': 'jürgen', 'password': 'a&b=c+d/e?f%'},
+    {'email': b'ops@example.com', 'memory': 1.5, 'enabled': True},
+    {'ipaddress': ['192.0.2.1', None, '192.0.2.2'], 'comment': None},
+])
+def test_query_encoding_matches_requests(params):
+    client, transport = _client({})
+    url, query = client._sRequest(dict(params, action='vserver-info'))
+    expected = requests.Request('GET', url, params=[('action', 'vserver-info')] + list(params.items()) +
+                                [('rdtype', 'json'), ('id', 'ID'), ('key', 'KEY')]).prepare().url
+    assert url+'?'+query == expected
+
+def test_decoded_responses_are_not_shared_by_default():
+    client, transport = _client({'vserver-info': {'status': 'success', 'vserverid': '1', 'hostname': 'a'}})
+    first = client.virtualServerInfo(1)
+    first['hostname'] = 'changed'
+    assert client.virtualServerInfo(1)['hostname'] == 'a'
+
+def test_decoded_cache_reuses_unchanged_responses():
+    hostnames = {'1': 'a', '2': 'b'}
+    metrics = solusvm.Metrics()
+    client, transport = _client({'vserver-info': lambda params: {'status': 'success', 'hostname': hostnames[params['vserverid']]}},
+                                decoded_cache=1, metrics=metrics)
+    first = client.virtualServerInfo(1)
+    assert client.virtualServerInfo(1) is first
+    assert metrics.unchanged['vserver-info'] == 1
+
+    hostnames['1'] = 'c'
+    changed = client.virtualServerInfo(1)
+    assert changed['hostname'] == 'c'
+    client.virtualServerInfo(2)
+    assert client.virtualServerInfo(1) is not changed
+    assert metrics.unchanged['vserver-info'] == 1
+
+def test_every_transport_accepts_compressed_responses():
+    assert 'gzip' in solusvm.ACCEPT_ENCODING and 'deflate' in solusvm.ACCEPT_ENCODING
+    for encoding, compress in (('gzip', solusvm.zlib.compressobj(wbits=16 + solusvm.zlib.MAX_WBITS)),
+                               ('deflate', solusvm.zlib.compressobj()),
+                               ('deflate', solusvm.zlib.compressobj(wbits=-solusvm.zlib.MAX_WBITS))):
+        assert solusvm._decompress(compress.compress(b'{"status":"success"}') + compress.flush(), encoding) == b'{"status":"success"}'
+    assert solusvm._decompress(b'{}', None) == b'{}'
+
+@pytest.mark.parametrize('fields, action', [
+    (['statusmsg'], 'vserver-status'),
+    (['hostname', 'template'], 'vserver-info'),
+    (['state', 'plan'], 'vserver-infoall'),
+])
+def test_virtualServerFields_picks_cheapest_action(fields, action):
+    with MockSolusVM(nodes=1, vservers=2) as mock:
+        with _mockClient(mock) as client:
+            result = client.virtualServerFields(101, fields)
+            assert mock.requests == 1
+            if action == 'vserver-status':
+                assert result == client.virtualServerStatus(101)
+            else:
+                full = client._sQuery({'action': action, 'vserverid': 101})
+                assert result == dict([(name, full[name]) for name in fields], status='success', statusmsg='')
+
+def test_virtualServerState_skips_status_and_graphs_not_requested():
+    client, transport = _client({'vserver-infoall': {'status': 'success', 'state': 'online', 'bandwidth': '1,2,3,4', 'loadgraph': 'g'}})
+    assert client.virtualServerState(101, fields=['bandwidth']) == {'status': 'success', 'bandwidth': '1,2,3,4'}
+    client.virtualServerState(101, fields=['state', 'loadgraph'])
+    client.virtualServerState(101)
+    assert [(params['nostatus'], params['nographs']) for params in transport.calls] == [
+        ('True', 'True'), ('False', 'False'), ('False', 'False')
+    ]
+
+def test_pipeline_creates_against_mock_and_fails_rejected_jobs():
+    with MockSolusVM(nodes=2, vservers=1) as mock:
+        with _mockClient(mock) as client:
+            with solusvm.ProvisioningPipeline(client, min_interval=0.01, max_interval=0.01) as pipeline:
+                futures = [pipeline.createVirtualServer({'nodeid': '2', 'hostname': 'new%d.example.com' % i}) for i in range(5)]
+                results = [future.result(5) for future in futures]
+                rejected = pipeline.createVirtualServer({'nodeid': '9'})
+                with pytest.raises(solusvm.ProvisioningError, match='Node not found'):
+                    rejected.result(5)
+            assert sorted(result['vserverid'] for result in results) == ['102', '103', '104', '105', '106']
+            assert all(result['state'] == 'online' for result in results)
+
+def test_pipeline_fails_disabled_servers():
+    client, transport = _client({'vserver-status': {'status': 'success', 'statusmsg': 'disabled'}})
+    with solusvm.ProvisioningPipeline(client, min_interval=0.01, max_interval=0.01) as pipeline:
+        with pytest.raises(solusvm.ProvisioningError, match='disabled'):
+            pipeline.track(5).result(5)
+
+def test_pipeline_rebuild_waits_for_server_to_leave_online():
+    states = iter(['online', 'online', 'rebuilding', 'online'])
+    polls = []
+    def status(params):
+        polls.append(next(states, 'online'))
+        return {'status': 'success', 'statusmsg': polls[-1]}
+    client, transport = _client({'vserver-rebuild': {'status': 'success'}, 'vserver-status': status})
+
+    with solusvm.ProvisioningPipeline(client, min_interval=0.01, max_interval=0.01) as pipeline:
+        assert pipeline.rebuildVirtualServer(5, 'centos-7-x86_64').result(5)['state'] == 'online'
+    assert polls == ['online', 'online', 'rebuilding', 'online']
+
+def test_pipeline_rebuild_resolves_after_settle_without_leaving_online():
+    client, transport = _client({'vserver-change': {'status': 'success'}, 'vserver-status': {'status': 'success', 'statusmsg': 'online'}})
+    with solusvm.ProvisioningPipeline(client, min_interval=0.01, max_interval=0.01, settle=0.1) as pipeline:
+        started = time.monotonic()
+        assert pipeline.changePlan(5, 'large').result(5)['state'] == 'online'
+        assert time.monotonic() - started >= 0.1
+
+def _rebootFleet(states):
+    """Builds a two node client whose guests report the given statuses in turn after a reboot."""
+    polls = {}
+    def status(params):
+        polls.setdefault(params['vserverid'], iter(states))
+        return {'status': 'success', 'statusmsg': next(polls[params['vserverid']], 'online')}
+    return _client({
+        'node-virtualservers': lambda params: {'status': 'success', 'virtualservers': [{'vserverid': params['nodeid']+str(i)} for i in range(3)]},
+        'vserver-reboot': {'status': 'success'},
+        'vserver-status': status
+    })
+
+def test_orchestrator_waits_for_rebooted_guests_to_leave_online():
+    client, transport = _rebootFleet(['online', 'online', 'offline', 'online'])
+    orchestrator = solusvm.MaintenanceOrchestrator(client, 'reboot', [1, 2], window=2, max_nodes=2, poll_interval=0.01)
+    summary = orchestrator.run()
+    assert (summary['done'], summary['failed'], summary['paused']) == (6, {}, None)
+    assert _actions(transport, 'vserver-status') == 24
+
+def test_orchestrator_settles_guests_that_never_report_leaving_online():
+    client, transport = _rebootFleet([])
+    orchestrator = solusvm.MaintenanceOrchestrator(client, 'reboot', [1], window=3, poll_interval=0.01, settle=0.1)
+    started = time.monotonic()
+    assert orchestrator.run()['done'] == 3
+    assert time.monotonic() - started >= 0.1
+
+def test_orchestrator_listing_failure_does_not_stop_other_nodes(tmp_path):
+    def listing(params):
+        if params['nodeid'] == '1':
+            return NODE_LIST_ERROR
+        return {'status': 'success', 'virtualservers': [{'vserverid': params['nodeid']+str(i)} for i in range(3)]}
+    client, transport = _client({
+        'node-virtualservers': listing,
+        'vserver-reboot': {'status': 'success'},
+        'vserver-status': {'status': 'success', 'statusmsg': 'online'}
+    })
+    checkpoint = str(tmp_path / 'reboot.json')
+    orchestrator = solusvm.MaintenanceOrchestrator(client, 'reboot', range(1, 9), max_nodes=8, checkpoint=checkpoint, poll_interval=0.01, settle=0)
+    summary = orchestrator.run()
+
+    assert summary['paused'] is None
+    assert summary['done'] == 21
+    assert summary['failed'] == {'1': {'node': 'Invalid ipaddress'}}
+    with open(checkpoint, encoding='utf-8') as fh:
+        assert len(json.load(fh)['nodes']) == 8
+
+@pytest.fixture(params=['numpy', 'python'])
+def vectorized(request, monkeypatch):
+    if request.param == 'numpy' and solusvm.numpy is None:
+        pytest.skip('requires numpy')
+    if request.param == 'python':
+        monkeypatch.setattr(solusvm, 'numpy', None)
+    return request.param
+
+def test_timeseries_close_writes_partial_buffer(tmp_path, vectorized):
+    series = solusvm.TimeSeries(['value'], capacity=4, path=str(tmp_path))
+    for timestamp in range(6):
+        series.append(timestamp, [('a', {'value': timestamp})])
+    series.close()
+
+    reopened = solusvm.TimeSeries(['value'], capacity=4, path=str(tmp_path))
+    times, _, values = reopened._sSelect('value', None, None, 'a')
+    assert list(times) == [0, 1, 2, 3, 4, 5]
+    assert list(values) == [0, 1, 2, 3, 4, 5]
+    reopened.close()
+
+def test_timeseries_queries_segments_and_buffer_together(tmp_path, vectorized):
+    series = solusvm.TimeSeries(['value'], capacity=4, path=str(tmp_path))
+    for timestamp in range(9):
+        series.append(timestamp, [('a', {'value': timestamp}), ('b', {'value': None if timestamp % 2 else -timestamp})])
+    assert (len(series.segments), series.size) == (4, 2)
+
+    times, values = series.series('a', 'value', start=3, end=9)
+    assert list(times) == [3, 4, 5, 6, 7, 8]
+    assert list(values) == [3, 4, 5, 6, 7, 8]
+    assert series.aggregate('value', 'max') == {'a': 8, 'b': 0}
+    assert series.aggregate('value', 'count', start=5) == {'a': 4, 'b': 2}
+    series.close()
+
+def test_timeseries_without_path_keeps_last_capacity_samples(vectorized):
+    series = solusvm.TimeSeries(['value'], capacity=4)
+    for timestamp in range(6):
+        series.append(timestamp, [('a', {'value': timestamp})])
+    assert list(series.series('a', 'value')[0]) == [2, 3, 4, 5]
+
+def test_collector_reports_listing_failures():
+    def listing(params):
+        if params['nodeid'] == '2':
+            return {'status': 'error', 'statusmsg': 'Node not found'}
+        return {'status': 'success', 'virtualservers': [{'vserverid': '100'}]}
+    client, transport = _fleet(**{'node-virtualservers': listing,
+                                  'vserver-infoall': {'status': 'success', 'bandwidth': '10,4,6,40', 'memory': '8,2,6,25', 'hdd': '20,5,15,25'}})
+    collector = solusvm.TimeSeriesCollector(client)
+    assert collector.collect() == {'nodes': 2, 'vservers': 1, 'errors': {'virtualservers 2': 'Node not found'}}
+    assert _actions(transport, 'node-idlist') == 1
+    assert collector.vservers.aggregate('bandwidth_used', 'last') == {'100': 4}
+
+    client, transport = _fleet(**{'node-idlist': NODE_LIST_ERROR})
+    assert solusvm.TimeSeriesCollector(client).collect() == {'nodes': 0, 'vservers': 0, 'errors': {'nodes': 'Invalid ipaddress'}}
+    assert solusvm.TimeSeriesCollector(client, vserverids=[100]).collect()['errors']['nodes'] == 'Invalid ipaddress'
+
+@pytest.mark.skipif(solusvm.numpy is None, reason='requires numpy')
+def test_analytics_loads_fleet_usage_from_mock():
+    with MockSolusVM(nodes=2, vservers=3) as mock:
+        with _mockClient(mock) as client:
+            analytics = solusvm.FleetAnalytics(client)
+            assert analytics.load(usage=True) == {}
+            largest = max(mock.vservers.values(), key=lambda vserver: (int(vserver['memory']), -int(vserver['vserverid'])))
+
+    assert sorted(analytics.vservers['id'].tolist()) == ['100', '101', '102', '103', '104', '105']
+    assert analytics.groupBy('nodes', 'virtualservers', 'sum') == {'Default': 3.0, 'Premium': 3.0}
+    assert analytics.top('vservers', 'memory_total', 1) == [(largest['vserverid'], int(largest['memory']) * 1048576.0)]
+    assert analytics.above('vservers', {'memory_used_pct': 0.5}) == []
+    assert analytics.percentiles('vservers', 'memory_used_pct', (50,)) == {50: 0.25}
+
+@pytest.mark.skipif(solusvm.numpy is None, reason='requires numpy')
+def test_analytics_requires_node_group_membership():
+    client, transport = _fleet()
+    analytics = solusvm.FleetAnalytics(client)
+    analytics.load()
+    with pytest.raises(solusvm.SolusVMError):
+        analytics.groupBy('nodes', 'freememory', 'sum')
+
+    analytics = solusvm.FleetAnalytics(client, nodegroups={'1': [1, 2]})
+    analytics.load()
+    assert analytics.groupBy('nodes', 'freememory', 'sum') == {'Default': 8192.0}
+
+@pytest.mark.skipif(solusvm.numpy is None, reason='requires numpy')
+@pytest.mark.parametrize('action', ['node-idlist', 'listnodegroups'])
+def test_analytics_raises_on_failed_listing_and_keeps_loaded_fleet(action):
+    client, transport = _fleet()
+    analytics = solusvm.FleetAnalytics(client)
+    analytics.load()
+    transport.responses[action] = NODE_LIST_ERROR
+    with pytest.raises(solusvm.SolusVMError, match='Invalid ipaddress'):
+        analytics.load()
+    assert analytics.nodes['id'].tolist() == ['1', '2']
+
+@pytest.mark.skipif(solusvm.numpy is None, reason='requires numpy')
+def test_analytics_reports_failed_node_listings():
+    def listing(params):
+        if params['nodeid'] == '2':
+            return {'status': 'error', 'statusmsg': 'Node not found'}
+        return {'status': 'success', 'virtualservers': [{'vserverid': '100'}]}
+    client, transport = _fleet(**{'node-virtualservers': listing})
+    analytics = solusvm.FleetAnalytics(client)
+    assert analytics.load() == {'virtualservers 2': 'Node not found'}
+    assert analytics.vservers['id'].tolist() == ['100']